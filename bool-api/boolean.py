@@ -3,6 +3,17 @@ import numpy as np
 import copy
 import math
 
+def bit_not(a: bool) -> bool:
+    '''
+    Returns !a
+
+    Python's `not` cannot be overloaded, hence all circuits must use bit_not to negate a bit. This makes them work
+    with bits other than python bools (for ex, traced bits of `circuit.Wire`)
+    '''
+    if isinstance(a, (bool, np.bool_)):
+        return not a
+    return ~a
+
 def arbitrary_bit_equality(a: [bool], b: [bool]) -> bool:
     '''
     Returns True if a == b, False otherwise. 
@@ -13,17 +24,17 @@ def arbitrary_bit_equality(a: [bool], b: [bool]) -> bool:
     where N is bit width
     '''
     assert len(a) == len(b)
-    out = not (a[0]^b[0])
+    out = bit_not(a[0]^b[0])
     for i in range(1, len(a)):
         # XNOR a[i], b[i]
-        out = out & (not (a[i]^b[i]))
+        out = out & bit_not(a[i]^b[i])
     return out
 
 def arbitrary_signed_bit_comparator(a: [bool], b:[bool]) -> bool:
     a = copy.deepcopy(a)
     b = copy.deepcopy(b)
-    a[-1]  = not a[-1]
-    b[-1]  = not b[-1]
+    a[-1]  = bit_not(a[-1])
+    b[-1]  = bit_not(b[-1])
 
     return arbitrary_unsigned_bit_comparator(a=a, b=b)
 
@@ -62,18 +73,76 @@ def arbitrary_unsigned_bit_comparator(a: [bool], b:[bool]) -> bool:
     assert len(a) == len(b)
 
     # N-1
-    comp_bit = a[N-1] & (not b[N-1]) # N-1
+    comp_bit = a[N-1] & bit_not(b[N-1]) # N-1
 
     # N-2
-    casc_bit = not (a[N-1]^b[N-1])
-    comp_bit = comp_bit | ((a[N-2] & (not b[N-2])) & casc_bit)
+    casc_bit = bit_not(a[N-1]^b[N-1])
+    comp_bit = comp_bit | ((a[N-2] & bit_not(b[N-2])) & casc_bit)
 
     for j in range(N-3, -1, -1):
-        casc_bit = casc_bit & (not (a[j+1]^b[j+1]))
-        comp_bit = comp_bit | ((a[j] & (not b[j])) & casc_bit)
+        casc_bit = casc_bit & bit_not(a[j+1]^b[j+1])
+        comp_bit = comp_bit | ((a[j] & bit_not(b[j])) & casc_bit)
 
     return comp_bit
 
+def arbitrary_unsigned_bit_compare(a: [bool], b: [bool]) -> (bool, bool, bool):
+    '''
+    Assumes A and B are unsigned and returns (A < B, A == B, A > B) using a single comparator.
+
+    Same as `arbitrary_unsigned_bit_comparator` but the cascade bit (i.e. whether bits at higher significant positions
+    are equal) is carried down to bit 0, at which point it equals A == B. Hence,
+        - A > B: comparator output
+        - A == B: cascade bit after bit 0
+        - A < B: !(A > B | A == B)
+    Requires 3 gates more than `arbitrary_unsigned_bit_comparator`, instead of N XNORs and N-1 ANDs for a separate
+    equality and another comparator for A < B.
+    '''
+    N = len(a)
+    assert len(a) == len(b)
+
+    gt = a[N-1] & bit_not(b[N-1])
+    eq = bit_not(a[N-1]^b[N-1])
+    for j in range(N-2, -1, -1):
+        gt = gt | ((a[j] & bit_not(b[j])) & eq)
+        eq = eq & bit_not(a[j]^b[j])
+
+    lt = bit_not(gt | eq)
+    return (lt, eq, gt)
+
+def arbitrary_signed_bit_compare(a: [bool], b: [bool]) -> (bool, bool, bool):
+    '''
+    Signed variant of `arbitrary_unsigned_bit_compare`. Flips MSBs as in `arbitrary_signed_bit_comparator`.
+    '''
+    a = copy.deepcopy(a)
+    b = copy.deepcopy(b)
+    a[-1] = bit_not(a[-1])
+    b[-1] = bit_not(b[-1])
+    return arbitrary_unsigned_bit_compare(a=a, b=b)
+
+def arbitrary_min_max(a: [bool], b: [bool], a_gt_b: bool) -> ([bool], [bool]):
+    '''
+    Returns (min(a, b), max(a, b)) given a_gt_b = a > b.
+
+    Both outputs share a single select:
+        t = a_gt_b & (a ^ b)
+        max = b ^ t
+        min = a ^ t
+    which requires 4N gates instead of 6N for two separate muxes.
+    '''
+    assert len(a) == len(b)
+    t = [a_gt_b & (a[i]^b[i]) for i in range(len(a))]
+    return ([a[i]^t[i] for i in range(len(a))], [b[i]^t[i] for i in range(len(a))])
+
+def arbitrary_clamp(x: [bool], lo: [bool], hi: [bool], comparator) -> [bool]:
+    '''
+    Returns `lo` if x < lo, `hi` if x > hi and `x` otherwise. `comparator(a, b)` must return a > b.
+
+    Both comparisons are against `x` and are independent, hence evaluated in parallel. Assumes lo <= hi.
+    '''
+    x_lt_lo = comparator(lo, x)
+    x_gt_hi = comparator(x, hi)
+    return mux_bool_vec(bit=x_lt_lo, a=lo, b=mux_bool_vec(bit=x_gt_hi, a=hi, b=x))
+
 def half_adder(A: bool, B: bool) -> (bool, bool):
     '''
     Adds two bits A and B and returns sum S and Carry C. 
@@ -121,8 +190,8 @@ def arbitrary_bit_adder(a: [bool], b: [bool], carry_in: bool) -> ([bool], bool,
 
     start = 0
     carry = carry_in
-    if carry_in == False: 
-        # LSB has no carry_in
+    if carry_in is False:
+        # LSB has no carry_in. `is` since carry_in may be a traced bit whose value is unknown
         (out[0], carry) = half_adder(a[0], b[0])
         start=1
 
@@ -152,7 +221,7 @@ def arbitrary_bit_subtractor(a: [bool], b: [bool], borrow_in: bool) -> ([bool],
 
     Note that (2^N-1 - b) = !b 
     '''
-    invert_b = [not i for i in b]
+    invert_b = [bit_not(i) for i in b]
     carry_in = True^borrow_in
     return arbitrary_bit_adder(a=a, b=invert_b, carry_in=carry_in)
 
@@ -206,7 +275,7 @@ def absolute(a:[bool]) -> [bool]:
     assert len(a) == 8
 
     # if a is negative then send it to its 2's complement (ie its +ve counterpart)
-    a_if_neg = [not i for i in a] # 1's complement
+    a_if_neg = [bit_not(i) for i in a] # 1's complement
     carry = True # +1 to send 1s complement to 2s complement
     for i in range(8):
         (a_if_neg[i], carry) = half_adder(A=a_if_neg[i], B=carry)
@@ -219,19 +288,390 @@ def mux_bool_vec(bit: bool, a:[bool], b:[bool]) -> [bool]:
     '''
     Muxer that returns `a` when bit=True, otherwise returns `b`
     '''
-    if bit: 
-        return copy.deepcopy(a)
-    else:
-        return copy.deepcopy(b)
+    assert len(a) == len(b)
+    return [mux_bool(bit=bit, a=a[i], b=b[i]) for i in range(len(a))]
 
 def mux_bool(bit: bool, a:bool, b:bool) -> bool:
     '''
     Muxer that returns `a` when bit=True, otherwise returns `b`
+
+    Evaluated as (bit & a) | (!bit & b) so that the output does not depend on python control flow over `bit`
+    '''
+    return (bit & a) | (bit_not(bit) & b)
+
+def shift_left(a: [bool], k: int) -> [bool]:
+    '''
+    Returns a << k (mod 2^N). Rewires bits, hence requires no gates
+    '''
+    N = len(a)
+    k = min(k, N)
+    return [False for _ in range(k)] + list(a[:N-k])
+
+def shift_right(a: [bool], k: int, fill: bool = False) -> [bool]:
+    '''
+    Returns a >> k where vacated MSBs are set to `fill` (False for logical shift, MSB of `a` for arithmetic shift).
+    Requires no gates
+    '''
+    N = len(a)
+    k = min(k, N)
+    return list(a[k:]) + [fill for _ in range(k)]
+
+def rotate_left(a: [bool], k: int) -> [bool]:
+    N = len(a)
+    k = k % N
+    return list(a[N-k:]) + list(a[:N-k])
+
+def rotate_right(a: [bool], k: int) -> [bool]:
+    return rotate_left(a, len(a) - (k % len(a)))
+
+def barrel_shifter(a: [bool], amount: [bool], shift) -> [bool]:
+    '''
+    Returns `a` shifted by encrypted `amount` (mod N) using `shift(bits, k)` for plaintext k.
+
+    Stage k conditionally shifts by 2^k using bit k of `amount`, hence log2(N) stages of N muxes each. Only the
+    low log2(N) bits of `amount` are used.
+    '''
+    N = len(a)
+    assert N & (N - 1) == 0
+
+    out = list(a)
+    for k in range(N.bit_length() - 1):
+        out = mux_bool_vec(bit=amount[k], a=shift(out, 1 << k), b=out)
+    return out
+
+OVERFLOW_MODES = ('wrap', 'flag', 'saturate', 'wide')
+
+def signed_terms(a: [bool], signed: bool) -> ([(bool, int)], int):
+    '''
+    Returns (terms, constant) s.t. value of `a` = sum(bit * coeff for (bit, coeff) in terms) + constant.
+
+    For signed `a` the MSB has weight -2^{N-1}. Since bit * -c = !bit * c - c, MSB is replaced by its negation with
+    weight 2^{N-1} and constant -2^{N-1}, so that all coefficients are +ve. Negation is free.
+    '''
+    N = len(a)
+    terms = [(a[i], 1 << i) for i in range(N)]
+    if not signed:
+        return (terms, 0)
+    terms[N-1] = (bit_not(a[N-1]), 1 << (N-1))
+    return (terms, -(1 << (N-1)))
+
+def carry_save_reduce(terms: [(bool, int)], constant: int, width: int) -> ([bool], [bool]):
+    '''
+    Returns (a, b) s.t. a + b = sum(bit * coeff for (bit, coeff) in terms) + constant (mod 2^width). See
+    `arbitrary_weighted_sum`.
+    '''
+    columns = [[] for _ in range(width)]
+    for (bit, coeff) in terms:
+        if coeff < 0:
+            (bit, coeff, constant) = (bit_not(bit), -coeff, constant + coeff)
+        if bit is False:
+            continue
+        if bit is True:
+            constant += coeff
+            continue
+        for i in range(width):
+            if (coeff >> i) & 1:
+                columns[i].append(bit)
+
+    for i in range(width):
+        if (constant >> i) & 1:
+            columns[i].append(True)
+
+    while max(len(c) for c in columns) > 2:
+        # columns are reduced as much as possible. Once at-most 3 bits remain, a column is only reduced as much as
+        # required to end with 2 bits including the carry it receives from column i-1, else a single column of 3
+        # bits would move up by one column per stage.
+        target = 2 if max(len(c) for c in columns) == 3 else 0
+        reduced = [[] for _ in range(width)]
+        for i in range(width):
+            c = columns[i]
+            j = 0
+            while len(c) - j >= 3 or (target and len(c) - j == 2 and len(reduced[i]) + 2 > target):
+                if len(c) - j >= 3:
+                    (s, carry) = full_adder(A=c[j], B=c[j+1], carry_in=c[j+2])
+                    j += 3
+                else:
+                    (s, carry) = half_adder(A=c[j], B=c[j+1])
+                    j += 2
+                reduced[i].append(s)
+                if i + 1 < width:
+                    reduced[i+1].append(carry)
+            reduced[i] += c[j:]
+        columns = reduced
+
+    a = [c[0] if len(c) > 0 else False for c in columns]
+    b = [c[1] if len(c) > 1 else False for c in columns]
+    return (a, b)
+
+def arbitrary_weighted_sum(terms: [(bool, int)], constant: int, width: int) -> [bool]:
+    '''
+    Returns sum(bit * coeff for (bit, coeff) in terms) + constant (mod 2^width), where coefficients are plaintext ints.
+
+    Each term is split into the set bits of its coefficient and placed in the column of that weight (-ve coefficients
+    are made +ve as in `signed_terms`). Constant bits are summed in plaintext into a single row. Columns are then
+    reduced with a carry-save (Wallace) tree of full adders: each full adder takes 3 bits of column i and outputs 1 bit
+    to column i and 1 bit to column i+1, without propagating carries. Every stage reduces all columns with 3 or more
+    bits. In the last stage (at-most 3 bits per column) a column of 2 bits that receives a carry is reduced with a half
+    adder, hence all columns end with at-most 2 bits at once. Carries are then resolved once with
+    `arbitrary_bit_adder`.
+
+    Reduction takes O(log(no. of terms)) full adder levels instead of one ripple carry adder per term.
+    '''
+    assert width > 2
+    (a, b) = carry_save_reduce(terms, constant, width)
+    (out, _, _) = arbitrary_bit_adder(a=a, b=b, carry_in=False)
+    return out
+
+def any_bit(bits: [bool]) -> bool:
+    '''
+    Returns OR of all `bits` with a balanced tree of ORs
+    '''
+    bits = list(bits)
+    if len(bits) == 0:
+        return False
+    while len(bits) > 1:
+        bits = [bits[i] | bits[i+1] for i in range(0, len(bits)-1, 2)] + ([bits[-1]] if len(bits) % 2 else [])
+    return bits[0]
+
+def narrow(wide: [bool], N: int, signed: bool, overflow: str):
+    '''
+    Narrows result `wide` of an accumulation to N bits as per `overflow`:
+        - wrap: returns N LSBs, i.e. result mod 2^N
+        - flag: returns (N LSBs, overflow flag) where the flag is set when result does not fit in N bits
+        - saturate: returns result clamped to range of N bit integers
+        - wide: returns `wide` as it is
+    '''
+    assert overflow in OVERFLOW_MODES
+    if overflow == 'wide':
+        return wide
+    low = wide[:N]
+    if overflow == 'wrap':
+        return low
+
+    if signed:
+        # fits iff all bits from N-1 onwards equal the sign bit
+        overflown = any_bit([wide[k] ^ wide[N-1] for k in range(N, len(wide))])
+    else:
+        overflown = any_bit(wide[N:])
+    if overflow == 'flag':
+        return (low, overflown)
+
+    if signed:
+        # -ve result saturates to -2^{N-1} (1 0 ... 0), +ve result to 2^{N-1}-1 (0 1 ... 1)
+        negative = wide[-1]
+        limit = [bit_not(negative) for _ in range(N-1)] + [negative]
+    else:
+        limit = [True for _ in range(N)]
+    return mux_bool_vec(bit=overflown, a=limit, b=low)
+
+def accumulator_width(N: int, n: int) -> int:
+    '''
+    Returns width that fits sum of `n` N bit values (signed or unsigned) without overflow
     '''
-    if bit: 
-        return a
+    return N + max(0, (n-1).bit_length())
+
+def arbitrary_sum(values: [[bool]], signed: bool, overflow: str):
+    '''
+    Returns sum of `values` narrowed as per `overflow` (see `narrow`). The sum is accumulated at the width that fits it
+    (except with overflow=wrap where bits above N are never required).
+    '''
+    N = len(values[0]) if len(values) else 8
+    width = N if overflow == 'wrap' else accumulator_width(N, len(values))
+    width = max(width, 3)
+
+    terms = []
+    constant = 0
+    for v in values:
+        assert len(v) == N
+        (t, c) = signed_terms(v, signed)
+        terms += t
+        constant += c
+    return narrow(arbitrary_weighted_sum(terms, constant, width), N, signed, overflow)
+
+def arbitrary_dot(xs: [[bool]], ws: list, signed: bool, overflow: str):
+    '''
+    Returns sum(x * w for (x, w) in zip(xs, ws)) narrowed as per `overflow` (see `narrow`). Each w is either encrypted
+    (list of bits) or a plaintext int.
+
+    Products are never resolved on their own. With plaintext w, the terms of x are scaled by w. With encrypted w,
+    partial products x[i] & w[j] are terms with weight 2^{i+j} (-ve if exactly one of i, j is the MSB of a signed
+    operand). All terms of all products are reduced by a single carry-save tree.
+    '''
+    assert len(xs) == len(ws)
+    N = len(xs[0]) if len(xs) else 8
+    width = N if overflow == 'wrap' else accumulator_width(2*N, len(xs))
+    width = max(width, 3)
+
+    terms = []
+    constant = 0
+    for (x, w) in zip(xs, ws):
+        assert len(x) == N
+        (x_terms, x_constant) = signed_terms(x, signed)
+        if isinstance(w, int):
+            terms += [(bit, coeff * w) for (bit, coeff) in x_terms]
+            constant += x_constant * w
+            continue
+
+        assert len(w) == N
+        for i in range(N):
+            for j in range(N):
+                coeff = 1 << (i+j)
+                if signed and ((i == N-1) ^ (j == N-1)):
+                    coeff = -coeff
+                terms.append((x[i] & w[j], coeff))
+    return narrow(arbitrary_weighted_sum(terms, constant, width), N, signed, overflow)
+
+def popcount(bits: [bool]) -> [bool]:
+    '''
+    Returns no. of set bits in `bits` with bit_length(len(bits)) bits, i.e. the minimum width that fits the count.
+
+    All bits have weight 1, hence they are reduced in a single column with a tree of full adders (each turns 3 bits of
+    weight 2^i into 1 bit of weight 2^i and 1 bit of weight 2^{i+1}) by `arbitrary_weighted_sum`. Requires about
+    len(bits) full adders and O(log(len(bits))) depth.
+    '''
+    width = len(bits).bit_length()
+    # arbitrary_weighted_sum requires at-least 3 bits. Extra bits are constant zeros and require no gates.
+    return arbitrary_weighted_sum([(b, 1) for b in bits], 0, max(width, 3))[:width]
+
+def hamming_distance(a: [bool], b: [bool]) -> [bool]:
+    '''
+    Returns no. of positions at which `a` and `b` differ (see `popcount` for width of the output)
+    '''
+    assert len(a) == len(b)
+    return popcount([a[i] ^ b[i] for i in range(len(a))])
+
+# Synthesized lookup tables: tuple(table) -> LutPlan
+LUT_PLANS = {}
+
+class LutPlan:
+    '''
+    Boolean circuit of a lookup table synthesized by `synthesize_lut`.
+
+    - `ops`: list of (kind, a, b, c) in topological order over node ids. Nodes 0 and 1 are constants False and True,
+      nodes 2..2+n_in-1 are input bits and op k outputs node 2+n_in+k. `kind` is one of 'not' (!a), 'and' (a & b),
+      'or' (a | b), 'xor' (a ^ b), 'mux' (b if a else c)
+    - `outputs`: node id of each output bit
+    - `cost`: no. of bootstraps, i.e. 3 per mux, 1 per and/or/xor and none for not
+    '''
+    def __init__(self, n_in: int, ops: list, outputs: [int], order: [int]):
+        self.n_in = n_in
+        self.ops = ops
+        self.outputs = outputs
+        self.order = order
+        self.cost = sum({'not': 0, 'and': 1, 'or': 1, 'xor': 1, 'mux': 3}[op[0]] for op in ops)
+
+    def evaluate(self, bits: [bool]) -> [bool]:
+        assert len(bits) == self.n_in
+        values = [False, True] + list(bits)
+        for (kind, a, b, c) in self.ops:
+            match kind:
+                case 'not':
+                    values.append(bit_not(values[a]))
+                case 'and':
+                    values.append(values[a] & values[b])
+                case 'or':
+                    values.append(values[a] | values[b])
+                case 'xor':
+                    values.append(values[a] ^ values[b])
+                case 'mux':
+                    values.append(mux_bool(bit=values[a], a=values[b], b=values[c]))
+        return [values[o] for o in self.outputs]
+
+def lut_table(f, signed: bool, N=8) -> [int]:
+    '''
+    Returns 2^N entry table of `f` indexed by bit pattern of the input. `f` is either a list of 2^N outputs (indexed by
+    input value) or a python function. Inputs are interpreted (and outputs reduced) as signed N bit integers if `signed`.
+    '''
+    inputs = [i - (1 << N) if signed and i >> (N-1) else i for i in range(1 << N)]
+    if callable(f):
+        outputs = [f(v) for v in inputs]
     else:
-        return b
+        assert len(f) == (1 << N)
+        outputs = [f[v] for v in inputs]
+    return [v % (1 << N) for v in outputs]
+
+def synthesize_lut(table: [int], order: [int], n_in=8, n_out=8) -> LutPlan:
+    '''
+    Returns circuit of `table` (2^n_in entries of n_out bits) as a shared binary decision diagram with input variables
+    tested in `order`.
+
+    Each output bit is a boolean function given by its truth table. A function is recursively decomposed on the first
+    variable x (in `order`) it depends on: f = x ? f|x=1 : f|x=0. Every sub-function is built once and shared across
+    all output bits. A sub-function whose complement was already built costs a free NOT. The mux over x simplifies to
+    a single gate when one of the cofactors is a constant or the complement of the other:
+        - f|x=0 = 0: x & f|x=1          - f|x=1 = 0: !x & f|x=0
+        - f|x=0 = 1: !x | f|x=1         - f|x=1 = 1: x | f|x=0
+        - f|x=1 = !f|x=0: x ^ f|x=0
+    '''
+    size = 1 << n_in
+    ops = []
+    built = {}
+    structural = {}
+
+    def node(kind, a, b=None, c=None):
+        key = (kind, a, b, c)
+        if key not in structural:
+            ops.append(key)
+            structural[key] = 1 + n_in + len(ops)
+        return structural[key]
+
+    def negate(a):
+        if a < 2:
+            return 1 - a
+        if a >= 2 + n_in and ops[a - 2 - n_in][0] == 'not':
+            return ops[a - 2 - n_in][1]
+        return node('not', a)
+
+    for v in range(n_in):
+        built[tuple((i >> v) & 1 for i in range(size))] = 2 + v
+    built[tuple(0 for _ in range(size))] = 0
+    built[tuple(1 for _ in range(size))] = 1
+
+    def build(f: tuple) -> int:
+        if f in built:
+            return built[f]
+        complement = tuple(1 - b for b in f)
+        if complement in built:
+            built[f] = negate(built[complement])
+            return built[f]
+
+        for v in order:
+            hi = tuple(f[i | (1 << v)] for i in range(size))
+            lo = tuple(f[i & ~(1 << v)] for i in range(size))
+            if hi != lo:
+                break
+        (h, l, x) = (build(hi), build(lo), 2 + v)
+
+        if l == 0:
+            out = node('and', x, h)
+        elif h == 0:
+            out = node('and', negate(x), l)
+        elif l == 1:
+            out = node('or', negate(x), h)
+        elif h == 1:
+            out = node('or', x, l)
+        elif h == negate(l):
+            out = node('xor', x, l)
+        else:
+            out = node('mux', x, h, l)
+        built[f] = out
+        return out
+
+    outputs = [build(tuple((table[i] >> j) & 1 for i in range(size))) for j in range(n_out)]
+    return LutPlan(n_in, ops, outputs, list(order))
+
+def best_lut_plan(table: [int], n_in=8, n_out=8, n_orders=16) -> LutPlan:
+    '''
+    Returns cheapest of `synthesize_lut` over MSB first, LSB first and `n_orders` random (but fixed) variable orders.
+    Plans are cached per table.
+    '''
+    key = tuple(table)
+    if key not in LUT_PLANS:
+        rng = np.random.default_rng(0)
+        orders = [list(range(n_in-1, -1, -1)), list(range(n_in))] + [list(rng.permutation(n_in)) for _ in range(n_orders)]
+        plans = [synthesize_lut(table, [int(v) for v in order], n_in, n_out) for order in orders]
+        LUT_PLANS[key] = min(plans, key=lambda p: p.cost)
+    return LUT_PLANS[key]
 
 def is_zero(a: [bool]) -> bool:
     '''
@@ -244,9 +684,9 @@ def is_zero(a: [bool]) -> bool:
 
     assert N & (N - 1)  == 0 
 
-    out = ((not a[0]) & (not (a[(N>>1)])))
+    out = (bit_not(a[0]) & bit_not(a[(N>>1)]))
     for i in range(1, N>>1):
-        out = out & ((not a[i]) & (not (a[i+(N>>1)])))
+        out = out & (bit_not(a[i]) & bit_not(a[i+(N>>1)]))
 
     return out 
 
@@ -260,28 +700,21 @@ def arbitrary_unsigned_division(a: [bool], b:[bool]) -> ([bool], [bool]):
     For signed integers, pass them as their absolute values to the function and adjust the signs of quotient and remainder
     as per dividiend and divisor. 
 
-    There's a variant called non-restoring division that observes: given after each iteration, if remainder < divisor
-    we restore the remainder and left shift. Otherwise we left shift `remainder-divisor`. That is in each iteration we do, 
-        PrevR = 2R
-        R = PrevR - D 
-        if R < 0:
-            R = PrevR
-        else:
-            R = R
+    `arbitrary_non_restoring_division` implements the non-restoring variant (keep a signed remainder and add or
+    subtract the divisor depending on its sign, with a single correction at the end) and `arbitrary_srt_division`
+    implements radix-4 SRT. Measured with `division_report` (bootstraps / depth):
 
-    We can change this to:
-        Initialise R = 2R - D then for each iteration, 
-            if R < 0:
-                R = 2R + D (2*(R+D)-D = 2R+D)
-            else:
-                R = 2R - D
-    Apparently latter is more hardware friendly because there's no re-storing step. Hence, no need to reserve registers to restore PrevR.
-    
-    But the same does not apply for us. Non-restoring will require 1 addition and 1 subtraction per iteration (since we execture all branches and then mux
-    based on whether R < 0). More so, detecting R < 0 in restoring division is as simple as checking overflow in unsigned subtraction. I suspect in non-restoring division,
-    to check whether R < 0 one will have extend the bitwidth of R and D to 2N to prevent overflow for corner cases for R and D (since they are doubled every iteration). 
-    Due to this in non-restoring divison every arithmetic operation is for bit-width 2N. Whereas in restoring division we can simply stick to N bit-width arithemtic
-    operations. 
+        width | restoring    | non_restoring | srt4
+        8     | 461 / 130    | 435 / 157     | 1555 / 161
+        16    | 1941 / 514   | 1643 / 573    | 3778 / 428
+        32    | 7973 / 2050  | 6363 / 2173   | 10145 / 1340
+
+    Non-restoring needs fewer bootstraps at every width (the remainder only needs one extra sign bit, not 2N bits)
+    but is slightly deeper, since each iteration's add/subtract waits on the previous iteration's sign. SRT-4 halves
+    the number of iterations and so is shallowest from 16 bits on, but its quotient digit selection costs far more
+    bootstraps. `unsigned_division` defaults to restoring: it is shallower than non-restoring, and its circuit is the
+    one the exported, oracle and verified operations are built and keyed on, so changing the default would change
+    their hashes and tables.
 
     # Div by zero
     When b=0, we call it div by zero. The calling function must indenepdently check whether b=0. When b=0, quotient=MAX value N bits can support and remainder=a.
@@ -292,8 +725,8 @@ def arbitrary_unsigned_division(a: [bool], b:[bool]) -> ([bool], [bool]):
     N = len(a)
     assert len(b) == N
 
-    quotient = [False for i in range(8)]
-    remainder = [False for i in range(8)]
+    quotient = [False for i in range(N)]
+    remainder = [False for i in range(N)]
 
     for i in range(N):
         # Like long division, we iterate from MSB to LSB
@@ -313,6 +746,406 @@ def arbitrary_unsigned_division(a: [bool], b:[bool]) -> ([bool], [bool]):
 
     return (quotient, remainder)
 
+DIVISION_ALGORITHMS = ('restoring', 'non_restoring', 'srt4')
+
+def arbitrary_non_restoring_division(a: [bool], b: [bool]) -> ([bool], [bool]):
+    '''
+    Same as `arbitrary_unsigned_division` but with non-restoring division (see its docstring).
+
+    The partial remainder R is kept as a signed N+1 bit value with -b <= R < b. In each iteration R = 2R + a_i - b if
+    R >= 0, otherwise R = 2R + a_i + b, and the quotient bit is set iff the new R >= 0. Addition and subtraction are
+    a single adder: b is XORed with (R >= 0), which is also the carry in. Hence each iteration requires one N+1 bit
+    adder and N XORs (instead of N muxes in restoring division). In the first iteration R = 0, hence the choice is public
+    and folds to a subtraction. A final addition of b & (R < 0) restores a -ve remainder. Arithmetic is mod 2^(N+1), since 2R + a_i +/- b
+    fits in N+1 bits whenever -b <= R < b.
+
+    When b=0, R stays >= 0, hence quotient is 2^N-1 and remainder is a, as in restoring division.
+    '''
+    N = len(a)
+    assert len(b) == N
+
+    divisor = list(b) + [False]
+    remainder = [False for _ in range(N+1)]
+    quotient = [False for _ in range(N)]
+    non_negative = True
+    for i in range(N):
+        remainder = [a[N-1-i]] + remainder[:N]
+        (remainder, _, _) = arbitrary_bit_adder(a=remainder, b=[d ^ non_negative for d in divisor], carry_in=non_negative)
+        non_negative = bit_not(remainder[N])
+        quotient[N-1-i] = non_negative
+
+    (remainder, _, _) = arbitrary_bit_adder(a=remainder, b=[d & remainder[N] for d in divisor], carry_in=False)
+    return (quotient, remainder[:N])
+
+# Quotient digit selection of radix-4 SRT division: (residual bits, divisor bits) -> table
+SRT_TABLES = {}
+
+def srt_selection_table(v_bits=7, d_bits=3) -> [int]:
+    '''
+    Returns quotient digit selection table of radix-4 SRT division with digits in {-2, .., 2}.
+
+    Divisor d is normalised to [1/2, 1) and residual v to |v| <= 8/3 d. Entry i of the table is the digit q for
+    residual truncated to `v_bits` bits (two's complement, 4 fractional bits, low bits of i) and `d_bits` bits of d
+    after its leading one (high bits of i), such that |v - q d| <= 2/3 d for every v and d in the truncation cell. The
+    digit is encoded as bit 0: |q| = 1, bit 1: |q| = 2, bit 2: q < 0. Cells without feasible (v, d) are don't-cares
+    and are set to the nearest digit.
+    '''
+    from fractions import Fraction
+
+    key = (v_bits, d_bits)
+    if key in SRT_TABLES:
+        return SRT_TABLES[key]
+
+    table = []
+    for i in range(1 << (v_bits + d_bits)):
+        t = i & ((1 << v_bits) - 1)
+        t = t - (1 << v_bits) if t >> (v_bits-1) else t
+        u = i >> v_bits
+        # v in [v0, v1), d in [d0, d1)
+        (v0, v1) = (Fraction(t, 16), Fraction(t+1, 16))
+        (d0, d1) = (Fraction((1 << d_bits) + u, 1 << (d_bits+1)), Fraction((1 << d_bits) + u + 1, 1 << (d_bits+1)))
+
+        # vertices of the cell clipped to |v| <= 8/3 d
+        points = [(v, d) for v in (v0, v1) for d in (d0, d1)]
+        points += [(sign * Fraction(8, 3) * d, d) for sign in (1, -1) for d in (d0, d1)]
+        points += [(v, sign * Fraction(3, 8) * v) for sign in (1, -1) for v in (v0, v1)]
+        points = [(v, d) for (v, d) in points if v0 <= v <= v1 and d0 <= d <= d1 and abs(v) <= Fraction(8, 3) * d]
+
+        if len(points) == 0:
+            q = max(-2, min(2, round((v0 + v1) / (d0 + d1))))
+        else:
+            valid = [q for q in range(-2, 3) if all(abs(v - q*d) <= Fraction(2, 3) * d for (v, d) in points)]
+            assert len(valid) != 0, f'no quotient digit for v in [{v0}, {v1}), d in [{d0}, {d1})'
+            q = min(valid, key=abs)
+        table.append((abs(q) == 1) | ((abs(q) == 2) << 1) | ((q < 0) << 2))
+
+    SRT_TABLES[key] = table
+    return table
+
+def arbitrary_srt_division(a: [bool], b: [bool]) -> ([bool], [bool]):
+    '''
+    Same as `arbitrary_unsigned_division` but with radix-4 SRT division, i.e. 2 quotient bits per iteration.
+
+    (1) Normalisation: b and a are shifted left by s = no. of leading zeros of b, such that MSB of B = b << s is set.
+        Stage k shifts by 2^k if top 2^k bits of B are zero, hence bits of s are available for (4).
+    (2) K is the least no. of iterations such that 4^(K-1) >= 3/8 * 2^N. Residual v (signed N+3 bits) starts as A = a << s without
+        its 2(K-1) least significant bits. In each iteration, digit q in {-2, .., 2} is selected from the top 7 bits of
+        v and 3 bits of B after its leading one (see `srt_selection_table`), v = v - q*B and, except in the last
+        iteration, v = 4v + next 2 bits of A. Since |v| <= 8/3 B before and |v| <= 2/3 B after subtraction, no
+        comparison of full width values is required, and q*B is a shift of B selected by |q| and negated by sign of q
+        with a single adder.
+    (3) Quotient is sum of +ve digits minus sum of -ve digits, minus 1 if the final residual is -ve (in which case B
+        is added to the residual).
+    (4) Remainder is residual >> s.
+
+    Iterations are halved, but normalisation (two shifters of N and 2N bits) and digit selection (a 10 bit lookup
+    table) add fixed costs. When b=0, quotient is set to 2^N-1 and remainder to a.
+    '''
+    N = len(a)
+    assert len(b) == N and N >= 4 and N & (N - 1) == 0
+
+    # (1)
+    divisor = list(b)
+    dividend = list(a) + [False for _ in range(N)]
+    s = []
+    k = N >> 1
+    while k >= 1:
+        top_zero = bit_not(any_bit(divisor[N-k:]))
+        divisor = mux_bool_vec(bit=top_zero, a=shift_left(divisor, k), b=divisor)
+        dividend = mux_bool_vec(bit=top_zero, a=shift_left(dividend, k), b=dividend)
+        s = [top_zero] + s
+        k >>= 1
+
+    # (2)
+    K = 1
+    while (1 << (2*(K-1))) * 8 < 3 * (1 << N):
+        K += 1
+    W = N + 3
+    plan = best_lut_plan(srt_selection_table(), n_in=10, n_out=3)
+    multiples = [False] + divisor + [False, False]
+    divisor = divisor + [False, False, False]
+    v = dividend[2*(K-1):]
+    v = v + [False for _ in range(W - len(v))]
+    positive = []
+    negative = []
+    for j in range(K):
+        (mag1, mag2, sign) = plan.evaluate(v[N-4:N+3] + divisor[N-4:N-1])
+        m = [(mag2 & multiples[i]) | (mag1 & divisor[i]) for i in range(W)]
+        # v - q*B: subtract |q|*B unless q < 0
+        subtract = bit_not(sign)
+        (v, _, _) = arbitrary_bit_adder(a=v, b=[x ^ subtract for x in m], carry_in=subtract)
+        positive += [mag2 & bit_not(sign), mag1 & bit_not(sign)]
+        negative += [mag2 & sign, mag1 & sign]
+        if j != K-1:
+            v = [dividend[2*(K-2-j)], dividend[2*(K-2-j)+1]] + v[:W-2]
+
+    # (3) digits were collected from the most significant one
+    positive = positive[::-1][:N]
+    negative = negative[::-1][:N]
+    negative_residual = v[W-1]
+    (quotient, _, _) = arbitrary_bit_subtractor(a=positive, b=negative, borrow_in=negative_residual)
+    (v, _, _) = arbitrary_bit_adder(a=v, b=[d & negative_residual for d in divisor], carry_in=False)
+
+    # (4)
+    remainder = barrel_shifter(v[:N], s, shift_right)
+
+    div_by_zero = is_zero(a=b)
+    quotient = [q | div_by_zero for q in quotient]
+    remainder = mux_bool_vec(bit=div_by_zero, a=a, b=remainder)
+    return (quotient, remainder)
+
+def unsigned_division(a: [bool], b: [bool], algorithm='restoring') -> ([bool], [bool]):
+    '''
+    Returns (quotient, remainder) of unsigned division a / b with `algorithm` (one of DIVISION_ALGORITHMS). All
+    algorithms return quotient 2^N-1 and remainder a when b=0.
+    '''
+    match algorithm:
+        case 'restoring':
+            return arbitrary_unsigned_division(a=a, b=b)
+        case 'non_restoring':
+            return arbitrary_non_restoring_division(a=a, b=b)
+        case 'srt4':
+            return arbitrary_srt_division(a=a, b=b)
+    raise ValueError(f'unknown division algorithm {algorithm!r}, expected one of {DIVISION_ALGORITHMS}')
+
+def int_to_bits(v: int, N: int) -> [bool]:
+    '''
+    Returns N least significant bits of plaintext `v` (in 2s complement if v is -ve) as python bools
+    '''
+    return [((v >> i) & 1) == 1 for i in range(N)]
+
+def negate(a: [bool]) -> [bool]:
+    '''
+    Returns -a (mod 2^N), i.e. 2s complement of `a`
+    '''
+    out = [bit_not(i) for i in a]
+    carry = True
+    for i in range(len(a)):
+        (out[i], carry) = half_adder(A=out[i], B=carry)
+    return out
+
+def arbitrary_scalar_adder(a: [bool], b: [bool], carry_in: bool) -> ([bool], bool, bool):
+    '''
+    Same as `arbitrary_bit_adder` but `b` is a plaintext (list of python bools).
+
+    Since b[i] is known, full adder at bit i simplifies to:
+        - b[i] = 0: S = a[i] ^ C,   C_out = a[i] & C       (half adder)
+        - b[i] = 1: S = !(a[i] ^ C), C_out = a[i] | C
+    Hence, each bit requires at-most 2 gates instead of 5. Bits where carry is still a constant require no gates at all.
+    '''
+    N = len(a)
+    assert len(a) == len(b), f'len(a)={len(a)} != len(b)={len(b)}'
+    assert all(isinstance(i, bool) for i in b), 'b must be a plaintext'
+    assert N > 2
+
+    out = [False for i in range(N)]
+    carries = [False for i in range(N)]
+    carry = carry_in
+    for i in range(N):
+        if b[i]:
+            out[i] = bit_not(a[i] ^ carry)
+            carry = a[i] | carry
+        else:
+            (out[i], carry) = half_adder(A=a[i], B=carry)
+        carries[i] = carry
+
+    return (out, carries[N-1], carries[N-2])
+
+def arbitrary_scalar_subtractor(a: [bool], b: [bool], borrow_in: bool) -> ([bool], bool, bool):
+    '''
+    Same as `arbitrary_bit_subtractor` but `b` is a plaintext (list of python bools)
+    '''
+    invert_b = [not i for i in b]
+    carry_in = True^borrow_in
+    return arbitrary_scalar_adder(a=a, b=invert_b, carry_in=carry_in)
+
+def arbitrary_scalar_mul(a: [bool], b: [bool]) -> [bool]:
+    '''
+    Returns a x b (mod 2^N) where `b` is a plaintext (list of python bools).
+
+    Adds `a << i` for every set bit i of b (shift and add). Shifts are free and the low i bits of `a << i` are constant
+    zeros, hence the adder at bit i only has gates at positions >= i. Requires (popcount(b) - 1) additions at most.
+    '''
+    N = len(a)
+    assert len(a) == len(b)
+    assert all(isinstance(i, bool) for i in b), 'b must be a plaintext'
+
+    acc = None
+    for i in range(N):
+        if b[i]:
+            shifted = [False for _ in range(i)] + list(a[:N-i])
+            if acc is None:
+                acc = shifted
+            else:
+                (acc, _, _) = arbitrary_bit_adder(a=acc, b=shifted, carry_in=False)
+
+    if acc is None:
+        return [False for _ in range(N)]
+    return acc
+
+def unsigned_division_magic(d: int, N: int) -> (int, int):
+    '''
+    Returns smallest shift `s` and magic number `m` s.t. for all 0 <= a < 2^N
+        floor(a / d) = floor(a * m / 2^{N+s})
+
+    Due to Granlund and Montgomery (Division by Invariant Integers using Multiplication, Theorem 4.2), m = ceil(2^{N+s}/d)
+    works whenever m*d - 2^{N+s} <= 2^s. The condition always holds for s = ceil(log2(d)).
+    '''
+    assert 0 < d < (1 << N)
+    for s in range(N+1):
+        m = -(-(1 << (N+s)) // d)
+        if m*d - (1 << (N+s)) <= (1 << s):
+            return (m, s)
+
+def arbitrary_unsigned_scalar_division(a: [bool], d: int) -> ([bool], [bool]):
+    '''
+    Returns quotient and remainder of unsigned `a` divided by plaintext `d` (d != 0).
+
+    Division by a known divisor is replaced by multiplication with magic number `m` and a shift (see
+    `unsigned_division_magic`):
+        quotient = (a * m) >> (N+s)
+        remainder = a - quotient * d
+
+    `a * m` is evaluated with `arbitrary_scalar_mul` over N + bit_length(m) bits so that it never overflows. Since
+    remainder < d, it is calculated only over the low bit_length(d) bits.
+
+    When `d` = 2^k the quotient is `a` shifted right by k and the remainder is the low k bits of `a`, i.e. no gates.
+    '''
+    N = len(a)
+    assert 0 < d < (1 << N)
+
+    if d & (d-1) == 0:
+        k = d.bit_length() - 1
+        quotient = list(a[k:]) + [False for _ in range(k)]
+        remainder = list(a[:k]) + [False for _ in range(N-k)]
+        return (quotient, remainder)
+
+    (m, s) = unsigned_division_magic(d, N)
+    W = N + m.bit_length()
+    product = arbitrary_scalar_mul(a=list(a) + [False for _ in range(W-N)], b=int_to_bits(m, W))
+    quotient = product[N+s:N+s+N]
+    quotient = quotient + [False for _ in range(N-len(quotient))]
+
+    R = min(N, max(3, d.bit_length()))
+    q_times_d = arbitrary_scalar_mul(a=quotient[:R], b=int_to_bits(d, R))
+    (remainder, _, _) = arbitrary_bit_subtractor(a=a[:R], b=q_times_d, borrow_in=False)
+    remainder = remainder + [False for _ in range(N-R)]
+    return (quotient, remainder)
+
+
+# Multi-limb integers
+#
+# Wide integers (see `FheUintN`) are little-endian lists of 8 bit limbs. Work that is local to a limb (limb sums, limb
+# comparisons, partial products of a pair of limbs) uses the 8 bit circuits and does not depend on other limbs, hence
+# it is evaluated in parallel, i.e. all limbs share the same levels of the circuit. Only the per-limb results (carries,
+# comparison flags) are combined across limbs, with trees of O(log(no. of limbs)) depth.
+
+LIMB_BITS = 8
+
+def split_limbs(a: [bool]) -> [[bool]]:
+    '''
+    Returns LIMB_BITS bit limbs of `a`, least significant limb first
+    '''
+    assert len(a) % LIMB_BITS == 0
+    return [a[i:i+LIMB_BITS] for i in range(0, len(a), LIMB_BITS)]
+
+def limb_carries(blocks: [(bool, bool)], carry_in: bool) -> [bool]:
+    '''
+    Returns carries into each limb and the carry out of the last limb, given (c0, c1) of each limb where c0 (c1) is
+    carry out of the limb when its carry in is 0 (1).
+
+    Carries are resolved with a Kogge-Stone prefix over limbs. (c0, c1) of limbs L (low) and H (high) combine to
+        (H.c0 | (L.c0 & H.c1), H.c0 | (L.c1 & H.c1))
+    since c0 implies c1. carry_in is a block with c0 = c1 = carry_in, hence the prefix of limbs 0..i-1 is the carry into
+    limb i. Requires log2(no. of limbs + 1) levels of 2 gates.
+    '''
+    prefix = [(carry_in, carry_in)] + list(blocks)
+    d = 1
+    while d < len(prefix):
+        combined = list(prefix)
+        for i in range(d, len(prefix)):
+            ((l0, l1), (h0, h1)) = (prefix[i-d], prefix[i])
+            combined[i] = (h0 | (l0 & h1), h0 | (l1 & h1))
+        prefix = combined
+        d *= 2
+    return [c0 for (c0, _) in prefix]
+
+def limb_adder(a: [bool], b: [bool], carry_in: bool) -> ([bool], bool):
+    '''
+    Returns (sum = (a + b + c_in) mod 2^N, carry out) with a carry-select adder over limbs.
+
+    Each limb (except the first) is added twice with `arbitrary_bit_adder`, with carry in 0 and 1, independent of
+    other limbs. c_{N-1} of both adds are the (c0, c1) of the limb (see `limb_carries`). The first limb is added with
+    `carry_in` since its carry in is known. Once carries into limbs are resolved, each limb selects one of its two sums.
+    Depth is depth of a limb adder + O(log(no. of limbs)) instead of linear in N.
+    '''
+    assert len(a) == len(b)
+    (a, b) = (split_limbs(a), split_limbs(b))
+    sums = []
+    blocks = []
+    (s, c, _) = arbitrary_bit_adder(a=a[0], b=b[0], carry_in=carry_in)
+    sums.append((s, s))
+    blocks.append((c, c))
+    for i in range(1, len(a)):
+        (s0, c0, _) = arbitrary_bit_adder(a=a[i], b=b[i], carry_in=False)
+        (s1, c1, _) = arbitrary_bit_adder(a=a[i], b=b[i], carry_in=True)
+        sums.append((s0, s1))
+        blocks.append((c0, c1))
+
+    # carry into the first limb is already added
+    carries = limb_carries(blocks, False)
+    out = list(sums[0][0])
+    for i in range(1, len(a)):
+        out += mux_bool_vec(bit=carries[i], a=sums[i][1], b=sums[i][0])
+    return (out, carries[-1])
+
+def limb_subtractor(a: [bool], b: [bool], borrow_in: bool) -> ([bool], bool):
+    '''
+    Returns (a - b - borrow_in, carry out) with `limb_adder` (see `arbitrary_bit_subtractor`)
+    '''
+    return limb_adder(a=a, b=[bit_not(i) for i in b], carry_in=True^borrow_in)
+
+def limb_compare(a: [bool], b: [bool]) -> (bool, bool, bool):
+    '''
+    Assumes A and B are unsigned and returns (A < B, A == B, A > B).
+
+    Each limb is compared with `arbitrary_unsigned_bit_compare`, independent of other limbs. Flags of adjacent limbs
+    (H high, L low) are combined with a balanced tree:
+        (H.eq & L.eq, H.gt | (H.eq & L.gt))
+    '''
+    assert len(a) == len(b)
+    flags = [arbitrary_unsigned_bit_compare(a=x, b=y)[1:] for (x, y) in zip(split_limbs(a), split_limbs(b))]
+    while len(flags) > 1:
+        combined = []
+        for i in range(0, len(flags)-1, 2):
+            ((l_eq, l_gt), (h_eq, h_gt)) = (flags[i], flags[i+1])
+            combined.append((h_eq & l_eq, h_gt | (h_eq & l_gt)))
+        flags = combined + ([flags[-1]] if len(flags) % 2 else [])
+    (eq, gt) = flags[0]
+    return (bit_not(gt | eq), eq, gt)
+
+def limb_mul(a: [bool], b: [bool]) -> [bool]:
+    '''
+    Returns a x b (mod 2^N).
+
+    Product of limbs a_i, b_j has weight 2^{8(i+j)}, hence only pairs with i+j < no. of limbs contribute. Partial
+    products of each pair are reduced to two rows by `carry_save_reduce`, independent of other pairs, and only up to
+    bit N - 8(i+j) (hence pairs with i+j = no. of limbs - 1 only compute the 8 LSBs, as `eight_bits_mul`). Rows of all
+    pairs are then reduced once more to two rows and resolved with `limb_adder`.
+    '''
+    assert len(a) == len(b)
+    N = len(a)
+    (a, b) = (split_limbs(a), split_limbs(b))
+    rows = []
+    for i in range(len(a)):
+        for j in range(len(b) - i):
+            offset = LIMB_BITS*(i+j)
+            width = min(2*LIMB_BITS, N - offset)
+            terms = [(a[i][k] & b[j][l], 1 << (k+l)) for k in range(LIMB_BITS) for l in range(LIMB_BITS) if k + l < width]
+            for row in carry_save_reduce(terms, 0, width):
+                rows += [(row[k], 1 << (offset+k)) for k in range(width)]
+    (x, y) = carry_save_reduce(rows, 0, N)
+    return limb_adder(a=x, b=y, carry_in=False)[0]
 
 class FheInt8:
     def __init__(self, bits: [bool]):
@@ -340,7 +1173,8 @@ class FheInt8:
         return FheInt8(bits=bits)
         
     def to_int8(self) -> int:
-        bits = self.bits
+        # bool() evaluates bits of lazy values (see lazy.py)
+        bits = [bool(b) for b in self.bits]
         assert len(bits) == 8
 
         value = 0
@@ -417,11 +1251,11 @@ class FheInt8:
         # overflow check
         overflow = b.bits[7] & self.bits[7]
         for i in range(7):
-            overflow = overflow & (b.bits[i]&(not self.bits[i]))
+            overflow = overflow & (b.bits[i]&bit_not(self.bits[i]))
 
         return (quotient, remainder, div_error, overflow)
 
-    def DivAndRem(self, b: FheInt8) -> (FheInt8, FheInt8, bool):
+    def DivAndRem(self, b: FheInt8, algorithm='restoring') -> (FheInt8, FheInt8, bool):
         '''
         returns c, d, div_error s.t. 
             a = c*b + d (c: quotitent, d: remainder)
@@ -431,6 +1265,9 @@ class FheInt8:
         If b=0, then division by 0 was attempeted and div_error flag is set to 1. In this case, 
         returned c = -1 and d = a.
 
+        `algorithm` is the unsigned division (one of DIVISION_ALGORITHMS, see `unsigned_division`). If `b` is a
+        plaintext int, `ScalarDivAndRem` is used instead.
+
         Signed division is performed by using unsigned diviaion as a subroutine. We first take 
         absolute values of a and b and then treat them as unsigned integers for divison. We then 
         adjust the sign of quotient (i.e. c) and remainder (i.e. d) as per signs of a and b: 
@@ -470,20 +1307,23 @@ class FheInt8:
 
         Whenever division overflows, c = a = -2^{N-1} and d = 0. 
         '''
+        if isinstance(b, int):
+            return self.ScalarDivAndRem(b)
+
         pos_a = absolute(a=self.bits)
         pos_b = absolute(a=b.bits)
 
         div_error = is_zero(a=pos_b)
 
-        (quotient, remainder) = arbitrary_unsigned_division(a=pos_a, b=pos_b)
+        (quotient, remainder) = unsigned_division(a=pos_a, b=pos_b, algorithm=algorithm)
 
         # set sign of quotient
-        neg_quotient = [not i for i in quotient]
+        neg_quotient = [bit_not(i) for i in quotient]
         carry = True
         for i in range(8):
             (neg_quotient[i], carry) = half_adder(A=neg_quotient[i], B=carry)
         # (self.bits[-1]^b.bits[-1]) & (not div_error) == 1 then negate quotient otherwise quotient remains unchanged
-        quotient = mux_bool_vec(bit=((self.bits[-1]^b.bits[-1]) & (not div_error)), a=neg_quotient, b=quotient)
+        quotient = mux_bool_vec(bit=((self.bits[-1]^b.bits[-1]) & bit_not(div_error)), a=neg_quotient, b=quotient)
 
         # if (self.bits[-1]^b.bits[-1]) & (not div_error):
         #     # negate quotient
@@ -496,7 +1336,7 @@ class FheInt8:
         #     pass
 
         # set sign of remainder
-        neg_remainder = [not i for i in remainder]
+        neg_remainder = [bit_not(i) for i in remainder]
         carry = True
         for i in range(8):
             (neg_remainder[i], carry) = half_adder(A=neg_remainder[i], B=carry)
@@ -521,17 +1361,200 @@ class FheInt8:
 
     def GreaterThanOrEqualTo(self, b: FheInt8) -> bool:
         # A>=B  = !(A<B)
-        return not (self.LessThan(b))
+        return bit_not(self.LessThan(b))
 
     def LessThan(self, b: FheInt8) -> bool:
         return arbitrary_signed_bit_comparator(a=b.bits, b=self.bits)
 
     def LessThanOrEqualTo(self, b: FheInt8) -> bool:
         # A<=B = !(A>B)
-        return not (self.GreaterThan(b=b))
+        return bit_not(self.GreaterThan(b=b))
 
     def Equals(self, b: FheInt8) -> bool:
-        return arbitrary_bit_equality(a=self.bits, b=b.bits)     
+        return arbitrary_bit_equality(a=self.bits, b=b.bits)
+
+    # Bitwise operations
+    #
+    # Shift and rotate amounts are taken modulo 8. Plaintext amounts (Scalar*) only rewire bits and require no gates.
+    # Encrypted amounts use the low 3 bits of `b` with a barrel shifter (see `barrel_shifter`).
+
+    def BitAnd(self, b: FheInt8) -> FheInt8:
+        return FheInt8(bits=[self.bits[i] & b.bits[i] for i in range(8)])
+
+    def BitOr(self, b: FheInt8) -> FheInt8:
+        return FheInt8(bits=[self.bits[i] | b.bits[i] for i in range(8)])
+
+    def BitXor(self, b: FheInt8) -> FheInt8:
+        return FheInt8(bits=[self.bits[i] ^ b.bits[i] for i in range(8)])
+
+    def BitNot(self) -> FheInt8:
+        return FheInt8(bits=[bit_not(i) for i in self.bits])
+
+    def Lut(f):
+        '''
+        Returns a function that maps FheInt8 x to f(x), where `f` is a python function or a table of 256 outputs indexed by
+        input value. Called on the class, i.e. `FheInt8.Lut(f)`. The circuit is synthesized once (see `best_lut_plan`).
+        '''
+        plan = best_lut_plan(lut_table(f, signed=True))
+        return lambda x: FheInt8(bits=plan.evaluate(x.bits))
+
+    def Map(self, f) -> FheInt8:
+        return FheInt8.Lut(f)(self)
+
+    def Popcount(self) -> FheInt8:
+        return FheInt8(bits=popcount(self.bits) + [False for _ in range(4)])
+
+    def HammingDistance(self, b: FheInt8) -> FheInt8:
+        return FheInt8(bits=hamming_distance(self.bits, b.bits) + [False for _ in range(4)])
+
+    def ScalarShl(self, v: int) -> FheInt8:
+        return FheInt8(bits=shift_left(self.bits, v % 8))
+
+    def ScalarShr(self, v: int) -> FheInt8:
+        '''
+        Arithmetic shift, i.e. vacated bits are set to the sign bit
+        '''
+        a = self.bits
+        k = v % 8
+        return FheInt8(bits=shift_right(a, k, fill=self.bits[-1]))
+
+    def ScalarRotateLeft(self, v: int) -> FheInt8:
+        return FheInt8(bits=rotate_left(self.bits, v))
+
+    def ScalarRotateRight(self, v: int) -> FheInt8:
+        return FheInt8(bits=rotate_right(self.bits, v))
+
+    def Shl(self, b: FheInt8) -> FheInt8:
+        return FheInt8(bits=barrel_shifter(self.bits, amount=b.bits, shift=shift_left))
+
+    def Shr(self, b: FheInt8) -> FheInt8:
+        '''
+        Arithmetic shift, i.e. vacated bits are set to the sign bit
+        '''
+        return FheInt8(bits=barrel_shifter(self.bits, amount=b.bits, shift=lambda a, k: shift_right(a, k, fill=self.bits[-1])))
+
+    def RotateLeft(self, b: FheInt8) -> FheInt8:
+        return FheInt8(bits=barrel_shifter(self.bits, amount=b.bits, shift=rotate_left))
+
+    def RotateRight(self, b: FheInt8) -> FheInt8:
+        return FheInt8(bits=barrel_shifter(self.bits, amount=b.bits, shift=rotate_right))
+
+    # Fused operations
+    #
+    # Operations below share a single comparator instead of evaluating `GreaterThan`, `LessThan` and `Equals`
+    # separately.
+
+    def Compare(self, b: FheInt8) -> (bool, bool, bool):
+        '''
+        Returns (a < b, a == b, a > b)
+        '''
+        return arbitrary_signed_bit_compare(a=self.bits, b=b.bits)
+
+    def MinMax(self, b: FheInt8) -> (FheInt8, FheInt8):
+        '''
+        Returns (min(a, b), max(a, b)). Both share a single comparator and select (see `arbitrary_min_max`)
+        '''
+        (min_bits, max_bits) = arbitrary_min_max(a=self.bits, b=b.bits, a_gt_b=arbitrary_signed_bit_comparator(a=self.bits, b=b.bits))
+        return (FheInt8(bits=min_bits), FheInt8(bits=max_bits))
+
+    def Min(self, b: FheInt8) -> FheInt8:
+        a_gt_b = arbitrary_signed_bit_comparator(a=self.bits, b=b.bits)
+        return FheInt8(bits=mux_bool_vec(bit=a_gt_b, a=b.bits, b=self.bits))
+
+    def Max(self, b: FheInt8) -> FheInt8:
+        a_gt_b = arbitrary_signed_bit_comparator(a=self.bits, b=b.bits)
+        return FheInt8(bits=mux_bool_vec(bit=a_gt_b, a=self.bits, b=b.bits))
+
+    def Clamp(self, lo: FheInt8, hi: FheInt8) -> FheInt8:
+        '''
+        Returns `lo` if a < lo, `hi` if a > hi and `a` otherwise. Assumes lo <= hi.
+        '''
+        return FheInt8(bits=arbitrary_clamp(x=self.bits, lo=lo.bits, hi=hi.bits, comparator=lambda a, b: arbitrary_signed_bit_comparator(a=a, b=b)))
+
+    def Select(cond: bool, a: FheInt8, b: FheInt8) -> FheInt8:
+        '''
+        Returns `a` when encrypted bit `cond` is True, otherwise returns `b`. Called on the class, i.e. `FheInt8.Select(cond, a, b)`.
+        '''
+        return FheInt8(bits=mux_bool_vec(bit=cond, a=a.bits, b=b.bits))
+
+    # Accumulation
+    #
+    # Called on the class, i.e. `FheInt8.Sum(values)`. `overflow` is one of `OVERFLOW_MODES` (see `narrow`). With
+    # overflow=wide the result is returned as list of bits of the accumulator instead of FheInt8.
+
+    def Sum(values: [FheInt8], overflow='wrap'):
+        return FheInt8.wrap_result(arbitrary_sum([v.bits for v in values], signed=True, overflow=overflow), overflow)
+
+    def Dot(xs: [FheInt8], ws: list, overflow='wrap'):
+        '''
+        Returns sum of xs[i] * ws[i]. Each of `ws` is either FheInt8 or a plaintext int in range [-128, 127].
+        '''
+        assert all(not isinstance(w, int) or -128 <= w <= 127 for w in ws)
+        ws = [w if isinstance(w, int) else w.bits for w in ws]
+        return FheInt8.wrap_result(arbitrary_dot([x.bits for x in xs], ws, signed=True, overflow=overflow), overflow)
+
+    def wrap_result(out, overflow: str):
+        if overflow == 'wide':
+            return out
+        if overflow == 'flag':
+            return (FheInt8(bits=out[0]), out[1])
+        return FheInt8(bits=out)
+
+    # Scalar operations
+    #
+    # Same as operations above but the second operand `v` is a plaintext int in range [-128, 127]. Bits of `v` are python
+    # bools, hence every gate with a bit of `v` as input is folded.
+
+    def ScalarAdd(self, v: int) -> (FheInt8, bool):
+        assert -128 <= v <= 127
+        (out_bits, c_7, c_6) = arbitrary_scalar_adder(a=self.bits, b=int_to_bits(v, 8), carry_in=False)
+        return (FheInt8(bits=out_bits), c_7^c_6)
+
+    def ScalarSub(self, v: int) -> (FheInt8, bool):
+        assert -128 <= v <= 127
+        (out_bits, c_7, c_6) = arbitrary_scalar_subtractor(a=self.bits, b=int_to_bits(v, 8), borrow_in=False)
+        return (FheInt8(bits=out_bits), c_7^c_6)
+
+    def ScalarMul(self, v: int) -> FheInt8:
+        assert -128 <= v <= 127
+        return FheInt8(bits=arbitrary_scalar_mul(a=self.bits, b=int_to_bits(v, 8)))
+
+    def ScalarDivAndRem(self, v: int) -> (FheInt8, FheInt8, bool):
+        '''
+        Same as `DivAndRem` but divisor is plaintext `v`. div_error flag is a python bool.
+
+        Since sign of `v` is known, quotient is negated when sign(a) differs from sign(v) and remainder is negated when
+        a is -ve. Note that abs(-128) = 128 fits in 8 bits when treated as unsigned.
+        '''
+        assert -128 <= v <= 127
+        if v == 0:
+            return (FheInt8(bits=[True for _ in range(8)]), FheInt8(bits=list(self.bits)), True)
+
+        pos_a = absolute(a=self.bits)
+        (quotient, remainder) = arbitrary_unsigned_scalar_division(a=pos_a, d=abs(v))
+
+        negate_quotient = bit_not(self.bits[-1]) if v < 0 else self.bits[-1]
+        quotient = mux_bool_vec(bit=negate_quotient, a=negate(quotient), b=quotient)
+        remainder = mux_bool_vec(bit=self.bits[-1], a=negate(remainder), b=remainder)
+        return (FheInt8(bits=quotient), FheInt8(bits=remainder), False)
+
+    def ScalarGreaterThan(self, v: int) -> bool:
+        assert -128 <= v <= 127
+        return arbitrary_signed_bit_comparator(a=self.bits, b=int_to_bits(v, 8))
+
+    def ScalarGreaterThanOrEqualTo(self, v: int) -> bool:
+        return bit_not(self.ScalarLessThan(v))
+
+    def ScalarLessThan(self, v: int) -> bool:
+        assert -128 <= v <= 127
+        return arbitrary_signed_bit_comparator(a=int_to_bits(v, 8), b=self.bits)
+
+    def ScalarLessThanOrEqualTo(self, v: int) -> bool:
+        return bit_not(self.ScalarGreaterThan(v))
+
+    def ScalarEquals(self, v: int) -> bool:
+        assert -128 <= v <= 127
+        return arbitrary_bit_equality(a=self.bits, b=int_to_bits(v, 8))
 class FheUint8:
     def __init__(self, bits: [bool]):
         assert len(bits) == 8
@@ -549,9 +1572,11 @@ class FheUint8:
         return FheUint8(bits=bits)
 
     def to_uint8(self) -> int:
+        # bool() evaluates bits of lazy values (see lazy.py)
+        bits = [bool(b) for b in self.bits]
         v = 0
         for i in range(8):
-            v += (self.bits[i]*(1 << i))
+            v += (bits[i]*(1 << i))
         return v
 
     def Add(self, b: FheUint8) -> (FheUint8, bool):
@@ -577,9 +1602,9 @@ class FheUint8:
         '''
 
         (out, c_7, _) = arbitrary_bit_subtractor(a=self.bits, b=b.bits, borrow_in=False)
-        return (FheUint8(bits=out), not c_7)
+        return (FheUint8(bits=out), bit_not(c_7))
 
-    def DivAndRem(self, b: FheInt8) -> (FheUint8, FheUint8, bool):
+    def DivAndRem(self, b: FheUint8, algorithm='restoring') -> (FheUint8, FheUint8, bool):
         '''
         returns c, d, div_error s.t. 
             a = c*b + d (c: quotitent, d: remainder)
@@ -588,9 +1613,14 @@ class FheUint8:
 
         If b=0, then division by 0 was attempeted and div_error flag is set to 1. In this case, 
         returned c = -1 and d = a.
+
+        `algorithm` is one of DIVISION_ALGORITHMS (see `unsigned_division`). If `b` is a plaintext int,
+        `ScalarDivAndRem` is used instead.
         '''
+        if isinstance(b, int):
+            return self.ScalarDivAndRem(b)
         div_error = is_zero(a=b.bits)
-        (quotient, remainder) = arbitrary_unsigned_division(a=self.bits, b=b.bits)
+        (quotient, remainder) = unsigned_division(a=self.bits, b=b.bits, algorithm=algorithm)
         return (FheUint8(bits=quotient), FheUint8(bits=remainder), div_error)
 
 
@@ -603,18 +1633,303 @@ class FheUint8:
 
     def GreaterThanOrEqualTo(self, b: FheUint8) -> bool:
         # A>=B  = !(A<B)
-        return not (self.LessThan(b))
+        return bit_not(self.LessThan(b))
 
     def LessThan(self, b: FheUint8) -> bool:
         return arbitrary_unsigned_bit_comparator(a=b.bits, b=self.bits)
 
     def LessThanOrEqualTo(self, b: FheUint8) -> bool:
         # A<=B = !(A>B)
-        return not (self.GreaterThan(b=b))
+        return bit_not(self.GreaterThan(b=b))
 
     def Equals(self, b: FheUint8) -> bool:
         return arbitrary_bit_equality(a=self.bits, b=b.bits)
 
+    # Bitwise operations
+    #
+    # Shift and rotate amounts are taken modulo 8. Plaintext amounts (Scalar*) only rewire bits and require no gates.
+    # Encrypted amounts use the low 3 bits of `b` with a barrel shifter (see `barrel_shifter`).
+
+    def BitAnd(self, b: FheUint8) -> FheUint8:
+        return FheUint8(bits=[self.bits[i] & b.bits[i] for i in range(8)])
+
+    def BitOr(self, b: FheUint8) -> FheUint8:
+        return FheUint8(bits=[self.bits[i] | b.bits[i] for i in range(8)])
+
+    def BitXor(self, b: FheUint8) -> FheUint8:
+        return FheUint8(bits=[self.bits[i] ^ b.bits[i] for i in range(8)])
+
+    def BitNot(self) -> FheUint8:
+        return FheUint8(bits=[bit_not(i) for i in self.bits])
+
+    def Lut(f):
+        '''
+        Returns a function that maps FheUint8 x to f(x), where `f` is a python function or a table of 256 outputs indexed by
+        input value. Called on the class, i.e. `FheUint8.Lut(f)`. The circuit is synthesized once (see `best_lut_plan`).
+        '''
+        plan = best_lut_plan(lut_table(f, signed=False))
+        return lambda x: FheUint8(bits=plan.evaluate(x.bits))
+
+    def Map(self, f) -> FheUint8:
+        return FheUint8.Lut(f)(self)
+
+    def Popcount(self) -> FheUint8:
+        return FheUint8(bits=popcount(self.bits) + [False for _ in range(4)])
+
+    def HammingDistance(self, b: FheUint8) -> FheUint8:
+        return FheUint8(bits=hamming_distance(self.bits, b.bits) + [False for _ in range(4)])
+
+    def ScalarShl(self, v: int) -> FheUint8:
+        return FheUint8(bits=shift_left(self.bits, v % 8))
+
+    def ScalarShr(self, v: int) -> FheUint8:
+        '''
+        Logical shift
+        '''
+        a = self.bits
+        k = v % 8
+        return FheUint8(bits=shift_right(a, k))
+
+    def ScalarRotateLeft(self, v: int) -> FheUint8:
+        return FheUint8(bits=rotate_left(self.bits, v))
+
+    def ScalarRotateRight(self, v: int) -> FheUint8:
+        return FheUint8(bits=rotate_right(self.bits, v))
+
+    def Shl(self, b: FheUint8) -> FheUint8:
+        return FheUint8(bits=barrel_shifter(self.bits, amount=b.bits, shift=shift_left))
+
+    def Shr(self, b: FheUint8) -> FheUint8:
+        '''
+        Logical shift
+        '''
+        return FheUint8(bits=barrel_shifter(self.bits, amount=b.bits, shift=lambda a, k: shift_right(a, k)))
+
+    def RotateLeft(self, b: FheUint8) -> FheUint8:
+        return FheUint8(bits=barrel_shifter(self.bits, amount=b.bits, shift=rotate_left))
+
+    def RotateRight(self, b: FheUint8) -> FheUint8:
+        return FheUint8(bits=barrel_shifter(self.bits, amount=b.bits, shift=rotate_right))
+
+    # Fused operations
+    #
+    # Operations below share a single comparator instead of evaluating `GreaterThan`, `LessThan` and `Equals`
+    # separately.
+
+    def Compare(self, b: FheUint8) -> (bool, bool, bool):
+        '''
+        Returns (a < b, a == b, a > b)
+        '''
+        return arbitrary_unsigned_bit_compare(a=self.bits, b=b.bits)
+
+    def MinMax(self, b: FheUint8) -> (FheUint8, FheUint8):
+        '''
+        Returns (min(a, b), max(a, b)). Both share a single comparator and select (see `arbitrary_min_max`)
+        '''
+        (min_bits, max_bits) = arbitrary_min_max(a=self.bits, b=b.bits, a_gt_b=arbitrary_unsigned_bit_comparator(a=self.bits, b=b.bits))
+        return (FheUint8(bits=min_bits), FheUint8(bits=max_bits))
+
+    def Min(self, b: FheUint8) -> FheUint8:
+        a_gt_b = arbitrary_unsigned_bit_comparator(a=self.bits, b=b.bits)
+        return FheUint8(bits=mux_bool_vec(bit=a_gt_b, a=b.bits, b=self.bits))
+
+    def Max(self, b: FheUint8) -> FheUint8:
+        a_gt_b = arbitrary_unsigned_bit_comparator(a=self.bits, b=b.bits)
+        return FheUint8(bits=mux_bool_vec(bit=a_gt_b, a=self.bits, b=b.bits))
+
+    def Clamp(self, lo: FheUint8, hi: FheUint8) -> FheUint8:
+        '''
+        Returns `lo` if a < lo, `hi` if a > hi and `a` otherwise. Assumes lo <= hi.
+        '''
+        return FheUint8(bits=arbitrary_clamp(x=self.bits, lo=lo.bits, hi=hi.bits, comparator=lambda a, b: arbitrary_unsigned_bit_comparator(a=a, b=b)))
+
+    def Select(cond: bool, a: FheUint8, b: FheUint8) -> FheUint8:
+        '''
+        Returns `a` when encrypted bit `cond` is True, otherwise returns `b`. Called on the class, i.e. `FheUint8.Select(cond, a, b)`.
+        '''
+        return FheUint8(bits=mux_bool_vec(bit=cond, a=a.bits, b=b.bits))
+
+    # Accumulation
+    #
+    # Called on the class, i.e. `FheUint8.Sum(values)`. `overflow` is one of `OVERFLOW_MODES` (see `narrow`). With
+    # overflow=wide the result is returned as list of bits of the accumulator instead of FheUint8.
+
+    def Sum(values: [FheUint8], overflow='wrap'):
+        return FheUint8.wrap_result(arbitrary_sum([v.bits for v in values], signed=False, overflow=overflow), overflow)
+
+    def Dot(xs: [FheUint8], ws: list, overflow='wrap'):
+        '''
+        Returns sum of xs[i] * ws[i]. Each of `ws` is either FheUint8 or a plaintext int in range [0, 255].
+        '''
+        assert all(not isinstance(w, int) or 0 <= w <= 255 for w in ws)
+        ws = [w if isinstance(w, int) else w.bits for w in ws]
+        return FheUint8.wrap_result(arbitrary_dot([x.bits for x in xs], ws, signed=False, overflow=overflow), overflow)
+
+    def wrap_result(out, overflow: str):
+        if overflow == 'wide':
+            return out
+        if overflow == 'flag':
+            return (FheUint8(bits=out[0]), out[1])
+        return FheUint8(bits=out)
+
+    # Scalar operations
+    #
+    # Same as operations above but the second operand `v` is a plaintext int in range [0, 255]. Bits of `v` are python
+    # bools, hence every gate with a bit of `v` as input is folded.
+
+    def ScalarAdd(self, v: int) -> (FheUint8, bool):
+        assert 0 <= v <= 255
+        (out, c_7, _) = arbitrary_scalar_adder(a=self.bits, b=int_to_bits(v, 8), carry_in=False)
+        return (FheUint8(bits=out), c_7)
+
+    def ScalarSub(self, v: int) -> (FheUint8, bool):
+        assert 0 <= v <= 255
+        (out, c_7, _) = arbitrary_scalar_subtractor(a=self.bits, b=int_to_bits(v, 8), borrow_in=False)
+        return (FheUint8(bits=out), bit_not(c_7))
+
+    def ScalarMul(self, v: int) -> FheUint8:
+        assert 0 <= v <= 255
+        return FheUint8(bits=arbitrary_scalar_mul(a=self.bits, b=int_to_bits(v, 8)))
+
+    def ScalarDivAndRem(self, v: int) -> (FheUint8, FheUint8, bool):
+        '''
+        Same as `DivAndRem` but divisor is plaintext `v`. div_error flag is a python bool.
+        '''
+        assert 0 <= v <= 255
+        if v == 0:
+            return (FheUint8(bits=[True for _ in range(8)]), FheUint8(bits=list(self.bits)), True)
+        (quotient, remainder) = arbitrary_unsigned_scalar_division(a=self.bits, d=v)
+        return (FheUint8(bits=quotient), FheUint8(bits=remainder), False)
+
+    def ScalarGreaterThan(self, v: int) -> bool:
+        assert 0 <= v <= 255
+        return arbitrary_unsigned_bit_comparator(a=self.bits, b=int_to_bits(v, 8))
+
+    def ScalarGreaterThanOrEqualTo(self, v: int) -> bool:
+        return bit_not(self.ScalarLessThan(v))
+
+    def ScalarLessThan(self, v: int) -> bool:
+        assert 0 <= v <= 255
+        return arbitrary_unsigned_bit_comparator(a=int_to_bits(v, 8), b=self.bits)
+
+    def ScalarLessThanOrEqualTo(self, v: int) -> bool:
+        return bit_not(self.ScalarGreaterThan(v))
+
+    def ScalarEquals(self, v: int) -> bool:
+        assert 0 <= v <= 255
+        return arbitrary_bit_equality(a=self.bits, b=int_to_bits(v, 8))
+
+class FheUintN:
+    '''
+    Unsigned integer of LIMBS 8 bit limbs (see `limb_adder`, `limb_compare` and `limb_mul`). Use one of the subclasses
+    FheUint16, FheUint32 and FheUint64. `bits` are little-endian as in FheUint8, limb i is bits [8i, 8i+8).
+    '''
+    LIMBS = None
+
+    def __init__(self, bits: [bool]):
+        assert len(bits) == LIMB_BITS*self.LIMBS
+        self.bits = bits
+
+    @classmethod
+    def width(cls) -> int:
+        return LIMB_BITS*cls.LIMBS
+
+    @classmethod
+    def from_uint(cls, v: int):
+        assert 0 <= v < (1 << cls.width())
+        return cls(bits=int_to_bits(v, cls.width()))
+
+    def to_uint(self) -> int:
+        # bool() evaluates bits of lazy values (see lazy.py)
+        return sum(1 << i for (i, b) in enumerate(self.bits) if bool(b))
+
+    def limbs(self) -> [FheUint8]:
+        return [FheUint8(bits=l) for l in split_limbs(self.bits)]
+
+    def Add(self, b: FheUintN) -> (FheUintN, bool):
+        '''
+        Adds two unsigned integers. Overflow flag is the carry out as in `FheUint8.Add`
+        '''
+        (out, carry) = limb_adder(a=self.bits, b=b.bits, carry_in=False)
+        return (type(self)(bits=out), carry)
+
+    def Sub(self, b: FheUintN) -> (FheUintN, bool):
+        '''
+        Subtracts two unsigned integers. Overflow flag is set when b > a as in `FheUint8.Sub`
+        '''
+        (out, carry) = limb_subtractor(a=self.bits, b=b.bits, borrow_in=False)
+        return (type(self)(bits=out), bit_not(carry))
+
+    def Mul(self, b: FheUintN) -> FheUintN:
+        return type(self)(bits=limb_mul(a=self.bits, b=b.bits))
+
+    def DivAndRem(self, b: FheUintN, algorithm='restoring') -> (FheUintN, FheUintN, bool):
+        '''
+        Same as `FheUint8.DivAndRem`. Division is over all bits (see `unsigned_division`), not over limbs.
+        '''
+        div_error = is_zero(a=b.bits)
+        (quotient, remainder) = unsigned_division(a=self.bits, b=b.bits, algorithm=algorithm)
+        return (type(self)(bits=quotient), type(self)(bits=remainder), div_error)
+
+    def Compare(self, b: FheUintN) -> (bool, bool, bool):
+        '''
+        Returns (a < b, a == b, a > b)
+        '''
+        return limb_compare(a=self.bits, b=b.bits)
+
+    def GreaterThan(self, b: FheUintN) -> bool:
+        return self.Compare(b)[2]
+
+    def GreaterThanOrEqualTo(self, b: FheUintN) -> bool:
+        return bit_not(self.LessThan(b))
+
+    def LessThan(self, b: FheUintN) -> bool:
+        return b.GreaterThan(self)
+
+    def LessThanOrEqualTo(self, b: FheUintN) -> bool:
+        return bit_not(self.GreaterThan(b))
+
+    def Equals(self, b: FheUintN) -> bool:
+        # limbs are compared independently, then combined with a balanced tree
+        return bit_not(any_bit([bit_not(x.Equals(y)) for (x, y) in zip(self.limbs(), b.limbs())]))
+
+    def MinMax(self, b: FheUintN) -> (FheUintN, FheUintN):
+        (min_bits, max_bits) = arbitrary_min_max(a=self.bits, b=b.bits, a_gt_b=self.GreaterThan(b))
+        return (type(self)(bits=min_bits), type(self)(bits=max_bits))
+
+    def Min(self, b: FheUintN) -> FheUintN:
+        return self.MinMax(b)[0]
+
+    def Max(self, b: FheUintN) -> FheUintN:
+        return self.MinMax(b)[1]
+
+    def Select(cond: bool, a: FheUintN, b: FheUintN) -> FheUintN:
+        '''
+        Returns `a` when encrypted bit `cond` is True, otherwise returns `b`. Called on the class, i.e. `FheUint32.Select(cond, a, b)`.
+        '''
+        return type(a)(bits=mux_bool_vec(bit=cond, a=a.bits, b=b.bits))
+
+    def BitAnd(self, b: FheUintN) -> FheUintN:
+        return type(self)(bits=[x & y for (x, y) in zip(self.bits, b.bits)])
+
+    def BitOr(self, b: FheUintN) -> FheUintN:
+        return type(self)(bits=[x | y for (x, y) in zip(self.bits, b.bits)])
+
+    def BitXor(self, b: FheUintN) -> FheUintN:
+        return type(self)(bits=[x ^ y for (x, y) in zip(self.bits, b.bits)])
+
+    def BitNot(self) -> FheUintN:
+        return type(self)(bits=[bit_not(x) for x in self.bits])
+
+class FheUint16(FheUintN):
+    LIMBS = 2
+
+class FheUint32(FheUintN):
+    LIMBS = 4
+
+class FheUint64(FheUintN):
+    LIMBS = 8
+
 def unsigned_tests():
     # Unsigned integers
     for i in range(256):
@@ -665,6 +1980,23 @@ def uint8_to_int8(v: int) -> int:
         else:
             return v
 
+def operand_pairs(i: int, j: int):
+    '''
+    Yields (cls, x, y, a, b, value) for the uint8 pair i, j as FheUint8 and as FheInt8 operands, where x, y are the
+    plaintexts, a, b the encrypted operands and `value` decrypts an output of `cls`.
+    '''
+    yield (FheUint8, i, j, FheUint8.from_uint8(i), FheUint8.from_uint8(j), FheUint8.to_uint8)
+    (x, y) = (uint8_to_int8(i), uint8_to_int8(j))
+    yield (FheInt8, x, y, FheInt8.from_int8(x), FheInt8.from_int8(y), FheInt8.to_int8)
+
+def sampled_pairs(count=2000, seed=0) -> [(int, int)]:
+    '''
+    Returns all pairs of the uint8 edge values (0, 1, 127, 128, 255) and `count` random uint8 pairs.
+    '''
+    rng = np.random.default_rng(seed)
+    edges = [0, 1, 127, 128, 255]
+    return [(i, j) for i in edges for j in edges] + [(int(i), int(j)) for (i, j) in rng.integers(0, 256, (count, 2))]
+
 def signed_tests():
     # Signed integers
     for i_unsigned in range(256):
@@ -730,6 +2062,183 @@ def signed_tests():
             assert fhe_i.LessThanOrEqualTo(b=fhe_j) == (i<=j)
             assert fhe_i.GreaterThanOrEqualTo(b=fhe_j) == (i>=j)
 
+def scalar_tests():
+    # Scalar operations against their encrypted-operand counterparts
+    for (i, v) in sampled_pairs():
+        for (cls, x, y, a, b, value) in operand_pairs(i, v):
+            for op in ['Add', 'Sub']:
+                (want, want_overflow) = getattr(a, op)(b)
+                (got, overflow) = getattr(a, 'Scalar' + op)(y)
+                assert (value(want), want_overflow) == (value(got), overflow), f'{cls.__name__}.Scalar{op}({x}, {y})'
+
+            assert value(a.Mul(b)) == value(a.ScalarMul(y)), f'{cls.__name__}.ScalarMul({x}, {y})'
+
+            (want_q, want_r, want_error) = a.DivAndRem(b)
+            (q, r, div_error) = a.ScalarDivAndRem(y)
+            assert (value(want_q), value(want_r), want_error) == (value(q), value(r), div_error), f'{cls.__name__}.ScalarDivAndRem({x}, {y})'
+
+            for op in ['GreaterThan', 'GreaterThanOrEqualTo', 'LessThan', 'LessThanOrEqualTo', 'Equals']:
+                assert getattr(a, op)(b) == getattr(a, 'Scalar' + op)(y), f'{cls.__name__}.Scalar{op}({x}, {y})'
+
+def fused_tests():
+    # Fused operations against separate comparisons
+    bounds = [0, 1, 5, 100, 127, 128, 200, 255]
+    for (i, j) in sampled_pairs():
+        for (cls, x, y, a, b, value) in operand_pairs(i, j):
+            assert a.Compare(b) == (x < y, x == y, x > y), f'{cls.__name__}.Compare({x}, {y})'
+            assert value(a.Min(b)) == min(x, y) and value(a.Max(b)) == max(x, y)
+            (lo, hi) = a.MinMax(b)
+            assert (value(lo), value(hi)) == (min(x, y), max(x, y)), f'{cls.__name__}.MinMax({x}, {y})'
+            for cond in [True, False]:
+                assert value(cls.Select(cond, a, b)) == (x if cond else y)
+
+    for i in range(256):
+        for lo in bounds:
+            for hi in bounds:
+                if lo > hi:
+                    continue
+                x = FheUint8.from_uint8(i).Clamp(FheUint8.from_uint8(lo), FheUint8.from_uint8(hi))
+                assert x.to_uint8() == min(max(i, lo), hi), f'FheUint8.Clamp({i}, {lo}, {hi})'
+
+                si = uint8_to_int8(i)
+                (slo, shi) = sorted([uint8_to_int8(lo), uint8_to_int8(hi)])
+                x = FheInt8.from_int8(si).Clamp(FheInt8.from_int8(slo), FheInt8.from_int8(shi))
+                assert x.to_int8() == min(max(si, slo), shi), f'FheInt8.Clamp({si}, {slo}, {shi})'
+
+def bitwise_tests():
+    for (i, j) in sampled_pairs():
+        for (cls, x, y, a, b, value) in operand_pairs(i, j):
+            wrap = (lambda v: v % 256) if cls == FheUint8 else (lambda v: uint8_to_int8(v % 256))
+
+            assert value(a.BitAnd(b)) == x & y and value(a.BitOr(b)) == x | y and value(a.BitXor(b)) == x ^ y
+            assert value(a.BitNot()) == wrap(~x)
+
+            k = j % 8
+            rotl = ((i << k) | (i >> (8 - k))) % 256
+            rotr = ((i >> k) | (i << (8 - k))) % 256
+            for (op, want) in [('Shl', wrap(x << k)), ('Shr', x >> k), ('RotateLeft', wrap(rotl)), ('RotateRight', wrap(rotr))]:
+                assert value(getattr(a, op)(b)) == want, f'{cls.__name__}.{op}({x}, {y})'
+                assert value(getattr(a, 'Scalar' + op)(y)) == want, f'{cls.__name__}.Scalar{op}({x}, {y})'
+
+def accumulation_tests():
+    rng = np.random.default_rng(0)
+    for (cls, lo, hi) in [(FheUint8, 0, 255), (FheInt8, -128, 127)]:
+        encrypt = FheUint8.from_uint8 if cls == FheUint8 else FheInt8.from_int8
+        value = (lambda o: o.to_uint8()) if cls == FheUint8 else (lambda o: o.to_int8())
+        wrap = (lambda v: v % 256) if cls == FheUint8 else (lambda v: uint8_to_int8(v % 256))
+        for n in [0, 1, 2, 3, 17, 100]:
+            for _ in range(5):
+                xs = [int(v) for v in rng.integers(lo, hi+1, n)]
+                ws = [int(v) for v in rng.integers(lo, hi+1, n)]
+                plain = [i % 2 == 0 for i in range(n)]
+                enc_xs = [encrypt(v) for v in xs]
+                mixed_ws = [w if p else encrypt(w) for (w, p) in zip(ws, plain)]
+
+                for (got, want) in [(lambda o: cls.Sum(enc_xs, overflow=o), sum(xs)), (lambda o: cls.Dot(enc_xs, mixed_ws, overflow=o), sum(x*w for (x, w) in zip(xs, ws)))]:
+                    assert value(got('wrap')) == wrap(want)
+                    (out, overflown) = got('flag')
+                    assert value(out) == wrap(want) and overflown == (not lo <= want <= hi)
+                    assert value(got('saturate')) == min(max(want, lo), hi)
+                    wide = got('wide')
+                    wide_value = sum(1 << i for i in range(len(wide)) if wide[i])
+                    if cls == FheInt8 and wide[-1]:
+                        wide_value -= 1 << len(wide)
+                    assert wide_value == want
+
+def popcount_tests():
+    rng = np.random.default_rng(0)
+    for n in list(range(20)) + [63, 64, 65, 300, 1024]:
+        for _ in range(5):
+            a = [bool(v) for v in rng.integers(0, 2, n)]
+            b = [bool(v) for v in rng.integers(0, 2, n)]
+            count = popcount(a)
+            assert len(count) == n.bit_length() and sum(1 << i for i in range(len(count)) if count[i]) == sum(a)
+            distance = hamming_distance(a, b)
+            assert sum(1 << i for i in range(len(distance)) if distance[i]) == sum(x != y for (x, y) in zip(a, b))
+
+    for i in range(256):
+        for j in range(256):
+            assert FheUint8.from_uint8(i).Popcount().to_uint8() == bin(i).count('1')
+            assert FheUint8.from_uint8(i).HammingDistance(FheUint8.from_uint8(j)).to_uint8() == bin(i ^ j).count('1')
+            assert FheInt8.from_int8(uint8_to_int8(i)).Popcount().to_int8() == bin(i).count('1')
+
+def lut_tests():
+    rng = np.random.default_rng(0)
+    sbox = [int(v) for v in rng.permutation(256)]
+    functions = [lambda x: x, lambda x: 0, lambda x: x*x, lambda x: x//3, lambda x: max(x, 0), lambda x: (x >> 4) | (x << 4), sbox]
+    for f in functions:
+        for (cls, encrypt, value, signed) in [(FheUint8, FheUint8.from_uint8, FheUint8.to_uint8, False), (FheInt8, FheInt8.from_int8, FheInt8.to_int8, True)]:
+            lut = cls.Lut(f)
+            for i in range(256):
+                x = uint8_to_int8(i) if signed else i
+                want = (f(x) if callable(f) else f[x]) % 256
+                assert value(lut(encrypt(x))) % 256 == want, f'{cls.__name__}.Lut({x})'
+
+def division_tests():
+    import random
+
+    rng = random.Random(0)
+
+    def bits(v: int, N: int) -> [bool]:
+        return [bool((v >> i) & 1) for i in range(N)]
+
+    def value(bits: [bool]) -> int:
+        return sum(1 << i for (i, b) in enumerate(bits) if b)
+
+    # Unsigned division of all algorithms at 8, 16 and 32 bits
+    for N in [8, 16, 32]:
+        pairs = [(rng.randrange(1 << N), rng.choice([0, 1, 2, 3, (1 << N) - 1, rng.randrange(1 << (N//2)), rng.randrange(1 << N)])) for _ in range(300)]
+        pairs += [(0, 0), ((1 << N) - 1, 0), ((1 << N) - 1, 1), ((1 << N) - 1, (1 << N) - 1), (1 << (N-1), 3)]
+        for algorithm in DIVISION_ALGORITHMS:
+            for (x, y) in pairs:
+                want = (x // y, x % y) if y != 0 else ((1 << N) - 1, x)
+                (q, r) = unsigned_division(a=bits(x, N), b=bits(y, N), algorithm=algorithm)
+                assert (value(q), value(r)) == want, f'{algorithm}: {x} / {y} at {N} bits'
+
+    # DivAndRem with each algorithm against restoring division
+    for _ in range(500):
+        (i, j) = (rng.randrange(256), rng.choice([0, 1, 255, 128, rng.randrange(256)]))
+        for (cls, x, y, a, b, value8) in operand_pairs(i, j):
+            (want_q, want_r, want_error) = a.DivAndRem(b)
+            for algorithm in DIVISION_ALGORITHMS:
+                (q, r, div_error) = a.DivAndRem(b, algorithm=algorithm)
+                assert (value8(q), value8(r), div_error) == (value8(want_q), value8(want_r), want_error), f'{cls.__name__}.DivAndRem({x}, {y}, {algorithm})'
+            # plaintext divisor
+            (q, r, div_error) = a.DivAndRem(y)
+            assert (value8(q), value8(r), div_error) == (value8(want_q), value8(want_r), want_error), f'{cls.__name__}.DivAndRem({x}, {y})'
+
+def limb_tests():
+    import random
+
+    rng = random.Random(0)
+    for cls in [FheUint16, FheUint32, FheUint64]:
+        M = (1 << cls.width()) - 1
+        for _ in range(200):
+            # limb boundaries: carries across all limbs, equal high limbs
+            x = rng.choice([0, M, M - 255, rng.randrange(M + 1), rng.randrange(256)])
+            y = rng.choice([0, 1, M, x, x ^ 1, rng.randrange(M + 1)])
+            (a, b) = (cls.from_uint(x), cls.from_uint(y))
+            assert a.to_uint() == x
+
+            (out, overflow) = a.Add(b)
+            assert (out.to_uint(), overflow) == ((x + y) & M, x + y > M), f'{cls.__name__}: {x} + {y}'
+            (out, overflow) = a.Sub(b)
+            assert (out.to_uint(), overflow) == ((x - y) & M, y > x), f'{cls.__name__}: {x} - {y}'
+            assert a.Mul(b).to_uint() == (x * y) & M, f'{cls.__name__}: {x} * {y}'
+
+            assert a.Compare(b) == (x < y, x == y, x > y)
+            assert (a.GreaterThan(b), a.GreaterThanOrEqualTo(b), a.LessThan(b), a.LessThanOrEqualTo(b), a.Equals(b)) == (x > y, x >= y, x < y, x <= y, x == y)
+            (lo, hi) = a.MinMax(b)
+            assert (lo.to_uint(), hi.to_uint()) == (min(x, y), max(x, y))
+            assert cls.Select(x > y, a, b).to_uint() == max(x, y)
+            assert (a.BitAnd(b).to_uint(), a.BitOr(b).to_uint(), a.BitXor(b).to_uint(), a.BitNot().to_uint()) == (x & y, x | y, x ^ y, M ^ x)
+
+        if cls.width() <= 32:
+            for _ in range(20):
+                (x, y) = (rng.randrange(M + 1), rng.choice([0, rng.randrange(256), rng.randrange(M + 1)]))
+                (q, r, div_error) = cls.from_uint(x).DivAndRem(cls.from_uint(y))
+                assert (q.to_uint(), r.to_uint(), div_error) == ((x // y, x % y, False) if y else (M, x, True))
+
 # a = FheInt8.from_int8(-128)
 # b = FheInt8.from_int8(-1) 
 # # c = a.Mul(b)
@@ -740,4 +2249,14 @@ def signed_tests():
 # b = FheUint8.from_uint8(11)
 # print(a.GreaterThan(b))
 # print(a.LessThan(b))
-signed_tests()
\ No newline at end of file
+
+if __name__ == '__main__':
+    signed_tests()
+    scalar_tests()
+    fused_tests()
+    bitwise_tests()
+    accumulation_tests()
+    popcount_tests()
+    lut_tests()
+    division_tests()
+    limb_tests()
@@ -0,0 +1,430 @@
+'''
+Tracing of boolean circuits.
+
+Functions in `boolean.py` are written over python bools. Calling them with `Wire`s instead of bools records every gate
+they evaluate into a `Circuit`. For ex,
+
+    circuit = trace_op(FheUint8, 'Add')
+
+records the circuit of `FheUint8.Add` with 16 input bits (8 bits of each operand) and 9 output bits (8 bits of sum and
+the overflow flag).
+
+Gates with a constant (python bool) input are folded while tracing, hence the recorded circuit only contains gates
+whose inputs are other gates or circuit inputs. Wires are numbered in topological order: inputs first and then gates
+in the order they are evaluated.
+
+A traced circuit is only valid for all inputs if the traced function is branch-free, i.e. its python control flow never
+depends on the value of a bit. Branching on (`bool(w)`) or comparing (`w == True`) a traced bit raises TraceError. In
+audit mode (`audit_op`, `trace(..., audit=True)`) such uses are recorded with their location instead.
+'''
+
+from __future__ import annotations
+from enum import Enum
+from boolean import *
+import os
+import traceback
+
+class GateKind(Enum):
+    AND = 0
+    OR = 1
+    XOR = 2
+    NOT = 3
+
+class TraceError(Exception):
+    pass
+
+class Wire:
+    '''
+    A bit of a circuit that is being traced
+    '''
+    __slots__ = ('circuit', 'id')
+
+    def __init__(self, circuit: Circuit, id: int):
+        self.circuit = circuit
+        self.id = id
+
+    def __and__(self, other):
+        return self.circuit.gate(GateKind.AND, self, other)
+
+    def __or__(self, other):
+        return self.circuit.gate(GateKind.OR, self, other)
+
+    def __xor__(self, other):
+        return self.circuit.gate(GateKind.XOR, self, other)
+
+    def __invert__(self):
+        return self.circuit.gate(GateKind.NOT, self)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    def __bool__(self):
+        return self.circuit.data_dependent(f'Value of traced bit w{self.id} is unknown. Circuits must not branch on their inputs')
+
+    def __eq__(self, other):
+        # for ex, `if a[i] == True` would silently take the False branch for every traced bit
+        return self.circuit.data_dependent(f'Traced bit w{self.id} compared with {other!r}. Use `is` for public constants')
+
+    __ne__ = __eq__
+    __hash__ = object.__hash__
+
+    # Wires are immutable. Copying a wire must not copy the circuit.
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return f'w{self.id}'
+
+class Circuit:
+    '''
+    A boolean circuit.
+
+    - `inputs`: ids of input wires
+    - `gates`: list of (kind, out, a, b) in topological order. `b` is None for NOT gates
+    - `outputs`: ids of output wires, or python bools for outputs that are constant
+    - `layout`: describes how outputs are grouped into return values of the traced function (see `flatten`)
+    - `input_widths`: describes how inputs are grouped into arguments of the traced function
+    - `findings`: data-dependent python control flow found while tracing in audit mode. None if not in audit mode
+    '''
+    # type of wires created by the circuit
+    wire_type = Wire
+
+    def __init__(self, audit=False):
+        self.n_wires = 0
+        self.inputs = []
+        self.gates = []
+        self.outputs = []
+        self.layout = None
+        self.input_widths = None
+        self.findings = [] if audit else None
+
+    def data_dependent(self, message: str) -> bool:
+        '''
+        Called when python control flow depends on the value of a traced bit. Raises TraceError, or in audit mode records
+        the finding with its location in the traced code and lets tracing continue as if the bit was False.
+        '''
+        if self.findings is None:
+            raise TraceError(message)
+        # stack ends with: caller -> Wire.__bool__/__eq__ -> data_dependent
+        frame = traceback.extract_stack()[-3]
+        self.findings.append(f'{os.path.basename(frame.filename)}:{frame.lineno} `{frame.line}`: {message}')
+        return False
+
+    def input(self) -> Wire:
+        w = self.wire_type(self, self.n_wires)
+        self.n_wires += 1
+        self.inputs.append(w.id)
+        return w
+
+    def gate(self, kind: GateKind, a, b=None):
+        '''
+        Records gate `kind` over `a` and `b` and returns its output wire.
+
+        If either of the inputs is a python bool, the gate is folded and one of the inputs, its negation or a constant
+        is returned instead.
+        '''
+        if kind == GateKind.NOT:
+            if not isinstance(a, Wire):
+                return not a
+            return self._record(kind, a, None)
+
+        if not isinstance(a, Wire):
+            (a, b) = (b, a)
+        if not isinstance(b, Wire):
+            b = bool(b)
+            match kind:
+                case GateKind.AND:
+                    return a if b else False
+                case GateKind.OR:
+                    return True if b else a
+                case GateKind.XOR:
+                    return self.gate(GateKind.NOT, a) if b else a
+
+        assert a.circuit is self and b.circuit is self, 'Cannot mix wires of different circuits'
+        return self._record(kind, a, b)
+
+    def _record(self, kind: GateKind, a: Wire, b: Wire) -> Wire:
+        out = self.wire_type(self, self.n_wires)
+        self.n_wires += 1
+        self.gates.append((kind, out.id, a.id, None if b is None else b.id))
+        return out
+
+    def evaluate(self, inputs: [bool]) -> [bool]:
+        '''
+        Evaluates the circuit gate by gate on `inputs` and returns output bits
+        '''
+        assert len(inputs) == len(self.inputs)
+        values = [False for _ in range(self.n_wires)]
+        for (i, v) in zip(self.inputs, inputs):
+            values[i] = v
+        for (kind, out, a, b) in self.gates:
+            match kind:
+                case GateKind.AND:
+                    values[out] = values[a] & values[b]
+                case GateKind.OR:
+                    values[out] = values[a] | values[b]
+                case GateKind.XOR:
+                    values[out] = values[a] ^ values[b]
+                case GateKind.NOT:
+                    values[out] = bit_not(values[a])
+        return [o if isinstance(o, bool) else values[o] for o in self.outputs]
+
+    def gate_counts(self) -> dict:
+        counts = {kind: 0 for kind in GateKind}
+        for (kind, _, _, _) in self.gates:
+            counts[kind] += 1
+        return counts
+
+    def levels(self) -> [int]:
+        '''
+        Returns level of each gate (in the order of `gates`). Inputs are at level 0 and a gate is one level above its
+        deepest input. Gates at the same level are independent of each other.
+        '''
+        wire_level = [0 for _ in range(self.n_wires)]
+        out = []
+        for (_, o, a, b) in self.gates:
+            l = 1 + max(wire_level[a], 0 if b is None else wire_level[b])
+            wire_level[o] = l
+            out.append(l)
+        return out
+
+    def depth(self) -> int:
+        '''
+        Returns max. no. of bootstrapped gates on any path from an input to an output. NOT gates do not require a
+        bootstrap (negation of LWE ciphertext is free) and do not add to the depth.
+        '''
+        wire_depth = [0 for _ in range(self.n_wires)]
+        for (kind, o, a, b) in self.gates:
+            d = max(wire_depth[a], 0 if b is None else wire_depth[b])
+            wire_depth[o] = d if kind == GateKind.NOT else d + 1
+        return max([wire_depth[o] for o in self.outputs if not isinstance(o, bool)], default=0)
+
+    def stats(self) -> dict:
+        '''
+        Returns no. of gates of each kind, no. of bootstraps (all gates except NOT) and depth
+        '''
+        counts = self.gate_counts()
+        return {
+            **{kind.name: c for (kind, c) in counts.items()},
+            'bootstraps': len(self.gates) - counts[GateKind.NOT],
+            'depth': self.depth(),
+        }
+
+# Encrypted integer types that can be passed to and returned from traced functions: name -> (class, width, signed)
+FHE_TYPES = {
+    'FheUint8': (FheUint8, 8, False),
+    'FheInt8': (FheInt8, 8, True),
+    'FheUint16': (FheUint16, 16, False),
+    'FheUint32': (FheUint32, 32, False),
+    'FheUint64': (FheUint64, 64, False),
+}
+
+def flatten(value) -> ([bool], tuple):
+    '''
+    Flattens return value of a circuit (bits, lists and tuples of bits and encrypted integers) into a list of bits.
+    Returns (bits, layout) where `layout` is required to restore the value with `unflatten`.
+    '''
+    name = type(value).__name__
+    if name in FHE_TYPES:
+        return (list(value.bits), (name,))
+    if isinstance(value, (list, tuple)):
+        bits = []
+        children = []
+        for v in value:
+            (b, l) = flatten(v)
+            bits += b
+            children.append(l)
+        return (bits, ('tuple' if isinstance(value, tuple) else 'list', tuple(children)))
+    return ([value], ('bit',))
+
+def unflatten(bits, layout: tuple):
+    '''
+    Inverse of `flatten`. `bits` is an iterator over the output bits.
+    '''
+    match layout[0]:
+        case 'bit':
+            return next(bits)
+        case 'tuple':
+            return tuple(unflatten(bits, l) for l in layout[1])
+        case 'list':
+            return [unflatten(bits, l) for l in layout[1]]
+    (cls, width, _) = FHE_TYPES[layout[0]]
+    return cls(bits=[next(bits) for _ in range(width)])
+
+def trace(fn, widths: [int], audit=False) -> Circuit:
+    '''
+    Traces `fn` called with one list of input bits per width in `widths` and returns the recorded circuit.
+
+    If `audit` is set, data-dependent python control flow does not raise and is recorded in `circuit.findings` instead.
+    '''
+    circuit = Circuit(audit=audit)
+    args = [[circuit.input() for _ in range(w)] for w in widths]
+    (bits, layout) = flatten(fn(*args))
+    circuit.outputs = [b.id if isinstance(b, Wire) else bool(b) for b in bits]
+    circuit.layout = layout
+    circuit.input_widths = list(widths)
+    return circuit
+
+def trace_op(cls, op: str) -> Circuit:
+    '''
+    Traces binary operation `op` (for ex, 'Add') of encrypted integer type `cls`
+    '''
+    (_, width, _) = FHE_TYPES[cls.__name__]
+    return trace(lambda a, b: getattr(cls(bits=a), op)(cls(bits=b)), [width, width])
+
+def audit_op(cls, op: str) -> [str]:
+    '''
+    Returns data-dependent python control flow (for ex, `if` or `==` over bits of the operands) in binary operation `op`
+    of encrypted integer type `cls`. Empty if `op` is branch-free, i.e. its traced circuit is valid for all inputs.
+    '''
+    (_, width, _) = FHE_TYPES[cls.__name__]
+    return trace(lambda a, b: getattr(cls(bits=a), op)(cls(bits=b)), [width, width], audit=True).findings
+
+def trace_scalar_op(cls, op: str, v: int) -> Circuit:
+    '''
+    Traces scalar operation `op` (for ex, 'ScalarAdd') of encrypted integer type `cls` with plaintext operand `v`. The
+    circuit has a single operand and is specialised to `v`.
+    '''
+    (_, width, _) = FHE_TYPES[cls.__name__]
+    return trace(lambda a: getattr(cls(bits=a), op)(v), [width])
+
+def division_report(widths=(8, 16, 32)):
+    '''
+    Prints gate counts and depth of `unsigned_division` with each algorithm of DIVISION_ALGORITHMS for `widths` bits,
+    and of FheUint8.ScalarDivAndRem by 7 for comparison
+    '''
+    print(f"{'algorithm':<16}{'width':>6}{'gates':>8}{'bootstraps':>12}{'depth':>8}")
+    for w in widths:
+        for algorithm in DIVISION_ALGORITHMS:
+            s = trace(lambda a, b: unsigned_division(a, b, algorithm=algorithm), [w, w]).stats()
+            print(f"{algorithm:<16}{w:>6}{s['bootstraps'] + s['NOT']:>8}{s['bootstraps']:>12}{s['depth']:>8}")
+    s = trace_scalar_op(FheUint8, 'ScalarDivAndRem', 7).stats()
+    print(f"{'scalar (by 7)':<16}{8:>6}{s['bootstraps'] + s['NOT']:>8}{s['bootstraps']:>12}{s['depth']:>8}")
+
+def limb_report(classes=(FheUint16, FheUint32, FheUint64), ops=('Add', 'Compare', 'Mul')):
+    '''
+    Prints gate counts and depth of ops of multi-limb types against the same op over all bits at once (ripple carry
+    adder, bit comparator, carry-save multiplier)
+    '''
+    flat = {
+        'Add': lambda a, b: arbitrary_bit_adder(a, b, False)[:2],
+        'Compare': arbitrary_unsigned_bit_compare,
+        'Mul': lambda a, b: arbitrary_weighted_sum([(a[i] & b[j], 1 << (i+j)) for i in range(len(a)) for j in range(len(b)) if i+j < len(a)], 0, len(a)),
+    }
+    print(f"{'type':<11}{'op':<9}{'bootstraps':>12}{'depth':>7}{'flat bootstraps':>17}{'flat depth':>12}")
+    for cls in classes:
+        (_, width, _) = FHE_TYPES[cls.__name__]
+        for op in ops:
+            s = trace_op(cls, op).stats()
+            f = trace(flat[op], [width, width]).stats()
+            print(f"{cls.__name__:<11}{op:<9}{s['bootstraps']:>12}{s['depth']:>7}{f['bootstraps']:>17}{f['depth']:>12}")
+
+def circuit_tests():
+    for cls in [FheUint8, FheInt8]:
+        for op in ['Add', 'Sub', 'Mul', 'DivAndRem', 'GreaterThan', 'LessThanOrEqualTo', 'Equals']:
+            circuit = trace_op(cls, op)
+            for (i, j) in [(0, 0), (1, 0), (200, 3), (255, 255), (128, 255), (77, 13), (13, 77)]:
+                a = cls(bits=[((i >> k) & 1) == 1 for k in range(8)])
+                b = cls(bits=[((j >> k) & 1) == 1 for k in range(8)])
+                want = flatten(getattr(a, op)(b))[0]
+                got = circuit.evaluate(a.bits + b.bits)
+                assert want == got, f'{cls.__name__}.{op}({i}, {j}): want {want} but got {got}'
+
+    # scalar ops only require a fraction of the bootstraps of encrypted-operand ops
+    for cls in [FheUint8, FheInt8]:
+        for op in ['Add', 'Sub', 'Mul', 'DivAndRem', 'GreaterThan', 'Equals']:
+            encrypted = trace_op(cls, op).stats()['bootstraps']
+            for v in [0, 1, 3, 7, 100, -5]:
+                if cls == FheUint8 and v < 0:
+                    continue
+                circuit = trace_scalar_op(cls, 'Scalar' + op, v)
+                assert circuit.stats()['bootstraps'] < encrypted, f'{cls.__name__}.Scalar{op}({v})'
+                for i in [0, 1, 77, 127, 128, 200, 255]:
+                    a = cls(bits=[((i >> k) & 1) == 1 for k in range(8)])
+                    assert flatten(getattr(a, 'Scalar' + op)(v))[0] == circuit.evaluate(a.bits)
+
+    # fused operations share a single comparator
+    for cls in [FheUint8, FheInt8]:
+        separate = sum(trace_op(cls, op).stats()['bootstraps'] for op in ['LessThan', 'Equals', 'GreaterThan'])
+        assert trace_op(cls, 'Compare').stats()['bootstraps'] < separate
+        separate = trace_op(cls, 'Min').stats()['bootstraps'] + trace_op(cls, 'Max').stats()['bootstraps']
+        assert trace_op(cls, 'MinMax').stats()['bootstraps'] < separate
+
+    # shifts by a plaintext amount are rewirings, by an encrypted amount a barrel shifter of log2(8) mux stages
+    for cls in [FheUint8, FheInt8]:
+        for op in ['Shl', 'Shr', 'RotateLeft', 'RotateRight']:
+            for v in range(8):
+                assert len(trace_scalar_op(cls, 'Scalar' + op, v).gates) == 0
+            stats = trace_op(cls, op).stats()
+            assert stats['depth'] <= 2*3 and stats['bootstraps'] < trace_op(cls, 'Mul').stats()['bootstraps'], stats
+
+    # carry-save accumulation resolves carries once instead of once per addition
+    def chained_sum(*values):
+        acc = FheUint8(bits=values[0])
+        for v in values[1:]:
+            (acc, _) = acc.Add(FheUint8(bits=v))
+        return acc
+    chained = trace(chained_sum, [8]*16).stats()
+    tree = trace(lambda *values: FheUint8.Sum([FheUint8(bits=v) for v in values]), [8]*16).stats()
+    assert tree['bootstraps'] <= chained['bootstraps'] and tree['depth'] < chained['depth'], (tree, chained)
+
+    # popcount with an adder tree of minimum width against chained 8 bit additions of each bit
+    def chained_popcount(bits):
+        acc = FheUint8(bits=[False for _ in range(8)])
+        for b in bits:
+            (acc, _) = acc.Add(FheUint8(bits=[b] + [False for _ in range(7)]))
+        return acc
+    chained = trace(chained_popcount, [200]).stats()
+    tree = trace(popcount, [200]).stats()
+    assert tree['bootstraps'] < chained['bootstraps'] and tree['depth'] < chained['depth'], (tree, chained)
+
+    # synthesized lookup tables against arithmetic
+    for (f, op) in [(lambda x: x*x, lambda a: a.Mul(a)), (lambda x: x//3, lambda a: a.ScalarDivAndRem(3)[0])]:
+        plan = best_lut_plan(lut_table(f, signed=False))
+        lut = trace(lambda a: FheUint8.Lut(f)(FheUint8(bits=a)), [8]).stats()
+        assert lut['bootstraps'] == plan.cost < trace(lambda a: op(FheUint8(bits=a)), [8]).stats()['bootstraps']
+
+    # multi-limb types: depth grows with log(no. of limbs) over the 8 bit circuits
+    for op in ['Add', 'Compare', 'Mul']:
+        depths = [trace_op(cls, op).depth() for cls in [FheUint16, FheUint32, FheUint64]]
+        assert depths[2] - depths[1] <= depths[1] - depths[0] + 2 * (op == 'Mul'), (op, depths)
+    assert trace_op(FheUint64, 'Add').depth() < trace(lambda a, b: arbitrary_bit_adder(a, b, False)[:2], [64, 64]).depth()
+    assert trace_op(FheUint64, 'Compare').depth() < trace(arbitrary_unsigned_bit_compare, [64, 64]).depth()
+    for cls in [FheUint16, FheUint32, FheUint64]:
+        circuit = trace_op(cls, 'Add')
+        x = cls.from_uint((1 << cls.width()) - 1).bits + cls.from_uint(1).bits
+        assert circuit.evaluate(x) == flatten(cls(bits=x[:cls.width()]).Add(cls(bits=x[cls.width():])))[0]
+
+    # ops must be branch-free
+    for cls in [FheUint8, FheInt8, FheUint16, FheUint32]:
+        for op in ['Add', 'Sub', 'Mul', 'DivAndRem', 'GreaterThan', 'LessThanOrEqualTo', 'Equals', 'Compare', 'MinMax']:
+            assert audit_op(cls, op) == [], f'{cls.__name__}.{op}: {audit_op(cls, op)}'
+    def branchy(a):
+        return [a[1] if a[0] == True else False, bit_not(a[1]) if a[0] else a[1]]
+    findings = trace(branchy, [2], audit=True).findings
+    assert len(findings) == 2 and all('circuit.py' in f and 'if a[0]' in f for f in findings), findings
+    try:
+        trace(branchy, [2])
+        assert False
+    except TraceError:
+        pass
+
+    # constant folding
+    circuit = Circuit()
+    w = circuit.input()
+    assert (w & False) is False and (w | True) is True and (w ^ False) is w and (w & True) is w
+    assert len(circuit.gates) == 0
+    try:
+        bool(w)
+        assert False
+    except TraceError:
+        pass
+
+if __name__ == '__main__':
+    circuit_tests()
+    division_report()
+    limb_report()
@@ -0,0 +1,252 @@
+'''
+Compiles traced circuits to straight-line python functions.
+
+Evaluating an operation of `FheUint8`/`FheInt8` with python bools goes through deep trees of python calls (for ex,
+`DivAndRem` -> `arbitrary_unsigned_division` -> `arbitrary_bit_subtractor` -> `arbitrary_bit_adder` -> `full_adder`).
+Instead, we trace the operation once and generate a single function with one statement per gate:
+
+    def circuit(x):
+        (w0, w1, ..., w15,) = x
+        w16 = w0 ^ w8
+        w17 = w0 & w8
+        ...
+        return [w16, ...]
+
+Two backends are supported:
+    - python: each wire is a python bool
+    - numpy: each wire is a numpy bool array (bit-sliced). Bit i of the k^th array is bit k of the i^th operand, hence
+      a single call evaluates the circuit on all operands in the arrays.
+
+Compiled functions are cached per (operation, width, backend) in memory and on disk (in CACHE_DIR). Disk cache entries
+are invalidated whenever source of boolean.py, circuit.py or compiler.py changes.
+'''
+
+from __future__ import annotations
+from circuit import *
+import hashlib
+import marshal
+import os
+import pickle
+import sys
+
+BACKENDS = ('python', 'numpy')
+
+CACHE_DIR = os.environ.get('BOOL_API_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.compiled'))
+
+# (name, width, backend) -> (function, layout)
+_COMPILED = {}
+_VERSION = None
+
+def generate_source(circuit: Circuit, backend: str, name='circuit') -> str:
+    '''
+    Returns source of a straight-line function that evaluates `circuit` with `backend`. The function takes list of
+    input bits and returns list of output bits.
+    '''
+    assert backend in BACKENDS
+
+    lines = [f'def {name}(x):']
+    if len(circuit.inputs) != 0:
+        lines.append(f"    ({''.join(f'w{i}, ' for i in circuit.inputs)}) = x")
+    for (kind, out, a, b) in circuit.gates:
+        match kind:
+            case GateKind.AND:
+                expr = f'w{a} & w{b}'
+            case GateKind.OR:
+                expr = f'w{a} | w{b}'
+            case GateKind.XOR:
+                expr = f'w{a} ^ w{b}'
+            case GateKind.NOT:
+                expr = f'not w{a}' if backend == 'python' else f'~w{a}'
+        lines.append(f'    w{out} = {expr}')
+
+    outputs = []
+    for o in circuit.outputs:
+        if not isinstance(o, bool):
+            outputs.append(f'w{o}')
+        elif backend == 'python':
+            outputs.append(repr(o))
+        else:
+            # constant outputs must have the same shape as the inputs
+            outputs.append(f'np.full(np.shape(x[0]), {o})')
+    lines.append(f"    return [{', '.join(outputs)}]")
+    return '\n'.join(lines) + '\n'
+
+def compile_circuit(circuit: Circuit, backend='python'):
+    '''
+    Returns straight-line function that evaluates `circuit` with `backend`. The function is not cached.
+    '''
+    code = compile(generate_source(circuit, backend), '<circuit>', 'exec')
+    return _load(code)
+
+def _load(code):
+    namespace = {'np': np}
+    exec(code, namespace)
+    return namespace['circuit']
+
+def _version() -> str:
+    global _VERSION
+    if _VERSION is None:
+        h = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for f in ['boolean.py', 'circuit.py', 'compiler.py']:
+            with open(os.path.join(directory, f), 'rb') as file:
+                h.update(file.read())
+        _VERSION = h.hexdigest()
+    return _VERSION
+
+def compiled(name: str, width: int, backend: str, build) -> (object, tuple):
+    '''
+    Returns (function, layout) of the compiled circuit `name` with `width` bit operands for `backend`. `build` is called
+    without arguments to trace the circuit on a cache miss.
+    '''
+    key = (name, width, backend)
+    if key in _COMPILED:
+        return _COMPILED[key]
+
+    path = os.path.join(CACHE_DIR, f'{name}-{width}-{backend}.pickle')
+    entry = None
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except Exception:
+            entry = None
+        if entry is not None and (entry['version'] != _version() or entry['python'] != sys.implementation.cache_tag):
+            entry = None
+
+    if entry is None:
+        circuit = build()
+        code = compile(generate_source(circuit, backend), f'<{name}-{width}-{backend}>', 'exec')
+        entry = {
+            'version': _version(),
+            'python': sys.implementation.cache_tag,
+            'code': marshal.dumps(code),
+            'layout': circuit.layout,
+        }
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # write to a temporary file first so that concurrent readers never see a partial entry
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(entry, f)
+        os.replace(tmp, path)
+
+    _COMPILED[key] = (_load(marshal.loads(entry['code'])), entry['layout'])
+    return _COMPILED[key]
+
+def to_bitslices(values, width: int) -> [np.ndarray]:
+    '''
+    Returns `width` bool arrays where i^th array contains i^th bit (in 2s complement) of each value in `values`
+    '''
+    v = np.asarray(values).astype(np.int64)
+    return [((v >> i) & 1).astype(bool) for i in range(width)]
+
+def from_bitslices(bits: [np.ndarray], signed: bool) -> np.ndarray:
+    '''
+    Inverse of `to_bitslices`. Returns values as integers of smallest numpy type that fits the width.
+    '''
+    width = len(bits)
+    acc = np.zeros(np.shape(bits[0]), dtype=np.uint64)
+    for i in range(width):
+        acc |= np.asarray(bits[i]).astype(np.uint64) << np.uint64(i)
+
+    if width in (8, 16, 32, 64):
+        acc = acc.astype(np.dtype(f'uint{width}'))
+        return acc.view(np.dtype(f'int{width}')) if signed else acc
+
+    acc = acc.astype(np.int64)
+    if signed:
+        acc -= ((acc >> (width-1)) & 1) << width
+    return acc
+
+def unflatten_bitslices(bits, layout: tuple):
+    '''
+    Same as `unflatten` but for bit-sliced outputs. Encrypted integers are returned as arrays of integers.
+    '''
+    match layout[0]:
+        case 'bit':
+            return next(bits)
+        case 'tuple':
+            return tuple(unflatten_bitslices(bits, l) for l in layout[1])
+        case 'list':
+            return [unflatten_bitslices(bits, l) for l in layout[1]]
+    (_, width, signed) = FHE_TYPES[layout[0]]
+    return from_bitslices([next(bits) for _ in range(width)], signed=signed)
+
+def compile_op(cls, op: str, backend='python'):
+    '''
+    Returns compiled version of binary operation `op` of encrypted integer type `cls`.
+
+    With python backend, the returned function takes two instances of `cls` and returns the same value as `cls.op`. With
+    numpy backend, it takes two arrays of integers and returns the same structure as `cls.op` with arrays of integers in
+    place of encrypted integers and bool arrays in place of bits.
+    '''
+    (_, width, _) = FHE_TYPES[cls.__name__]
+    (fn, layout) = compiled(f'{cls.__name__}.{op}', width, backend, lambda: trace_op(cls, op))
+
+    if backend == 'python':
+        def run(a, b):
+            return unflatten(iter(fn(a.bits + b.bits)), layout)
+    else:
+        def run(a, b):
+            return unflatten_bitslices(iter(fn(to_bitslices(a, width) + to_bitslices(b, width))), layout)
+    return run
+
+def compiler_tests():
+    # Exhaustive tests of numpy backend
+    i = np.repeat(np.arange(256), 256)
+    j = np.tile(np.arange(256), 256)
+
+    add = compile_op(FheUint8, 'Add', backend='numpy')
+    (out, overflow) = add(i, j)
+    assert np.all(out == (i+j)%256) and np.all(overflow == ((i+j) > 255))
+
+    sub = compile_op(FheUint8, 'Sub', backend='numpy')
+    (out, overflow) = sub(i, j)
+    assert np.all(out == (i-j)%256) and np.all(overflow == (i < j))
+
+    mul = compile_op(FheUint8, 'Mul', backend='numpy')
+    assert np.all(mul(i, j) == (i*j)%256)
+
+    div = compile_op(FheUint8, 'DivAndRem', backend='numpy')
+    (q, r, div_error) = div(i, j)
+    nz = j != 0
+    assert np.all(q[nz] == i[nz]//j[nz]) and np.all(r[nz] == i[nz]%j[nz])
+    assert np.all(div_error == ~nz) and np.all(q[~nz] == 255) and np.all(r[~nz] == i[~nz])
+
+    for (op, want) in [('GreaterThan', i > j), ('LessThan', i < j), ('Equals', i == j), ('GreaterThanOrEqualTo', i >= j)]:
+        assert np.all(compile_op(FheUint8, op, backend='numpy')(i, j) == want), op
+
+    si = i.astype(np.uint8).view(np.int8).astype(np.int64)
+    sj = j.astype(np.uint8).view(np.int8).astype(np.int64)
+
+    (out, overflow) = compile_op(FheInt8, 'Add', backend='numpy')(si, sj)
+    assert np.all(out == (si+sj).astype(np.int8)) and np.all(overflow == ((si+sj) != (si+sj).astype(np.int8)))
+
+    (out, overflow) = compile_op(FheInt8, 'Sub', backend='numpy')(si, sj)
+    assert np.all(out == (si-sj).astype(np.int8)) and np.all(overflow == ((si-sj) != (si-sj).astype(np.int8)))
+
+    assert np.all(compile_op(FheInt8, 'Mul', backend='numpy')(si, sj) == (si*sj).astype(np.int8))
+
+    (q, r, div_error) = compile_op(FheInt8, 'DivAndRem', backend='numpy')(si, sj)
+    nz = sj != 0
+    want_q = (np.sign(si[nz])*np.sign(sj[nz])*(np.abs(si[nz])//np.abs(sj[nz]))).astype(np.int8)
+    assert np.all(q[nz] == want_q) and np.all(r[nz] == (si[nz] - want_q.astype(np.int64)*sj[nz]).astype(np.int8))
+    assert np.all(div_error == ~nz) and np.all(q[~nz] == -1) and np.all(r[~nz] == si[~nz])
+
+    for (op, want) in [('GreaterThan', si > sj), ('LessThanOrEqualTo', si <= sj), ('Equals', si == sj)]:
+        assert np.all(compile_op(FheInt8, op, backend='numpy')(si, sj) == want), op
+
+    # python backend against the reference implementation
+    div = compile_op(FheInt8, 'DivAndRem', backend='python')
+    for (x, y) in [(-128, -1), (-128, 1), (127, -3), (-7, 2), (5, 0), (0, -9)]:
+        (want_q, want_r, want_err) = FheInt8.from_int8(x).DivAndRem(FheInt8.from_int8(y))
+        (q, r, err) = div(FheInt8.from_int8(x), FheInt8.from_int8(y))
+        assert (q.to_int8(), r.to_int8(), err) == (want_q.to_int8(), want_r.to_int8(), want_err)
+
+    # disk cache
+    _COMPILED.clear()
+    (_, layout) = compiled('FheUint8.DivAndRem', 8, 'numpy', lambda: None)
+    assert layout == (('tuple', (('FheUint8',), ('FheUint8',), ('bit',))))
+
+if __name__ == '__main__':
+    compiler_tests()
@@ -0,0 +1,317 @@
+'''
+Equivalence checking of circuits.
+
+`check(reference, candidate)` decides whether two circuits with the same inputs compute the same outputs, for ex a
+traced op of boolean.py against its optimized version (see lazy.optimize) or a new implementation:
+
+    - exhaustive: circuits with at-most EXHAUSTIVE_INPUTS inputs are evaluated on all assignments, bit-sliced into
+      uint64 words (see stream.py) in chunks of 2^20 assignments. Proves equivalence.
+    - randomized: wider circuits are evaluated on random assignments, plus all-zeros and all-ones. Finds most bugs fast
+      but cannot prove equivalence.
+    - BDD: if randomized evaluation finds no difference, the miter of the two circuits (OR of XORs of their outputs) is
+      built as a reduced ordered BDD. The miter is the constant False iff the circuits are equivalent, else any path
+      to True is a counterexample. Input bits of two same-width operands are interleaved from the most significant bit,
+      which keeps BDDs of adders and comparators linear in width. BDDs of multipliers grow exponentially, hence
+      construction gives up after `max_nodes` nodes and the result is not proven.
+
+Counterexamples are the first assignment (in order of evaluation) on which the circuits differ.
+'''
+
+from __future__ import annotations
+from circuit import *
+from compiler import compile_circuit
+import random
+
+EXHAUSTIVE_INPUTS = 24
+CHUNK_WORDS = 1 << 14
+
+ALL_ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# bit i of word is set iff bit k of i is set, for k < 6
+LANE_PATTERNS = [np.uint64(sum(1 << i for i in range(64) if (i >> k) & 1)) for k in range(6)]
+
+class Result:
+    '''
+    - `equal`: no assignment was found on which circuits differ
+    - `proven`: `equal` holds for all assignments
+    - `method`: 'exhaustive', 'randomized' or 'bdd'
+    - `assignments`: no. of assignments evaluated
+    - `counterexample`: input bits on which circuits differ, or None
+    '''
+    def __init__(self, equal: bool, proven: bool, method: str, assignments: int, counterexample=None):
+        self.equal = equal
+        self.proven = proven
+        self.method = method
+        self.assignments = assignments
+        self.counterexample = counterexample
+
+    def __repr__(self):
+        return f'Result(equal={self.equal}, proven={self.proven}, method={self.method!r}, assignments={self.assignments}, counterexample={self.counterexample})'
+
+def _as_words(outputs: list, shape) -> [np.ndarray]:
+    # constant outputs of compiled circuits are bool arrays
+    return [np.full(shape, ALL_ONES if o.all() else np.uint64(0)) if o.dtype == bool else o for o in outputs]
+
+def _first_difference(reference, candidate, inputs: [np.ndarray]):
+    '''
+    Returns (word, lane) of first lane on which outputs of compiled `reference` and `candidate` differ, or None
+    '''
+    shape = inputs[0].shape
+    diff = np.zeros(shape, dtype=np.uint64)
+    for (x, y) in zip(_as_words(reference(inputs), shape), _as_words(candidate(inputs), shape)):
+        diff |= x ^ y
+    nonzero = np.flatnonzero(diff)
+    if len(nonzero) == 0:
+        return None
+    word = int(nonzero[0])
+    d = int(diff[word])
+    return (word, (d & -d).bit_length() - 1)
+
+def _lane_bits(inputs: [np.ndarray], word: int, lane: int) -> [bool]:
+    return [bool((int(x[word]) >> lane) & 1) for x in inputs]
+
+def exhaustive(reference: Circuit, candidate: Circuit) -> Result:
+    '''
+    Evaluates both circuits on all assignments. Assignment i sets j^th input to bit j of i.
+    '''
+    n = len(reference.inputs)
+    (f, g) = (compile_circuit(reference, 'numpy'), compile_circuit(candidate, 'numpy'))
+    total_words = max(1, (1 << n) >> 6)
+    for start in range(0, total_words, CHUNK_WORDS):
+        words = np.arange(start, min(total_words, start + CHUNK_WORDS), dtype=np.uint64)
+        inputs = []
+        for k in range(n):
+            if k < 6:
+                inputs.append(np.full(len(words), LANE_PATTERNS[k]))
+            else:
+                inputs.append(((words >> np.uint64(k-6)) & np.uint64(1)) * ALL_ONES)
+        found = _first_difference(f, g, inputs)
+        if found is not None:
+            (word, lane) = found
+            return Result(False, True, 'exhaustive', 1 << n, _lane_bits(inputs, word, lane))
+    return Result(True, True, 'exhaustive', 1 << n)
+
+def randomized(reference: Circuit, candidate: Circuit, words=1 << 12, seed=0) -> Result:
+    '''
+    Evaluates both circuits on 64 * `words` random assignments. First word holds all-zeros and all-ones assignments.
+    '''
+    rng = np.random.default_rng(seed)
+    n = len(reference.inputs)
+    inputs = [rng.integers(0, 1 << 64, words, dtype=np.uint64) for _ in range(n)]
+    for x in inputs:
+        # lane 0 is all-zeros, lane 1 is all-ones
+        x[0] = np.uint64(2)
+    found = _first_difference(compile_circuit(reference, 'numpy'), compile_circuit(candidate, 'numpy'), inputs)
+    if found is None:
+        return Result(True, False, 'randomized', 64 * words)
+    return Result(False, True, 'randomized', 64 * words, _lane_bits(inputs, *found))
+
+class BddLimit(Exception):
+    pass
+
+class Bdd:
+    '''
+    Reduced ordered BDD. Node 0 is False, node 1 is True and other nodes are (var, low, high) where var is the position
+    of the variable in the order.
+    '''
+    def __init__(self, n_vars: int, max_nodes: int):
+        self.n_vars = n_vars
+        self.max_nodes = max_nodes
+        self.nodes = [(n_vars, 0, 0), (n_vars, 1, 1)]
+        self.unique = {}
+        self.cache = {}
+
+    def node(self, var: int, low: int, high: int) -> int:
+        if low == high:
+            return low
+        key = (var, low, high)
+        if key not in self.unique:
+            if len(self.nodes) >= self.max_nodes:
+                raise BddLimit
+            self.unique[key] = len(self.nodes)
+            self.nodes.append(key)
+        return self.unique[key]
+
+    def var(self, v: int) -> int:
+        return self.node(v, 0, 1)
+
+    def apply(self, kind: GateKind, f: int, g: int) -> int:
+        match kind:
+            case GateKind.AND:
+                if f == 0 or g == 0:
+                    return 0
+                if f == 1 or f == g:
+                    return g
+                if g == 1:
+                    return f
+            case GateKind.OR:
+                if f == 1 or g == 1:
+                    return 1
+                if f == 0 or f == g:
+                    return g
+                if g == 0:
+                    return f
+            case GateKind.XOR:
+                if f == g:
+                    return 0
+                if f == 0:
+                    return g
+                if g == 0:
+                    return f
+                if f == 1 and g == 1:
+                    return 0
+        if f > g:
+            (f, g) = (g, f)
+        key = (kind, f, g)
+        if key in self.cache:
+            return self.cache[key]
+        (fv, f0, f1) = self.nodes[f]
+        (gv, g0, g1) = self.nodes[g]
+        v = min(fv, gv)
+        (f0, f1) = (f0, f1) if fv == v else (f, f)
+        (g0, g1) = (g0, g1) if gv == v else (g, g)
+        out = self.node(v, self.apply(kind, f0, g0), self.apply(kind, f1, g1))
+        self.cache[key] = out
+        return out
+
+    def negate(self, f: int) -> int:
+        return self.apply(GateKind.XOR, f, 1)
+
+    def satisfying(self, f: int) -> {int: bool}:
+        '''
+        Returns assignment of variables on a path from `f` to True
+        '''
+        assignment = {}
+        while f > 1:
+            (v, low, high) = self.nodes[f]
+            (assignment[v], f) = (False, low) if low != 0 else (True, high)
+        return assignment
+
+def variable_order(circuit: Circuit) -> [int]:
+    '''
+    Returns input positions in BDD variable order: bits of operands of the same width are interleaved from the most
+    significant bit, other inputs follow in order
+    '''
+    widths = circuit.input_widths if circuit.input_widths else [len(circuit.inputs)]
+    offsets = [sum(widths[:i]) for i in range(len(widths))]
+    order = []
+    for w in sorted(set(widths), reverse=True):
+        groups = [o for (o, x) in zip(offsets, widths) if x == w]
+        for bit in range(w-1, -1, -1):
+            order += [o + bit for o in groups]
+    return order
+
+def bdd_miter(reference: Circuit, candidate: Circuit, max_nodes=1 << 20) -> Result:
+    '''
+    Proves equivalence with the BDD of the miter of both circuits. Raises BddLimit if BDD exceeds `max_nodes` nodes.
+    '''
+    order = variable_order(reference)
+    bdd = Bdd(len(order), max_nodes)
+    position = {p: v for (v, p) in enumerate(order)}
+
+    def outputs(circuit: Circuit) -> [int]:
+        value = {}
+        for (p, i) in enumerate(circuit.inputs):
+            value[i] = bdd.var(position[p])
+        for (kind, o, a, b) in circuit.gates:
+            value[o] = bdd.negate(value[a]) if kind == GateKind.NOT else bdd.apply(kind, value[a], value[b])
+        return [int(o) if isinstance(o, bool) else value[o] for o in circuit.outputs]
+
+    miter = 0
+    for (x, y) in zip(outputs(reference), outputs(candidate)):
+        miter = bdd.apply(GateKind.OR, miter, bdd.apply(GateKind.XOR, x, y))
+    if miter == 0:
+        return Result(True, True, 'bdd', 1 << len(order))
+    assignment = bdd.satisfying(miter)
+    return Result(False, True, 'bdd', 1 << len(order), [assignment.get(position[p], False) for p in range(len(order))])
+
+def check(reference: Circuit, candidate: Circuit, words=1 << 12, seed=0, max_nodes=1 << 20) -> Result:
+    '''
+    Returns `Result` of checking equivalence of `candidate` to `reference` (see module doc)
+    '''
+    assert len(reference.inputs) == len(candidate.inputs), 'circuits must have the same inputs'
+    assert len(reference.outputs) == len(candidate.outputs), 'circuits must have the same no. of outputs'
+    if len(reference.inputs) <= EXHAUSTIVE_INPUTS:
+        return exhaustive(reference, candidate)
+    result = randomized(reference, candidate, words, seed)
+    if not result.equal:
+        return result
+    try:
+        return bdd_miter(reference, candidate, max_nodes)
+    except BddLimit:
+        return result
+
+def equivalence_tests():
+    import time
+    from boolean import arbitrary_bit_adder, arbitrary_unsigned_bit_compare
+    from lazy import optimize
+
+    rng = random.Random(0)
+
+    def mutate(circuit: Circuit, k: int) -> Circuit:
+        out = Circuit()
+        out.inputs = list(circuit.inputs)
+        out.n_wires = circuit.n_wires
+        out.gates = list(circuit.gates)
+        (kind, o, a, b) = out.gates[k]
+        out.gates[k] = (GateKind.AND if kind != GateKind.AND else GateKind.OR, o, a, a if b is None else b)
+        out.outputs = circuit.outputs
+        out.layout = circuit.layout
+        out.input_widths = circuit.input_widths
+        return out
+
+    # optimized ops are equivalent, mutated ops are not
+    for cls in [FheUint8, FheInt8]:
+        for op in ['Add', 'Sub', 'Mul', 'DivAndRem', 'Compare', 'MinMax']:
+            circuit = trace_op(cls, op)
+            assert check(circuit, optimize(circuit)).proven
+            for _ in range(3):
+                bad = mutate(circuit, rng.randrange(len(circuit.gates)))
+                result = check(circuit, bad)
+                # a mutated gate may not affect outputs
+                if not result.equal:
+                    x = result.counterexample
+                    assert circuit.evaluate(x) != bad.evaluate(x)
+
+    # 24 inputs are exhaustive in seconds
+    adder = trace(lambda a, b: arbitrary_bit_adder(a, b, False)[0], [12, 12])
+    start = time.monotonic()
+    result = check(adder, optimize(adder))
+    assert result.proven and result.method == 'exhaustive' and result.assignments == 1 << 24
+    assert time.monotonic() - start < 30
+
+    # wide circuits: randomized then BDD
+    for w in [16, 32]:
+        adder = trace(lambda a, b: arbitrary_bit_adder(a, b, False)[:2], [w, w])
+        compare = trace(lambda a, b: arbitrary_unsigned_bit_compare(a, b), [w, w])
+        for circuit in [adder, compare]:
+            result = check(circuit, optimize(circuit))
+            assert result.proven and result.method == 'bdd'
+            bad = mutate(circuit, len(circuit.gates) // 2)
+            result = check(circuit, bad)
+            assert not result.equal and circuit.evaluate(result.counterexample) != bad.evaluate(result.counterexample)
+
+    # difference on a single assignment (a = 0x55555555, b = 0xaaaaaaaa) out of 2^64: only the BDD finds it
+    pattern = [i % 2 == 0 for i in range(32)] + [i % 2 == 1 for i in range(32)]
+    def rare(a, b):
+        s = arbitrary_bit_adder(a, b, False)[0]
+        hit = True
+        for (x, p) in zip(a + b, pattern):
+            hit = hit & (x if p else bit_not(x))
+        return s[:-1] + [s[-1] ^ hit]
+    adder = trace(lambda a, b: arbitrary_bit_adder(a, b, False)[0], [32, 32])
+    result = check(adder, trace(rare, [32, 32]))
+    assert not result.equal and result.method == 'bdd' and result.counterexample == pattern
+
+    # multipliers exceed the BDD limit: not proven
+    def mul(a, b):
+        acc = [False for _ in a]
+        for i in range(len(b)):
+            acc = arbitrary_bit_adder(acc, [False]*i + [x & b[i] for x in a[:len(a)-i]], False)[0]
+        return acc
+    mul = trace(mul, [16, 16])
+    result = check(mul, optimize(mul), max_nodes=1 << 16)
+    assert result.equal and not result.proven and result.method == 'randomized'
+
+if __name__ == '__main__':
+    equivalence_tests()
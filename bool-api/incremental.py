@@ -0,0 +1,143 @@
+'''
+Incremental re-evaluation of circuits.
+
+`Incremental` evaluates a circuit once and keeps values of all wires. On `update` with new inputs, only gates in the
+fan-out cone of inputs whose values changed are re-evaluated, in order of the circuit, and propagation stops at gates
+whose outputs do not change. For ex, a running `Max` over a sliding window of values re-evaluates only the comparisons
+that involve the value that entered the window.
+
+Both backends of compiler.py are supported:
+    - python: each wire is a python bool
+    - numpy: each wire is a numpy bool array (bit-sliced). A gate is re-evaluated if any lane of its operands changed.
+'''
+
+from __future__ import annotations
+from circuit import *
+from compiler import BACKENDS
+import heapq
+
+class Incremental:
+    '''
+    - `values`: value of each wire
+    - `reevaluated`: no. of gates re-evaluated by the last `update`
+    - `total`: no. of gates re-evaluated by all updates
+    '''
+    def __init__(self, circuit: Circuit, inputs: list, backend='python'):
+        assert backend in BACKENDS
+        self.circuit = circuit
+        self.backend = backend
+        self.consumers = [[] for _ in range(circuit.n_wires)]
+        for (g, (_, _, a, b)) in enumerate(circuit.gates):
+            self.consumers[a].append(g)
+            if b is not None and b != a:
+                self.consumers[b].append(g)
+
+        self.values = [None for _ in range(circuit.n_wires)]
+        for (i, v) in zip(circuit.inputs, inputs):
+            self.values[i] = v
+        for g in range(len(circuit.gates)):
+            self.values[circuit.gates[g][1]] = self._gate(g)
+        self.reevaluated = len(circuit.gates)
+        self.total = 0
+
+    def _gate(self, g: int):
+        (kind, _, a, b) = self.circuit.gates[g]
+        x = self.values[a]
+        match kind:
+            case GateKind.AND:
+                return x & self.values[b]
+            case GateKind.OR:
+                return x | self.values[b]
+            case GateKind.XOR:
+                return x ^ self.values[b]
+            case GateKind.NOT:
+                return (not x) if self.backend == 'python' else ~x
+
+    def _changed(self, old, new) -> bool:
+        return old != new if self.backend == 'python' else bool(np.any(old != new))
+
+    def outputs(self) -> list:
+        return [o if isinstance(o, bool) else self.values[o] for o in self.circuit.outputs]
+
+    def update(self, inputs: list) -> list:
+        '''
+        Sets inputs to `inputs`, re-evaluates gates affected by changed inputs and returns outputs
+        '''
+        dirty = []
+        queued = set()
+
+        def push(w: int):
+            for g in self.consumers[w]:
+                if g not in queued:
+                    queued.add(g)
+                    heapq.heappush(dirty, g)
+
+        for (i, v) in zip(self.circuit.inputs, inputs):
+            if self._changed(self.values[i], v):
+                self.values[i] = v
+                push(i)
+
+        self.reevaluated = 0
+        while dirty:
+            g = heapq.heappop(dirty)
+            o = self.circuit.gates[g][1]
+            v = self._gate(g)
+            self.reevaluated += 1
+            if self._changed(self.values[o], v):
+                self.values[o] = v
+                push(o)
+        self.total += self.reevaluated
+        return self.outputs()
+
+def incremental_tests():
+    import random
+    from compiler import to_bitslices
+
+    rng = random.Random(0)
+
+    # running Sum and Max over a sliding window of 8 values
+    window = 8
+    sum_circuit = trace(lambda *xs: FheUint8.Sum([FheUint8(bits=x) for x in xs], overflow='wide'), [8]*window)
+    def running_max(*xs):
+        m = FheUint8(bits=xs[0])
+        for x in xs[1:]:
+            m = m.Max(FheUint8(bits=x))
+        return m
+    max_circuit = trace(running_max, [8]*window)
+
+    for circuit in [sum_circuit, max_circuit]:
+        stream = [rng.randint(0, 255) for _ in range(64)]
+        bits = lambda xs: [b for x in xs for b in FheUint8.from_uint8(x).bits]
+        state = Incremental(circuit, bits(stream[:window]))
+        for t in range(1, len(stream) - window):
+            # ring buffer: the value that leaves the window is replaced by the one that enters it
+            slots = [None]*window
+            for j in range(t, t+window):
+                slots[j % window] = stream[j]
+            out = state.update(bits(slots))
+            assert out == circuit.evaluate(bits(slots))
+            assert state.reevaluated < len(circuit.gates)
+        assert state.total < (len(stream) - window - 1) * len(circuit.gates) // 2
+
+    # unchanged inputs re-evaluate nothing
+    x = [rng.random() < 0.5 for _ in range(16)]
+    state = Incremental(trace_op(FheInt8, 'DivAndRem'), x)
+    state.update(x)
+    assert state.reevaluated == 0
+
+    # bit-sliced backend
+    circuit = trace_op(FheInt8, 'Mul')
+    a = np.array([rng.randint(-128, 127) for _ in range(64)])
+    b = np.array([rng.randint(-128, 127) for _ in range(64)])
+    state = Incremental(circuit, to_bitslices(a, 8) + to_bitslices(b, 8), backend='numpy')
+    for _ in range(8):
+        # a single lane changes
+        b[rng.randrange(64)] = rng.randint(-128, 127)
+        out = state.update(to_bitslices(a, 8) + to_bitslices(b, 8))
+        got = sum(out[i].astype(np.int64) << i for i in range(8))
+        assert np.all((got - (a*b)) % 256 == 0)
+    state.update(to_bitslices(a, 8) + to_bitslices(b, 8))
+    assert state.reevaluated == 0
+
+if __name__ == '__main__':
+    incremental_tests()
@@ -0,0 +1,334 @@
+'''
+Lazy evaluation of programs over encrypted integers.
+
+Operations of `FheUint8`/`FheInt8` evaluate immediately, hence every operation is a separate circuit. In lazy mode,
+operations only record their gates into a `Program` (a circuit whose wires are `LazyWire`s) and evaluation is deferred
+until a value is needed (`to_uint8`/`to_int8`, `bool` of a bit) or `Program.materialize` is called:
+
+    program = Program()
+    a = program.lazy(FheUint8.from_uint8(7))
+    b = program.lazy(FheUint8.from_uint8(3))
+    (s, _) = a.Add(b)
+    (q, r, _) = s.DivAndRem(b)
+    q.to_uint8()
+
+On materialize, all pending gates that live values depend on are optimized as one circuit (see `optimize`) and
+evaluated. Values of evaluated wires are remembered, hence later materializations only evaluate new gates.
+
+`optimize` applies across operation boundaries:
+    - common subexpression elimination: structurally identical gates (for ex, the same comparison evaluated by two
+      operations) are evaluated once. Double negations, x & x, x ^ !x etc. are simplified.
+    - depth balancing: chains of the same associative gate (AND, OR, XOR) whose intermediate outputs are not used
+      elsewhere are rebuilt as balanced trees, combining the shallowest operands first
+    - dead gate elimination: gates whose outputs are not required are dropped
+'''
+
+from __future__ import annotations
+from circuit import *
+import heapq
+import weakref
+
+ASSOCIATIVE = (GateKind.AND, GateKind.OR, GateKind.XOR)
+
+class LazyWire(Wire):
+    '''
+    Wire of a `Program`. Unlike traced wires, the value of a lazy wire is known (after evaluation), hence `bool`
+    materializes it.
+    '''
+    __slots__ = ('__weakref__',)
+
+    def __bool__(self):
+        return self.circuit.value(self)
+
+class Builder:
+    '''
+    Builds a circuit gate by gate with constant folding, structural hashing and local simplification
+    '''
+    def __init__(self):
+        self.circuit = Circuit()
+        self.table = {}
+        # wire id -> wire it negates
+        self.negation = {}
+
+    def input(self) -> Wire:
+        return self.circuit.input()
+
+    def gate(self, kind: GateKind, a, b=None):
+        if kind == GateKind.NOT:
+            if not isinstance(a, Wire):
+                return not a
+            if a.id in self.negation:
+                return self.negation[a.id]
+            key = (kind, a.id)
+            if key not in self.table:
+                out = self.circuit._record(kind, a, None)
+                self.negation[out.id] = a
+                self.table[key] = out
+            return self.table[key]
+
+        if not isinstance(a, Wire):
+            (a, b) = (b, a)
+        if not isinstance(b, Wire):
+            match kind:
+                case GateKind.AND:
+                    return a if b else False
+                case GateKind.OR:
+                    return True if b else a
+                case GateKind.XOR:
+                    return self.gate(GateKind.NOT, a) if b else a
+
+        if a.id == b.id:
+            return False if kind == GateKind.XOR else a
+        if self.negation.get(a.id) is b or self.negation.get(b.id) is a:
+            return kind != GateKind.AND
+
+        key = (kind, min(a.id, b.id), max(a.id, b.id))
+        if key not in self.table:
+            self.table[key] = self.circuit._record(kind, a, b)
+        return self.table[key]
+
+def eliminate_dead_gates(circuit: Circuit) -> Circuit:
+    '''
+    Returns copy of `circuit` without gates that outputs do not depend on. Inputs are kept as they are.
+    '''
+    live = [False for _ in range(circuit.n_wires)]
+    for o in circuit.outputs:
+        if not isinstance(o, bool):
+            live[o] = True
+    for (_, o, a, b) in reversed(circuit.gates):
+        if live[o]:
+            live[a] = True
+            if b is not None:
+                live[b] = True
+
+    out = Circuit()
+    wires = {}
+    for i in circuit.inputs:
+        wires[i] = out.input()
+    for (kind, o, a, b) in circuit.gates:
+        if live[o]:
+            wires[o] = out._record(kind, wires[a], None if b is None else wires[b])
+    out.outputs = [o if isinstance(o, bool) else wires[o].id for o in circuit.outputs]
+    out.layout = circuit.layout
+    out.input_widths = circuit.input_widths
+    return out
+
+def balance(circuit: Circuit) -> Circuit:
+    '''
+    Returns copy of `circuit` where chains of the same associative gate are rebuilt as balanced trees (see module doc)
+    '''
+    fanout = [0 for _ in range(circuit.n_wires)]
+    for (_, _, a, b) in circuit.gates:
+        fanout[a] += 1
+        if b is not None:
+            fanout[b] += 1
+    for o in circuit.outputs:
+        if not isinstance(o, bool):
+            fanout[o] += 1
+
+    producer = {o: (kind, a, b) for (kind, o, a, b) in circuit.gates}
+    # gates that are folded into the tree of their only consumer
+    absorbed = [False for _ in range(circuit.n_wires)]
+    for (kind, o, a, b) in circuit.gates:
+        if kind in ASSOCIATIVE:
+            for x in (a, b):
+                if x in producer and producer[x][0] == kind and fanout[x] == 1:
+                    absorbed[x] = True
+
+    def leaves(kind: GateKind, w: int) -> [int]:
+        if absorbed[w] and producer[w][0] == kind:
+            (_, a, b) = producer[w]
+            return leaves(kind, a) + leaves(kind, b)
+        return [w]
+
+    builder = Builder()
+    wires = {}
+    depth = {}
+    for i in circuit.inputs:
+        wires[i] = builder.input()
+
+    def depth_of(w) -> int:
+        return depth.get(w.id, 0) if isinstance(w, Wire) else 0
+
+    def emit(kind, a, b=None):
+        w = builder.gate(kind, a, b)
+        if isinstance(w, Wire) and w.id not in depth:
+            d = max(depth_of(a), 0 if b is None else depth_of(b))
+            depth[w.id] = d if kind == GateKind.NOT else d + 1
+        return w
+
+    for (kind, o, a, b) in circuit.gates:
+        if absorbed[o]:
+            continue
+        if kind not in ASSOCIATIVE:
+            wires[o] = emit(kind, wires[a], None if b is None else wires[b])
+            continue
+        # combine shallowest operands first
+        heap = [(depth_of(wires[l]), n, wires[l]) for (n, l) in enumerate(leaves(kind, a) + leaves(kind, b))]
+        heapq.heapify(heap)
+        n = len(heap)
+        while len(heap) > 1:
+            (_, _, x) = heapq.heappop(heap)
+            (_, _, y) = heapq.heappop(heap)
+            z = emit(kind, x, y)
+            heapq.heappush(heap, (depth_of(z), n, z))
+            n += 1
+        wires[o] = heap[0][2]
+
+    out = builder.circuit
+    out.outputs = [o if isinstance(o, bool) else (wires[o].id if isinstance(wires[o], Wire) else wires[o]) for o in circuit.outputs]
+    out.layout = circuit.layout
+    out.input_widths = circuit.input_widths
+    return out
+
+def optimize(circuit: Circuit) -> Circuit:
+    '''
+    Returns circuit equivalent to `circuit` after common subexpression elimination, depth balancing and dead gate
+    elimination. Inputs are unchanged.
+    '''
+    return eliminate_dead_gates(balance(circuit))
+
+class Program(Circuit):
+    '''
+    Circuit recorded lazily by operations over values returned by `lazy`.
+
+    - `known`: wire id -> value of the wire, for inputs and wires evaluated by earlier materializations
+    - `live`: wire id -> wire, for wires that are still referenced (for ex, by bits of values returned to the caller)
+    - `history`: stats of the circuit before and after `optimize` for each materialization
+    - `evaluated`: no. of gates recorded up to the last materialization
+
+    Each materialization evaluates all live wires that are not known yet, hence all gates recorded since the last
+    materialization are optimized as one circuit. Wires that are no longer referenced (intermediate bits of operations,
+    outputs that were dropped by the caller) are not evaluated unless a live wire depends on them.
+
+    After a materialization every wire that is still referenced is known. Hence gates recorded later only read known
+    wires or each other, and the next materialization is built from gates recorded since `evaluated` with known wires
+    as inputs, i.e. its cost does not grow with size of the program.
+    '''
+    wire_type = LazyWire
+
+    def __init__(self):
+        super().__init__()
+        self.known = {}
+        self.live = weakref.WeakValueDictionary()
+        self.history = []
+        self.evaluated = 0
+
+    def _record(self, kind: GateKind, a: Wire, b: Wire) -> Wire:
+        out = super()._record(kind, a, b)
+        self.live[out.id] = out
+        return out
+
+    def lazy(self, value):
+        '''
+        Returns lazy copy of `value` (FheUint8 or FheInt8 with python bool bits)
+        '''
+        (cls, width, _) = FHE_TYPES[type(value).__name__]
+        bits = []
+        for b in value.bits:
+            w = self.input()
+            self.known[w.id] = bool(b)
+            bits.append(w)
+        return cls(bits=bits)
+
+    def value(self, w: Wire) -> bool:
+        if w.id not in self.known:
+            self._evaluate([w.id])
+        return self.known[w.id]
+
+    def materialize(self, *values):
+        '''
+        Evaluates `values` (lazy FheUint8/FheInt8, bits, or lists/tuples of them) as one optimized circuit and returns
+        them with python bool bits.
+        '''
+        (bits, layout) = flatten(values if len(values) != 1 else values[0])
+        if any(isinstance(b, Wire) and b.id not in self.known for b in bits):
+            self._evaluate([w.id for w in bits if isinstance(w, Wire)])
+        return unflatten(iter([self.known[b.id] if isinstance(b, Wire) else b for b in bits]), layout)
+
+    def pending(self, targets: [int]) -> (Circuit, [bool]):
+        '''
+        Returns (circuit, input values) that evaluates wires `targets` from gates recorded since the last
+        materialization. Known wires read by those gates are inputs of the circuit.
+        '''
+        circuit = Circuit()
+        wires = {}
+        values = []
+        for (kind, o, a, b) in self.gates[self.evaluated:]:
+            for w in (a, b):
+                if w is not None and w not in wires:
+                    assert w in self.known, f'wire {w} is neither known nor recorded since the last materialization'
+                    wires[w] = circuit.input()
+                    values.append(self.known[w])
+            wires[o] = circuit._record(kind, wires[a], None if b is None else wires[b])
+        circuit.outputs = [wires[t].id for t in targets]
+        return (eliminate_dead_gates(circuit), values)
+
+    def _evaluate(self, targets: [int]):
+        targets = sorted(({t for t in targets} | set(self.live.keys())) - set(self.known))
+        (circuit, values) = self.pending(targets)
+        optimized = optimize(circuit)
+        self.history.append({'before': circuit.stats(), 'after': optimized.stats()})
+        for (t, v) in zip(targets, optimized.evaluate(values)):
+            self.known[t] = v
+        self.evaluated = len(self.gates)
+
+def lazy_tests():
+    import random
+
+    rng = random.Random(0)
+
+    # optimize preserves circuits of all ops
+    for cls in [FheUint8, FheInt8]:
+        for op in ['Add', 'Sub', 'Mul', 'DivAndRem', 'GreaterThan', 'Equals', 'Compare', 'MinMax', 'Shl']:
+            circuit = trace_op(cls, op)
+            optimized = optimize(circuit)
+            assert optimized.stats()['bootstraps'] <= circuit.stats()['bootstraps']
+            assert optimized.depth() <= circuit.depth()
+            for _ in range(32):
+                x = [rng.random() < 0.5 for _ in range(16)]
+                assert optimized.evaluate(x) == circuit.evaluate(x), f'{cls.__name__}.{op}'
+
+    # depth balancing: AND chain of Equals
+    circuit = trace_op(FheUint8, 'Equals')
+    assert circuit.depth() == 8 and optimize(circuit).depth() == 4
+
+    # programs against eager evaluation
+    for _ in range(20):
+        (x, y) = (rng.randint(0, 255), rng.randint(1, 255))
+        program = Program()
+        a = program.lazy(FheUint8.from_uint8(x))
+        b = program.lazy(FheUint8.from_uint8(y))
+        (s, _) = a.Add(b)
+        (q, r, _) = s.DivAndRem(b)
+        # same comparison twice: evaluated once
+        (bigger, also_bigger) = (a.GreaterThan(b), a.GreaterThan(b))
+        m = FheUint8.Select(bigger, q.Mul(r), r)
+        assert len(program.known) == 16
+        (want_q, want_r) = (((x+y)%256)//y, ((x+y)%256)%y)
+        assert m.to_uint8() == ((want_q*want_r)%256 if x > y else want_r)
+        assert bool(also_bigger) == (x > y)
+        assert program.history[0]['after']['bootstraps'] < program.history[0]['before']['bootstraps']
+        (q, r) = program.materialize(q, r)
+        assert (q.to_uint8(), r.to_uint8()) == (want_q, want_r)
+        # everything was evaluated by the first materialization
+        assert len(program.history) == 1
+
+    program = Program()
+    a = program.lazy(FheInt8.from_int8(-7))
+    b = program.lazy(FheInt8.from_int8(3))
+    assert a.Mul(b).to_int8() == -21 and a.Sub(b)[0].to_int8() == -10 and len(program.history) == 2
+
+    # a long-lived program only rebuilds gates recorded since the last materialization
+    program = Program()
+    acc = program.lazy(FheUint8.from_uint8(0))
+    step = program.lazy(FheUint8.from_uint8(3))
+    for i in range(1, 50):
+        (acc, _) = acc.Add(step)
+        assert acc.to_uint8() == (3*i) % 256
+        (circuit, values) = program.pending([])
+        assert len(circuit.gates) == 0 and program.evaluated == len(program.gates)
+    assert len({(h['before']['bootstraps'], h['before']['depth']) for h in program.history}) == 1
+
+if __name__ == '__main__':
+    lazy_tests()
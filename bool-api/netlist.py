@@ -0,0 +1,333 @@
+'''
+Export and import of traced circuits.
+
+Two formats are supported:
+
+(1) Bristol fashion (https://nigelsmart.github.io/MPC-Circuits/). Text format supported by most MPC/FHE tools. Bristol
+    fashion has no OR gate, hence a | b is exported as !(!a & !b), i.e. a single AND and INVs (negation is free). Outputs must be the last wires of the circuit,
+    hence each output is copied to a new wire at the end with an EQW gate (or set with an EQ gate if it is a constant).
+    Bits of each input/output value are ordered from least significant to most significant.
+
+(2) Binary netlist. Gates are sorted by level (see `Circuit.levels`) and wires are renumbered such that inputs are wires
+    0..n_inputs-1 and the k^th gate outputs wire n_inputs+k. Hence gates are stored as fixed-width records without their
+    output wire and gates at the same level are contiguous. File layout (little endian):
+
+        header          magic b'PZNL', version, n_inputs, n_gates, n_outputs, n_levels, n_input_groups, layout_len (u32 each)
+        input_widths    u32[n_input_groups]
+        level_offsets   u32[n_levels+1]     gates of level l are gates[level_offsets[l]:level_offsets[l+1]]
+        gates           (kind u32, a u32, b u32)[n_gates]   kind is `GateKind.value`, b = NO_WIRE for NOT gates
+        outputs         u32[n_outputs]      wire id, CONST_FALSE or CONST_TRUE
+        layout          JSON encoded `Circuit.layout`
+
+    `load_binary` maps the file with `np.memmap`, hence loading does not parse or copy gates.
+'''
+
+from __future__ import annotations
+from circuit import *
+import json
+import os
+import struct
+
+MAGIC = b'PZNL'
+VERSION = 1
+HEADER = struct.Struct('<4s7I')
+
+NO_WIRE = 0xFFFFFFFF
+CONST_FALSE = 0xFFFFFFFE
+CONST_TRUE = 0xFFFFFFFD
+
+GATE_RECORD = np.dtype([('kind', '<u4'), ('a', '<u4'), ('b', '<u4')])
+
+# Circuits exported by `export_ops`
+EXPORTED_OPS = ['Add', 'Sub', 'Mul', 'DivAndRem', 'GreaterThan', 'GreaterThanOrEqualTo', 'LessThan', 'LessThanOrEqualTo', 'Equals']
+
+def _layout_width(layout: tuple) -> int:
+    match layout[0]:
+        case 'bit':
+            return 1
+        case 'tuple' | 'list':
+            return sum(_layout_width(l) for l in layout[1])
+    return FHE_TYPES[layout[0]][1]
+
+def output_widths(circuit: Circuit) -> [int]:
+    '''
+    Returns widths of the output values of `circuit`. For ex, [8, 1] for `FheUint8.Add`
+    '''
+    if circuit.layout is None:
+        return [len(circuit.outputs)]
+    if circuit.layout[0] in ('tuple', 'list'):
+        return [_layout_width(l) for l in circuit.layout[1]]
+    return [_layout_width(circuit.layout)]
+
+def _input_widths(circuit: Circuit) -> [int]:
+    return circuit.input_widths if circuit.input_widths is not None else [len(circuit.inputs)]
+
+def to_bristol(circuit: Circuit) -> str:
+    '''
+    Returns `circuit` in Bristol fashion
+    '''
+    wire = {w: i for (i, w) in enumerate(circuit.inputs)}
+    n_wires = len(circuit.inputs)
+    lines = []
+    for (kind, out, a, b) in circuit.gates:
+        match kind:
+            case GateKind.AND:
+                lines.append(f'2 1 {wire[a]} {wire[b]} {n_wires} AND')
+            case GateKind.XOR:
+                lines.append(f'2 1 {wire[a]} {wire[b]} {n_wires} XOR')
+            case GateKind.NOT:
+                lines.append(f'1 1 {wire[a]} {n_wires} INV')
+            case GateKind.OR:
+                # a | b = !(!a & !b), negation is free
+                lines.append(f'1 1 {wire[a]} {n_wires} INV')
+                lines.append(f'1 1 {wire[b]} {n_wires+1} INV')
+                lines.append(f'2 1 {n_wires} {n_wires+1} {n_wires+2} AND')
+                lines.append(f'1 1 {n_wires+2} {n_wires+3} INV')
+                n_wires += 3
+        wire[out] = n_wires
+        n_wires += 1
+
+    # outputs must be the last wires
+    for o in circuit.outputs:
+        if isinstance(o, bool):
+            lines.append(f'1 1 {int(o)} {n_wires} EQ')
+        else:
+            lines.append(f'1 1 {wire[o]} {n_wires} EQW')
+        n_wires += 1
+
+    in_widths = _input_widths(circuit)
+    out_widths = output_widths(circuit)
+    header = [
+        f'{len(lines)} {n_wires}',
+        f"{len(in_widths)} {' '.join(str(w) for w in in_widths)}",
+        f"{len(out_widths)} {' '.join(str(w) for w in out_widths)}",
+        '',
+    ]
+    return '\n'.join(header + lines) + '\n'
+
+def write_bristol(circuit: Circuit, path):
+    with open(path, 'w') as f:
+        f.write(to_bristol(circuit))
+
+def from_bristol(text: str) -> Circuit:
+    '''
+    Returns circuit described by `text` in Bristol fashion. Outputs are grouped as lists of bits, one per output value.
+    '''
+    lines = [l.split() for l in text.splitlines() if l.strip() != '']
+    (n_gates, n_wires) = (int(lines[0][0]), int(lines[0][1]))
+    in_widths = [int(v) for v in lines[1][1:1+int(lines[1][0])]]
+    out_widths = [int(v) for v in lines[2][1:1+int(lines[2][0])]]
+    assert len(lines) == 3 + n_gates, f'Expected {n_gates} gates but found {len(lines)-3}'
+
+    circuit = Circuit()
+    wires = {}
+    for i in range(sum(in_widths)):
+        wires[i] = circuit.input()
+
+    for l in lines[3:]:
+        (n_in, n_out) = (int(l[0]), int(l[1]))
+        ins = [int(v) for v in l[2:2+n_in]]
+        outs = [int(v) for v in l[2+n_in:2+n_in+n_out]]
+        op = l[2+n_in+n_out]
+        match op:
+            case 'AND':
+                wires[outs[0]] = wires[ins[0]] & wires[ins[1]]
+            case 'XOR':
+                wires[outs[0]] = wires[ins[0]] ^ wires[ins[1]]
+            case 'INV':
+                wires[outs[0]] = bit_not(wires[ins[0]])
+            case 'EQ':
+                wires[outs[0]] = ins[0] == 1
+            case 'EQW':
+                wires[outs[0]] = wires[ins[0]]
+            case 'MAND':
+                half = n_in >> 1
+                for k in range(n_out):
+                    wires[outs[k]] = wires[ins[k]] & wires[ins[half+k]]
+            case _:
+                raise ValueError(f'Unsupported gate {op}')
+
+    out_bits = [wires[w] for w in range(n_wires - sum(out_widths), n_wires)]
+    circuit.outputs = [b.id if isinstance(b, Wire) else bool(b) for b in out_bits]
+    groups = tuple(('list', tuple(('bit',) for _ in range(w))) for w in out_widths)
+    circuit.layout = groups[0] if len(groups) == 1 else ('tuple', groups)
+    circuit.input_widths = in_widths
+    return circuit
+
+def read_bristol(path) -> Circuit:
+    with open(path) as f:
+        return from_bristol(f.read())
+
+def levelize(circuit: Circuit) -> (np.ndarray, np.ndarray, [int]):
+    '''
+    Sorts gates of `circuit` by level and renumbers wires such that inputs are 0..n_inputs-1 and the k^th gate outputs
+    wire n_inputs+k. Returns (gate records, level offsets, outputs).
+    '''
+    n_inputs = len(circuit.inputs)
+    levels = circuit.levels()
+    order = sorted(range(len(circuit.gates)), key=lambda k: levels[k])
+
+    wire = {w: i for (i, w) in enumerate(circuit.inputs)}
+    for (pos, k) in enumerate(order):
+        wire[circuit.gates[k][1]] = n_inputs + pos
+
+    gates = np.zeros(len(order), dtype=GATE_RECORD)
+    for (pos, k) in enumerate(order):
+        (kind, _, a, b) = circuit.gates[k]
+        gates[pos] = (kind.value, wire[a], NO_WIRE if b is None else wire[b])
+
+    n_levels = max(levels, default=0)
+    counts = np.bincount(np.array(levels, dtype=np.int64), minlength=n_levels+1)
+    # level 0 contains only inputs
+    offsets = np.concatenate([[0], np.cumsum(counts[1:])]).astype(np.uint32)
+
+    outputs = [(CONST_TRUE if o else CONST_FALSE) if isinstance(o, bool) else wire[o] for o in circuit.outputs]
+    return (gates, offsets, outputs)
+
+def write_binary(circuit: Circuit, path):
+    (gates, offsets, outputs) = levelize(circuit)
+    in_widths = _input_widths(circuit)
+    layout = json.dumps(circuit.layout).encode()
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(circuit.inputs), len(gates), len(outputs), len(offsets)-1, len(in_widths), len(layout)))
+        f.write(np.array(in_widths, dtype='<u4').tobytes())
+        f.write(offsets.astype('<u4').tobytes())
+        f.write(gates.tobytes())
+        f.write(np.array(outputs, dtype='<u4').tobytes())
+        f.write(layout)
+
+def _as_tuple(v):
+    return tuple(_as_tuple(i) for i in v) if isinstance(v, list) else v
+
+class Netlist:
+    '''
+    Binary netlist loaded with `load_binary`. `gates`, `level_offsets` and `outputs` are read-only memory maps of the file.
+    '''
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            (magic, version, n_inputs, n_gates, n_outputs, n_levels, n_input_groups, layout_len) = HEADER.unpack(f.read(HEADER.size))
+        assert magic == MAGIC, f'{path} is not a binary netlist'
+        assert version == VERSION, f'Unsupported netlist version {version}'
+
+        offset = HEADER.size
+        def view(dtype, count):
+            nonlocal offset
+            dtype = np.dtype(dtype)
+            out = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,)) if count != 0 else np.zeros(0, dtype=dtype)
+            offset += dtype.itemsize*count
+            return out
+
+        self.n_inputs = n_inputs
+        self.input_widths = [int(w) for w in view('<u4', n_input_groups)]
+        self.level_offsets = view('<u4', n_levels+1)
+        self.gates = view(GATE_RECORD, n_gates)
+        self.outputs = view('<u4', n_outputs)
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            self.layout = _as_tuple(json.loads(f.read(layout_len).decode()))
+
+    def n_levels(self) -> int:
+        return len(self.level_offsets) - 1
+
+    def to_circuit(self) -> Circuit:
+        '''
+        Returns the netlist as a `Circuit`
+        '''
+        circuit = Circuit()
+        wires = [circuit.input() for _ in range(self.n_inputs)]
+        for (kind, a, b) in self.gates.tolist():
+            kind = GateKind(kind)
+            if kind == GateKind.NOT:
+                wires.append(circuit._record(kind, wires[a], None))
+            else:
+                wires.append(circuit._record(kind, wires[a], wires[b]))
+        circuit.outputs = [self._output(o, lambda w: wires[w].id) for o in self.outputs.tolist()]
+        circuit.layout = self.layout
+        circuit.input_widths = self.input_widths
+        return circuit
+
+    @staticmethod
+    def _output(o, wire):
+        if o == CONST_TRUE:
+            return True
+        if o == CONST_FALSE:
+            return False
+        return wire(o)
+
+    def evaluate(self, inputs: [bool]) -> [bool]:
+        '''
+        Evaluates the netlist level by level. All gates of a level are evaluated with vectorized numpy operations.
+        `inputs` are either bools or bit-sliced bool arrays (of same shape).
+        '''
+        assert len(inputs) == self.n_inputs
+        shape = np.shape(inputs[0]) if self.n_inputs != 0 else ()
+        values = np.zeros((self.n_inputs + len(self.gates),) + shape, dtype=bool)
+        for i in range(self.n_inputs):
+            values[i] = inputs[i]
+
+        for l in range(self.n_levels()):
+            (start, end) = (int(self.level_offsets[l]), int(self.level_offsets[l+1]))
+            gates = self.gates[start:end]
+            kind = np.asarray(gates['kind'])
+            a = values[np.asarray(gates['a'])]
+            b_idx = np.asarray(gates['b'])
+            b = values[np.where(b_idx == NO_WIRE, 0, b_idx)]
+            out = np.empty_like(a)
+            for (k, fn) in [(GateKind.AND, np.bitwise_and), (GateKind.OR, np.bitwise_or), (GateKind.XOR, np.bitwise_xor)]:
+                mask = kind == k.value
+                out[mask] = fn(a[mask], b[mask])
+            mask = kind == GateKind.NOT.value
+            out[mask] = ~a[mask]
+            values[self.n_inputs+start:self.n_inputs+end] = out
+
+        out = []
+        for o in self.outputs.tolist():
+            if o in (CONST_TRUE, CONST_FALSE):
+                out.append(np.full(shape, o == CONST_TRUE))
+            else:
+                out.append(values[o])
+        return out
+
+def load_binary(path) -> Netlist:
+    return Netlist(path)
+
+def export_ops(directory):
+    '''
+    Writes circuits of `EXPORTED_OPS` of FheUint8 and FheInt8 to `directory` in Bristol fashion (.txt) and binary (.bin)
+    '''
+    os.makedirs(directory, exist_ok=True)
+    for cls in [FheUint8, FheInt8]:
+        for op in EXPORTED_OPS:
+            circuit = trace_op(cls, op)
+            write_bristol(circuit, os.path.join(directory, f'{cls.__name__}.{op}.txt'))
+            write_binary(circuit, os.path.join(directory, f'{cls.__name__}.{op}.bin'))
+
+def netlist_tests():
+    import random
+    import tempfile
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        export_ops(directory)
+        for cls in [FheUint8, FheInt8]:
+            for op in EXPORTED_OPS:
+                circuit = trace_op(cls, op)
+                bristol = read_bristol(os.path.join(directory, f'{cls.__name__}.{op}.txt'))
+                netlist = load_binary(os.path.join(directory, f'{cls.__name__}.{op}.bin'))
+                assert netlist.layout == circuit.layout
+                assert netlist.to_circuit().stats() == circuit.stats()
+                assert bristol.input_widths == [8, 8] and sum(output_widths(bristol)) == len(circuit.outputs)
+                # OR is exported with free INVs, hence the round trip costs the same no. of bootstraps
+                assert bristol.stats()['bootstraps'] == circuit.stats()['bootstraps'], f'{cls.__name__}.{op}'
+
+                inputs = [[rng.random() < 0.5 for _ in range(16)] for _ in range(64)]
+                sliced = [np.array([x[k] for x in inputs]) for k in range(16)]
+                got_sliced = netlist.evaluate(sliced)
+                for (t, x) in enumerate(inputs):
+                    want = circuit.evaluate(x)
+                    assert bristol.evaluate(x) == want, f'{cls.__name__}.{op}'
+                    assert netlist.to_circuit().evaluate(x) == want, f'{cls.__name__}.{op}'
+                    assert [bool(v[t]) for v in got_sliced] == want, f'{cls.__name__}.{op}'
+
+if __name__ == '__main__':
+    netlist_tests()
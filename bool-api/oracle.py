@@ -0,0 +1,147 @@
+'''
+Exhaustive truth tables of binary operations of `FheUint8`/`FheInt8`.
+
+Operands are 8 bits, hence an operation has 65536 input pairs and its full truth table is small. `Oracle` evaluates the
+traced circuit of an operation once on all pairs (bit-sliced, see stream.py) and stores the table as a `.npy` file of
+65536 uint32 entries. Entry a*256 + b (a, b as raw bytes) holds output bits of the circuit on (a, b): bit i of the
+entry is i^th output bit (in order of `flatten`). Hence results are checked with an indexed lookup in the memory-mapped
+table instead of re-evaluating the circuit.
+
+Tables are stored in ORACLE_DIR as `{type}.{op}.{hash}.npy` where hash is `circuit_hash` of the traced circuit, hence a
+change of the circuit of an operation creates a new table instead of reusing a stale one.
+'''
+
+from __future__ import annotations
+from circuit import *
+from compiler import compile_circuit
+from stream import pack, unpack
+import hashlib
+import os
+
+ORACLE_DIR = os.environ.get('BOOL_API_ORACLE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.oracle'))
+
+OPS = {
+    'FheUint8': ['Add', 'Sub', 'Mul', 'DivAndRem', 'GreaterThan', 'GreaterThanOrEqualTo', 'LessThan', 'LessThanOrEqualTo', 'Equals', 'Compare'],
+    'FheInt8': ['Add', 'Sub', 'Mul', 'DivAndRem', 'DivAndRemOverflow', 'GreaterThan', 'GreaterThanOrEqualTo', 'LessThan', 'LessThanOrEqualTo', 'Equals', 'Compare'],
+}
+
+def circuit_hash(circuit: Circuit) -> str:
+    '''
+    Returns sha256 of gates, inputs, outputs and layout of `circuit`
+    '''
+    h = hashlib.sha256()
+    h.update(repr((circuit.inputs, [(k.value, o, a, b) for (k, o, a, b) in circuit.gates], circuit.outputs, circuit.layout)).encode())
+    return h.hexdigest()
+
+def truth_table(circuit: Circuit) -> np.ndarray:
+    '''
+    Returns 65536 uint32 entries of output bits of `circuit` (with two 8 bit inputs) on all pairs of inputs
+    '''
+    assert circuit.input_widths == [8, 8] and len(circuit.outputs) <= 32
+    pairs = np.arange(1 << 16, dtype=np.uint32)
+    a = (pairs >> 8).astype(np.uint8)
+    b = (pairs & 0xFF).astype(np.uint8)
+    outputs = compile_circuit(circuit, backend='numpy')(pack(a, 8) + pack(b, 8))
+    table = np.zeros(1 << 16, dtype=np.uint32)
+    for (i, words) in enumerate(outputs):
+        bits = np.full(1 << 16, bool(words.all())) if words.dtype == bool else unpack(words, 1 << 16)
+        table |= bits.astype(np.uint32) << np.uint32(i)
+    return table
+
+class Oracle:
+    '''
+    Truth table of `op` of `cls`, generated on first use (see module doc)
+    '''
+    def __init__(self, cls, op: str, directory=None):
+        (_, _, self.signed) = FHE_TYPES[cls.__name__]
+        self.cls = cls
+        self.op = op
+        circuit = trace_op(cls, op)
+        self.layout = circuit.layout
+        self.hash = circuit_hash(circuit)
+        directory = ORACLE_DIR if directory is None else directory
+        self.path = os.path.join(directory, f'{cls.__name__}.{op}.{self.hash[:16]}.npy')
+        if not os.path.exists(self.path):
+            os.makedirs(directory, exist_ok=True)
+            tmp = f'{self.path}.{os.getpid()}.tmp.npy'
+            np.save(tmp, truth_table(circuit))
+            os.replace(tmp, self.path)
+        self.table = np.load(self.path, mmap_mode='r')
+
+    def entries(self, a, b) -> np.ndarray:
+        '''
+        Returns table entries of pairs (a, b) of integers (python ints or numpy arrays)
+        '''
+        dtype = np.int8 if self.signed else np.uint8
+        a = np.asarray(a).astype(dtype).view(np.uint8).astype(np.intp)
+        b = np.asarray(b).astype(dtype).view(np.uint8).astype(np.intp)
+        return self.table[(a << 8) | b]
+
+    def lookup(self, a, b):
+        '''
+        Returns result of `op` on (a, b) with the same structure as `compile_op(cls, op, backend='numpy')`: integers in
+        place of encrypted integers and bools in place of bits
+        '''
+        entries = self.entries(a, b)
+        bits = iter([((entries >> np.uint32(i)) & 1).astype(bool) for i in range(32)])
+        return _decode(bits, self.layout)
+
+def _decode(bits, layout: tuple):
+    match layout[0]:
+        case 'bit':
+            return next(bits)
+        case 'tuple':
+            return tuple(_decode(bits, l) for l in layout[1])
+        case 'list':
+            return [_decode(bits, l) for l in layout[1]]
+    (_, width, signed) = FHE_TYPES[layout[0]]
+    acc = 0
+    for i in range(width):
+        acc = acc + (next(bits).astype(np.int64) << i)
+    acc = np.asarray(acc).astype(np.uint8)
+    return acc.view(np.int8) if signed else acc
+
+def generate_all(directory=None) -> [Oracle]:
+    '''
+    Generates tables of all operations in OPS
+    '''
+    return [Oracle(FHE_TYPES[name][0], op, directory) for (name, ops) in OPS.items() for op in ops]
+
+def oracle_tests():
+    import random
+    import tempfile
+    from compiler import compile_op
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        oracles = generate_all(directory)
+        assert len(os.listdir(directory)) == sum(len(ops) for ops in OPS.values())
+
+        i = np.repeat(np.arange(256), 256)
+        j = np.tile(np.arange(256), 256)
+        for oracle in oracles:
+            (a, b) = (i.astype(np.uint8), j.astype(np.uint8))
+            if oracle.signed:
+                (a, b) = (a.view(np.int8), b.view(np.int8))
+            want = compile_op(oracle.cls, oracle.op, backend='numpy')(a, b)
+            got = oracle.lookup(a, b)
+            (want, got) = (want, got) if isinstance(want, tuple) else ((want,), (got,))
+            for (w, g) in zip(want, got):
+                assert np.array_equal(w, g), f'{oracle.cls.__name__}.{oracle.op}'
+
+        # scalar lookups against plaintext ops
+        add = Oracle(FheInt8, 'Add', directory)
+        mul = Oracle(FheUint8, 'Mul', directory)
+        for _ in range(100):
+            (x, y) = (rng.randint(-128, 127), rng.randint(-128, 127))
+            (s, _) = add.lookup(x, y)
+            assert int(s) == (x + y + 128) % 256 - 128
+            (x, y) = (rng.randint(0, 255), rng.randint(0, 255))
+            assert int(mul.lookup(x, y)) == (x * y) % 256
+
+        # a changed circuit gets a new table
+        assert circuit_hash(trace_op(FheUint8, 'Add')) != circuit_hash(trace_op(FheUint8, 'Sub'))
+        assert Oracle(FheUint8, 'Add', directory).path == oracles[0].path
+
+if __name__ == '__main__':
+    oracle_tests()
@@ -0,0 +1,324 @@
+'''
+Partitioning of circuits across evaluation nodes.
+
+A circuit is split across k nodes by assigning each bootstrapped gate to a node. Inputs are sent to all nodes and NOT
+gates are evaluated by the nodes that read them (see schedule.py). A bit evaluated on node p and read by a gate on node
+q != p is a transfer: its ciphertext (see `schedule.ciphertext_bytes`) is sent from p to q once. Hence `partition`
+    (1) balances no. of bootstraps per node: no node evaluates more than (1 + imbalance) * bootstraps / k gates in
+        total, nor more than (1 + imbalance) / k of the gates at any level. Otherwise, nodes would evaluate
+        consecutive levels of the circuit one after another.
+    (2) minimises no. of transfers: gates are assigned level by level to the node that evaluates most of their operands
+        (ties to the least loaded node) and then single gates are moved between nodes while that reduces transfers.
+
+Each node evaluates its gates level by level with `workers` gates in parallel and waits for bits of other nodes as
+required. `makespan` models time of that evaluation for given bootstrap time, network latency and bandwidth and
+`simulate` runs it with one process per node, exchanging bits over queues with modeled latency. A node only waits on
+bits of gates at levels below the gate it evaluates, hence nodes never deadlock.
+'''
+
+from __future__ import annotations
+from circuit import *
+from schedule import TESTER_N, base_wires, ciphertext_bytes, readers
+import math
+import multiprocessing
+import time
+
+class Partition:
+    '''
+    - `node`: node of each gate, -1 for NOT gates
+    - `owner`: base wire -> node that evaluates it, -1 for inputs
+    - `work`: no. of bootstraps per node
+    - `sends`: base wire -> nodes (other than its owner) that read it
+    '''
+    def __init__(self, circuit: Circuit, k: int, node: [int]):
+        self.circuit = circuit
+        self.k = k
+        self.node = node
+        self.level = bootstrap_levels(circuit)
+        self.owner = {i: -1 for i in circuit.inputs}
+        self.work = [0 for _ in range(k)]
+        for (g, (_, o, _, _)) in enumerate(circuit.gates):
+            if node[g] != -1:
+                self.owner[o] = node[g]
+                self.work[node[g]] += 1
+
+        (operands, _) = readers(circuit)
+        self.sends = {}
+        for (g, ops) in enumerate(operands):
+            for w in ops:
+                if self.owner[w] not in (-1, node[g]):
+                    self.sends.setdefault(w, set()).add(node[g])
+
+    def order(self) -> [int]:
+        '''
+        Returns bootstrapped gates in order of evaluation: by level and then in order of the circuit
+        '''
+        return sorted((g for g in range(len(self.node)) if self.node[g] != -1), key=lambda g: (self.level[g], g))
+
+    def transfers(self) -> int:
+        return sum(len(nodes) for nodes in self.sends.values())
+
+    def imbalance(self) -> float:
+        '''
+        Returns max. bootstraps of a node over mean bootstraps per node, minus 1
+        '''
+        total = sum(self.work)
+        return 0.0 if total == 0 else max(self.work) * self.k / total - 1
+
+def bootstrap_levels(circuit: Circuit) -> [int]:
+    '''
+    Returns level of each gate, i.e. max. no. of bootstrapped gates on a path from an input to the gate (including the
+    gate unless it is a NOT gate). Unlike `Circuit.levels`, NOT gates do not add a level since they are free.
+    '''
+    wire_level = [0 for _ in range(circuit.n_wires)]
+    out = []
+    for (kind, o, a, b) in circuit.gates:
+        l = max(wire_level[a], 0 if b is None else wire_level[b]) + (0 if kind == GateKind.NOT else 1)
+        wire_level[o] = l
+        out.append(l)
+    return out
+
+def partition(circuit: Circuit, k: int, imbalance=0.05, passes=2) -> Partition:
+    '''
+    Returns partition of `circuit` across `k` nodes (see module doc)
+    '''
+    (operands, _) = readers(circuit)
+    level = bootstrap_levels(circuit)
+    gates = sorted((g for g in range(len(circuit.gates)) if circuit.gates[g][0] != GateKind.NOT), key=lambda g: (level[g], g))
+    capacity = math.ceil(len(gates) / k * (1 + imbalance))
+    owner = {i: -1 for i in circuit.inputs}
+    node = [-1 for _ in circuit.gates]
+    work = [0 for _ in range(k)]
+
+    per_level = {}
+    for g in gates:
+        per_level[level[g]] = per_level.get(level[g], 0) + 1
+    level_capacity = {l: math.ceil(n / k * (1 + imbalance)) for (l, n) in per_level.items()}
+    # level_work[p][l]: no. of gates at level l on node p
+    level_work = [{} for _ in range(k)]
+    for g in gates:
+        l = level[g]
+        affinity = [0 for _ in range(k)]
+        for w in operands[g]:
+            if owner[w] != -1:
+                affinity[owner[w]] += 1
+        candidates = [p for p in range(k) if work[p] < capacity and level_work[p].get(l, 0) < level_capacity[l]]
+        if len(candidates) == 0:
+            candidates = [p for p in range(k) if work[p] < capacity]
+        p = max(candidates, key=lambda p: (affinity[p], -work[p]))
+        node[g] = p
+        owner[circuit.gates[g][1]] = p
+        work[p] += 1
+        level_work[p][l] = level_work[p].get(l, 0) + 1
+
+    # reads[w][p]: no. of gates on node p that read base wire w
+    reads = {w: {} for w in owner}
+    for g in gates:
+        for w in operands[g]:
+            reads[w][node[g]] = reads[w].get(node[g], 0) + 1
+
+    def cost(w: int) -> int:
+        return sum(1 for p in reads[w] if p != owner[w]) if owner[w] != -1 else 0
+
+    for _ in range(passes):
+        moved = False
+        for g in gates:
+            o = circuit.gates[g][1]
+            src = node[g]
+            l = level[g]
+            touched = [w for w in operands[g]] + [o]
+            before = sum(cost(w) for w in touched)
+            best = (0, src)
+            for dst in {owner[w] for w in operands[g]} | set(reads[o]):
+                if dst in (-1, src) or work[dst] >= capacity or level_work[dst].get(l, 0) >= level_capacity[l]:
+                    continue
+                # move g to dst, compute transfers and move back
+                for w in operands[g]:
+                    reads[w][src] -= 1
+                    if reads[w][src] == 0:
+                        del reads[w][src]
+                    reads[w][dst] = reads[w].get(dst, 0) + 1
+                owner[o] = dst
+                gain = before - sum(cost(w) for w in touched)
+                for w in operands[g]:
+                    reads[w][dst] -= 1
+                    if reads[w][dst] == 0:
+                        del reads[w][dst]
+                    reads[w][src] = reads[w].get(src, 0) + 1
+                owner[o] = src
+                if gain > best[0]:
+                    best = (gain, dst)
+            if best[1] != src:
+                dst = best[1]
+                for w in operands[g]:
+                    reads[w][src] -= 1
+                    if reads[w][src] == 0:
+                        del reads[w][src]
+                    reads[w][dst] = reads[w].get(dst, 0) + 1
+                owner[o] = dst
+                node[g] = dst
+                work[src] -= 1
+                work[dst] += 1
+                level_work[src][l] -= 1
+                level_work[dst][l] = level_work[dst].get(l, 0) + 1
+                moved = True
+        if not moved:
+            break
+
+    return Partition(circuit, k, node)
+
+def transfer_time(params, latency: float, bandwidth: float) -> float:
+    '''
+    Returns seconds to send a ciphertext for `params` (see `schedule.ciphertext_bytes`) with `latency` seconds and
+    `bandwidth` bytes per second
+    '''
+    return latency + ciphertext_bytes(params) / bandwidth
+
+def makespan(p: Partition, gate_time: float, latency=0.0, bandwidth=float('inf'), params=TESTER_N['I_8'], workers=1) -> float:
+    '''
+    Returns modeled time in seconds to evaluate partition `p`, where each node evaluates its gates in order of the
+    circuit on `workers` workers and each bootstrap takes `gate_time` seconds
+    '''
+    circuit = p.circuit
+    base = base_wires(circuit)
+    (operands, _) = readers(circuit)
+    send = transfer_time(params, latency, bandwidth)
+    finish = {i: 0.0 for i in circuit.inputs}
+    free = [[0.0 for _ in range(workers)] for _ in range(p.k)]
+    for g in p.order():
+        q = p.node[g]
+        ready = max([finish[w] + (send if p.owner[w] not in (-1, q) else 0.0) for w in operands[g]], default=0.0)
+        worker = min(range(workers), key=lambda w: free[q][w])
+        start = max(ready, free[q][worker])
+        free[q][worker] = start + gate_time
+        finish[circuit.gates[g][1]] = start + gate_time
+    return max([finish[base[o]] for o in circuit.outputs if not isinstance(o, bool)], default=0.0)
+
+def _node(q: int, gates, sends, inputs, inboxes, results, gate_time, send):
+    '''
+    Evaluates `gates` of node `q` in a process of `simulate`
+    '''
+    values = dict(inputs)
+    arrived = {}
+    for (kind, o, a, na, b, nb) in gates:
+        for w in (a, b):
+            while w not in values:
+                if w not in arrived:
+                    arrived.update(inboxes[q].get())
+                    continue
+                (v, at) = arrived.pop(w)
+                time.sleep(max(0.0, at - time.monotonic()))
+                values[w] = v
+        time.sleep(gate_time)
+        (x, y) = (values[a] ^ na, values[b] ^ nb)
+        match kind:
+            case GateKind.AND:
+                values[o] = x & y
+            case GateKind.OR:
+                values[o] = x | y
+            case GateKind.XOR:
+                values[o] = x ^ y
+        for r in sends.get(o, ()):
+            inboxes[r].put({o: (values[o], time.monotonic() + send)})
+    results.put({o: values[o] for (_, o, _, _, _, _) in gates})
+
+def simulate(p: Partition, inputs: [bool], gate_time=0.0, latency=0.0, bandwidth=float('inf'), params=TESTER_N['I_8']) -> ([bool], float):
+    '''
+    Evaluates partition `p` with one process per node and returns (output bits, seconds). Each bootstrap sleeps
+    `gate_time` seconds and each transfer is delivered `transfer_time(params, latency, bandwidth)` seconds after it is
+    sent.
+    '''
+    circuit = p.circuit
+    base = base_wires(circuit)
+    negated = [False for _ in range(circuit.n_wires)]
+    # gates of each node as (kind, out, base of a, a is negated, base of b, b is negated)
+    gates = [[] for _ in range(p.k)]
+    for (kind, o, a, b) in circuit.gates:
+        if kind == GateKind.NOT:
+            negated[o] = not negated[a]
+    for g in p.order():
+        (kind, o, a, b) = circuit.gates[g]
+        gates[p.node[g]].append((kind, o, base[a], negated[a], base[b], negated[b]))
+    inputs = dict(zip(circuit.inputs, inputs))
+
+    inboxes = [multiprocessing.Queue() for _ in range(p.k)]
+    results = multiprocessing.Queue()
+    send = transfer_time(params, latency, bandwidth)
+    processes = [
+        multiprocessing.Process(target=_node, args=(q, gates[q], p.sends, inputs, inboxes, results, gate_time, send))
+        for q in range(p.k)
+    ]
+    start = time.monotonic()
+    for process in processes:
+        process.start()
+    values = dict(inputs)
+    for _ in range(p.k):
+        values.update(results.get())
+    seconds = time.monotonic() - start
+    for process in processes:
+        process.join()
+
+    return ([o if isinstance(o, bool) else values[base[o]] ^ negated[o] for o in circuit.outputs], seconds)
+
+def speedup_report(circuit: Circuit, ks=(1, 2, 4, 8, 16), gate_time=0.02, latency=0.001, bandwidth=1.25e9, params=TESTER_N['I_8'], workers=1):
+    '''
+    Prints transfers, imbalance and modeled speedup over a single node for each no. of nodes in `ks`. Defaults model
+    20ms bootstraps, 1ms latency and 10Gbit/s links.
+    '''
+    single = makespan(partition(circuit, 1), gate_time, latency, bandwidth, params, workers)
+    print(f"{'nodes':>6}{'transfers':>11}{'MiB sent':>10}{'imbalance':>11}{'seconds':>10}{'speedup':>9}")
+    for k in ks:
+        p = partition(circuit, k)
+        seconds = makespan(p, gate_time, latency, bandwidth, params, workers)
+        mib = p.transfers() * ciphertext_bytes(params) / (1 << 20)
+        print(f"{k:>6}{p.transfers():>11}{mib:>10.2f}{p.imbalance():>11.3f}{seconds:>10.2f}{single/seconds:>9.2f}")
+
+def partition_tests():
+    import random
+    from sorting import apply_network, bitonic_network
+
+    rng = random.Random(0)
+    sort16 = trace(lambda *xs: apply_network([FheUint8(bits=x) for x in xs], bitonic_network(16)), [8]*16)
+    circuits = [trace_op(FheUint8, 'Add'), trace_op(FheInt8, 'DivAndRem'), trace_op(FheUint8, 'MinMax'), sort16]
+
+    for circuit in circuits:
+        bootstraps = circuit.stats()['bootstraps']
+        for k in [1, 2, 3, 8]:
+            p = partition(circuit, k)
+            assert sum(p.work) == bootstraps and max(p.work) <= math.ceil(bootstraps / k * 1.05)
+            per_level = {}
+            for g in p.order():
+                per_level.setdefault(p.level[g], [0 for _ in range(k)])[p.node[g]] += 1
+            assert all(max(nodes) <= math.ceil(sum(nodes) / k * 1.05) for nodes in per_level.values())
+            assert k > 1 or p.transfers() == 0
+            # refinement only removes transfers
+            assert p.transfers() <= partition(circuit, k, passes=0).transfers()
+            assert makespan(p, 1.0) >= bootstraps / k
+
+    # processes exchange bits correctly
+    for (circuit, k) in [(circuits[1], 3), (sort16, 4)]:
+        p = partition(circuit, k)
+        for _ in range(2):
+            x = [rng.random() < 0.5 for _ in range(len(circuit.inputs))]
+            assert simulate(p, x)[0] == circuit.evaluate(x)
+
+    # sorting network scales out without latency, and less so with slow links
+    fast = makespan(partition(sort16, 1), 1.0) / makespan(partition(sort16, 4), 1.0)
+    slow = makespan(partition(sort16, 1), 1.0) / makespan(partition(sort16, 4), 1.0, latency=5.0)
+    assert fast > 2 and slow < fast
+
+    # simulated time follows the model
+    p = partition(circuits[0], 2)
+    (_, seconds) = simulate(p, [False]*16, gate_time=0.002, latency=0.002)
+    assert seconds >= makespan(p, 0.002, latency=0.002)
+
+if __name__ == '__main__':
+    from sorting import apply_network, bitonic_network
+
+    partition_tests()
+    for (name, circuit) in [
+        ('FheUint8.DivAndRem', trace_op(FheUint8, 'DivAndRem')),
+        ('bitonic sort of 32 FheUint8', trace(lambda *xs: apply_network([FheUint8(bits=x) for x in xs], bitonic_network(32)), [8]*32)),
+    ]:
+        print(f"{name}, I_8 (n = {TESTER_N['I_8']})")
+        speedup_report(circuit)
@@ -0,0 +1,227 @@
+'''
+Asynchronous evaluation of circuits on a gate server.
+
+Bootstrapped gates run on a (remote) gate server behind a `Backend`. A backend evaluates a batch of gates per call:
+
+    class Backend:
+        async def evaluate(self, batch: [(GateKind, x, y)]) -> [result]
+
+where x, y are operand ciphertexts (python bools for `LocalBackend`). NOT gates are not sent to the backend since
+negation is free (see schedule.py): the evaluator negates operands before sending them, using `Backend.negate`.
+
+`Evaluator` walks a circuit level by level (see `partition.bootstrap_levels`). Gates of a level are independent, hence they are
+split into batches of at-most `batch_size` gates and all batches of the level are sent concurrently, with at-most
+`max_in_flight` calls outstanding. Hence a circuit of depth d requires d rounds of calls instead of one call per gate
+as with the synchronous ops of boolean.py.
+
+`LocalBackend` computes plaintext results and sleeps `call_latency` seconds per call plus `gate_latency` seconds per
+gate on each of its `workers`, hence throughput of evaluator settings can be measured offline (see `throughput_report`).
+'''
+
+from __future__ import annotations
+from circuit import *
+from partition import bootstrap_levels
+import abc
+import asyncio
+import time
+
+class Backend(abc.ABC):
+    '''
+    Interface of gate servers
+    '''
+    @abc.abstractmethod
+    async def evaluate(self, batch: [tuple]) -> list:
+        '''
+        Returns outputs of `batch` of gates, each gate a tuple (kind, x, y) of `GateKind` (AND, OR or XOR) and operands
+        '''
+
+    def negate(self, x):
+        '''
+        Returns negation of ciphertext `x`
+        '''
+        return not x
+
+class LocalBackend(Backend):
+    '''
+    Evaluates gates on plaintext bits with modeled latency. A call takes `call_latency` seconds plus `gate_latency`
+    seconds per gate spread over `workers` parallel workers. Calls are served concurrently.
+
+    - `calls`: no. of calls so far
+    - `gates`: no. of gates evaluated so far
+    - `max_in_flight`: max. no. of calls that were outstanding at the same time
+    '''
+    def __init__(self, call_latency=0.0, gate_latency=0.0, workers=1):
+        self.call_latency = call_latency
+        self.gate_latency = gate_latency
+        self.workers = workers
+        self.calls = 0
+        self.gates = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def evaluate(self, batch: [tuple]) -> [bool]:
+        self.calls += 1
+        self.gates += len(batch)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            rounds = -(-len(batch) // self.workers)
+            await asyncio.sleep(self.call_latency + rounds * self.gate_latency)
+            out = []
+            for (kind, x, y) in batch:
+                match kind:
+                    case GateKind.AND:
+                        out.append(x & y)
+                    case GateKind.OR:
+                        out.append(x | y)
+                    case GateKind.XOR:
+                        out.append(x ^ y)
+            return out
+        finally:
+            self.in_flight -= 1
+
+class Evaluator:
+    '''
+    Evaluates circuits on `backend` (see module doc). `max_in_flight` bounds calls of all circuits evaluated
+    concurrently by the evaluator.
+    '''
+    def __init__(self, backend: Backend, max_in_flight=8, batch_size=64):
+        assert max_in_flight >= 1 and batch_size >= 1
+        self.backend = backend
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self._loop = None
+        self._semaphore = None
+
+    def semaphore(self) -> asyncio.Semaphore:
+        # semaphores are bound to the event loop they are used in
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            (self._loop, self._semaphore) = (loop, asyncio.Semaphore(self.max_in_flight))
+        return self._semaphore
+
+    async def evaluate(self, circuit: Circuit, inputs: list) -> list:
+        '''
+        Returns output ciphertexts of `circuit` for input ciphertexts `inputs`. Constant outputs are returned as python
+        bools.
+        '''
+        values = [None for _ in range(circuit.n_wires)]
+        for (i, v) in zip(circuit.inputs, inputs):
+            values[i] = v
+
+        rounds = {}
+        level = bootstrap_levels(circuit)
+        for (g, (kind, o, a, _)) in enumerate(circuit.gates):
+            if kind != GateKind.NOT:
+                rounds.setdefault(level[g], []).append(g)
+
+        # NOT gates are evaluated after the round of their operand
+        nots = {}
+        for (g, (kind, o, a, _)) in enumerate(circuit.gates):
+            if kind == GateKind.NOT:
+                nots.setdefault(level[g], []).append(g)
+
+        def negate(l: int):
+            for g in nots.get(l, ()):
+                (_, o, a, _) = circuit.gates[g]
+                values[o] = self.backend.negate(values[a])
+
+        semaphore = self.semaphore()
+
+        async def call(batch: [int]):
+            async with semaphore:
+                out = await self.backend.evaluate([(circuit.gates[g][0], values[circuit.gates[g][2]], values[circuit.gates[g][3]]) for g in batch])
+            for (g, v) in zip(batch, out):
+                values[circuit.gates[g][1]] = v
+
+        for l in sorted(set(rounds) | set(nots)):
+            gates = rounds.get(l, [])
+            await asyncio.gather(*[call(gates[i:i+self.batch_size]) for i in range(0, len(gates), self.batch_size)])
+            negate(l)
+
+        return [o if isinstance(o, bool) else values[o] for o in circuit.outputs]
+
+    async def run(self, cls, op: str, *values):
+        '''
+        Evaluates `op` of `cls` (as in `trace_op`) on `values` and returns the result as the op does
+        '''
+        circuit = _traced(cls, op)
+        (bits, _) = flatten(values)
+        return unflatten(iter(await self.evaluate(circuit, bits)), circuit.layout)
+
+# (class name, op) -> traced circuit
+_TRACED = {}
+
+def _traced(cls, op: str) -> Circuit:
+    key = (cls.__name__, op)
+    if key not in _TRACED:
+        _TRACED[key] = trace_op(cls, op)
+    return _TRACED[key]
+
+def throughput_report(circuit: Circuit, n_circuits=8, call_latency=0.005, gate_latency=0.0005, workers=16):
+    '''
+    Prints time to evaluate `n_circuits` copies of `circuit` concurrently on a `LocalBackend` for evaluator settings,
+    from sequential (one gate per call, one call in flight) to batched
+    '''
+    settings = [(1, 1), (8, 1), (64, 1), (1, 64), (8, 64), (64, 64)]
+    print(f"{'in_flight':>10}{'batch':>7}{'calls':>8}{'seconds':>9}{'gates/s':>9}")
+    for (max_in_flight, batch_size) in settings:
+        backend = LocalBackend(call_latency, gate_latency, workers)
+        evaluator = Evaluator(backend, max_in_flight, batch_size)
+        inputs = [False for _ in circuit.inputs]
+
+        async def main():
+            return await asyncio.gather(*[evaluator.evaluate(circuit, inputs) for _ in range(n_circuits)])
+
+        start = time.monotonic()
+        asyncio.run(main())
+        seconds = time.monotonic() - start
+        print(f"{max_in_flight:>10}{batch_size:>7}{backend.calls:>8}{seconds:>9.2f}{backend.gates/seconds:>9.0f}")
+
+def remote_tests():
+    import random
+
+    rng = random.Random(0)
+    for cls in [FheUint8, FheInt8]:
+        for op in ['Add', 'Mul', 'DivAndRem', 'Compare', 'MinMax', 'Shl']:
+            circuit = trace_op(cls, op)
+            # no. of bootstrapped gates per level
+            level = bootstrap_levels(circuit)
+            width = {}
+            for (g, (kind, _, _, _)) in enumerate(circuit.gates):
+                if kind != GateKind.NOT:
+                    width[level[g]] = width.get(level[g], 0) + 1
+            for (max_in_flight, batch_size) in [(1, 1), (3, 2), (8, 64)]:
+                backend = LocalBackend()
+                evaluator = Evaluator(backend, max_in_flight, batch_size)
+                for _ in range(4):
+                    x = [rng.random() < 0.5 for _ in range(16)]
+                    assert asyncio.run(evaluator.evaluate(circuit, x)) == circuit.evaluate(x), f'{cls.__name__}.{op}'
+                assert backend.max_in_flight <= max_in_flight
+                # ceil(gates / batch_size) calls per level, i.e. one call per level when levels fit in a batch
+                assert backend.calls == 4 * sum(-(-w // batch_size) for w in width.values()), f'{cls.__name__}.{op}'
+                if batch_size >= max(width.values()):
+                    assert backend.calls == 4 * len(width)
+
+    # ops through the evaluator
+    evaluator = Evaluator(LocalBackend())
+    (q, r, div_by_zero) = asyncio.run(evaluator.run(FheUint8, 'DivAndRem', FheUint8.from_uint8(200), FheUint8.from_uint8(7)))
+    assert (q.to_uint8(), r.to_uint8(), div_by_zero) == (28, 4, False)
+    s = asyncio.run(evaluator.run(FheInt8, 'Mul', FheInt8.from_int8(-7), FheInt8.from_int8(9)))
+    assert s.to_int8() == -63
+
+    # batching and concurrency hide latency
+    circuit = trace_op(FheUint8, 'Add')
+    x = [False for _ in range(16)]
+    times = []
+    for (max_in_flight, batch_size) in [(1, 1), (8, 64)]:
+        evaluator = Evaluator(LocalBackend(call_latency=0.002), max_in_flight, batch_size)
+        start = time.monotonic()
+        asyncio.run(evaluator.evaluate(circuit, x))
+        times.append(time.monotonic() - start)
+    assert 2*times[1] < times[0]
+
+if __name__ == '__main__':
+    remote_tests()
+    print('FheUint8.Mul')
+    throughput_report(trace_op(FheUint8, 'Mul'))
@@ -0,0 +1,404 @@
+'''
+Memory bounded scheduling of circuits.
+
+Every bit of a circuit is an LWE ciphertext of n+1 words (n = `Parameters.n` in noise/tester.py, 480 to 660), hence
+peak memory of an evaluator is the max. no. of bits that are live at the same time. A bit is live from the step that
+evaluates it until the last step that reads it (outputs are live until the end).
+
+A schedule is a list of steps. Each step evaluates at-most `workers` bootstrapped gates in parallel. NOT gates are not
+evaluated on their own: negation of an LWE ciphertext is free, hence a gate reading !x reads x and negates it. Hence a
+NOT gate does not occupy a worker or a buffer, but keeps its operand live.
+
+Two schedulers:
+    - `asap_schedule`: gates in order of their level (see `Circuit.levels`). Maximises parallelism but keeps all
+      bits of a level live at the same time.
+    - `memory_aware_schedule`: list scheduling that, among ready gates, prefers gates that free the most buffers
+      (gates that are the last reader of their operands) and then gates on the critical path. Optionally, bounds no.
+      of live bits with `max_live`.
+
+`allocate` assigns each bit to a buffer with linear scan over the schedule, i.e. a buffer is reused as soon as the
+bit it holds is dead. No. of buffers equals the peak no. of live bits.
+'''
+
+from __future__ import annotations
+from circuit import *
+import ast
+import heapq
+import os
+
+# bytes per word of an LWE ciphertext
+WORD_BYTES = 8
+
+TESTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'noise', 'tester.py')
+
+# n of the parameter sets in noise/tester.py, used when the file is not available
+TESTER_N_FALLBACK = {
+    'I_2_HB_FR': 520, 'I_2_LB_SR': 580, 'I_4': 620, 'I_8': 660,
+    'NI_2': 520, 'NI_4_HB_FR': 620, 'NI_4_LB_SR': 620, 'NI_8': 660,
+    'NI_2_FP_2_48': 480, 'NI_8_FP_2_40': 520, 'I_8_HB_FR': 520,
+}
+
+def tester_n(path=TESTER_PATH) -> dict:
+    '''
+    Returns name -> n of parameter sets (module level `Parameters(...)` with a literal n) in noise/tester.py. Parsed
+    from the source since importing tester.py requires sage. Returns a copy of TESTER_N_FALLBACK if the file does not
+    exist (e.g. bool-api is used without noise/).
+    '''
+    if not os.path.exists(path):
+        return dict(TESTER_N_FALLBACK)
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    out = {}
+    for stmt in tree.body:
+        if not (isinstance(stmt, ast.Assign) and isinstance(stmt.value, ast.Call)):
+            continue
+        if not (isinstance(stmt.value.func, ast.Name) and stmt.value.func.id == 'Parameters'):
+            continue
+        for kw in stmt.value.keywords:
+            if kw.arg == 'n' and isinstance(kw.value, ast.Constant):
+                for target in stmt.targets:
+                    if isinstance(target, ast.Name):
+                        out[target.id] = kw.value.value
+    return out
+
+# n of parameter sets in noise/tester.py
+TESTER_N = tester_n()
+
+def ciphertext_bytes(params, word_bytes=WORD_BYTES) -> int:
+    '''
+    Returns size in bytes of an LWE ciphertext for `params`: `Parameters` of noise/tester.py or its n
+    '''
+    n = params if isinstance(params, int) else params.n
+    return (n+1) * word_bytes
+
+class Schedule:
+    '''
+    - `steps`: list of steps, each a list of gate indices (into `circuit.gates`) evaluated in parallel
+    - `buffers`: wire id -> buffer index, for inputs and bootstrapped gates
+    - `n_buffers`: no. of buffers, i.e. peak no. of live ciphertexts
+    - `live`: no. of live ciphertexts after allocating outputs of each step
+    '''
+    def __init__(self, circuit: Circuit, steps: [[int]]):
+        self.circuit = circuit
+        self.steps = steps
+        (self.buffers, self.n_buffers, self.live) = allocate(circuit, steps)
+
+    def peak_bytes(self, params, word_bytes=WORD_BYTES) -> int:
+        '''
+        Returns peak memory in bytes for `params` (see `ciphertext_bytes`)
+        '''
+        return self.n_buffers * ciphertext_bytes(params, word_bytes)
+
+def base_wires(circuit: Circuit) -> [int]:
+    '''
+    Returns, for each wire, the wire that holds its ciphertext: wire itself or, for outputs of NOT gates, the operand
+    they negate (recursively)
+    '''
+    base = list(range(circuit.n_wires))
+    for (kind, o, a, _) in circuit.gates:
+        if kind == GateKind.NOT:
+            base[o] = base[a]
+    return base
+
+def readers(circuit: Circuit) -> ([set], [int]):
+    '''
+    Returns (operands, uses) where operands[k] is the set of base wires read by k^th gate (empty for NOT gates) and
+    uses[w] is the no. of bootstrapped gates that read base wire w
+    '''
+    base = base_wires(circuit)
+    operands = []
+    uses = [0 for _ in range(circuit.n_wires)]
+    for (kind, _, a, b) in circuit.gates:
+        if kind == GateKind.NOT:
+            operands.append(set())
+            continue
+        ops = {base[a], base[b]}
+        for w in ops:
+            uses[w] += 1
+        operands.append(ops)
+    return (operands, uses)
+
+def output_bases(circuit: Circuit) -> set:
+    base = base_wires(circuit)
+    return {base[o] for o in circuit.outputs if not isinstance(o, bool)}
+
+def live_ranges(circuit: Circuit, steps: [[int]]) -> {int: (int, int)}:
+    '''
+    Returns base wire -> (step that evaluates it, last step that reads it). Inputs are evaluated at step -1 and outputs
+    are read at step len(steps).
+    '''
+    (operands, _) = readers(circuit)
+    ranges = {i: [-1, -1] for i in circuit.inputs}
+    for (t, step) in enumerate(steps):
+        for k in step:
+            ranges[circuit.gates[k][1]] = [t, t]
+        for k in step:
+            for w in operands[k]:
+                ranges[w][1] = max(ranges[w][1], t)
+    for w in output_bases(circuit):
+        ranges[w][1] = len(steps)
+    return {w: tuple(r) for (w, r) in ranges.items()}
+
+def allocate(circuit: Circuit, steps: [[int]]) -> (dict, int, [int]):
+    '''
+    Returns (buffers, n_buffers, live) for `steps` (see `Schedule`). Outputs of a step are allocated before its
+    operands are freed, since gates of a step are evaluated in parallel.
+    '''
+    ranges = live_ranges(circuit, steps)
+    dies_at = [[] for _ in range(len(steps))]
+    for (w, (_, last)) in ranges.items():
+        if 0 <= last < len(steps):
+            dies_at[last].append(w)
+
+    buffers = {}
+    free = []
+    n_buffers = 0
+
+    def take():
+        nonlocal n_buffers
+        if free:
+            return heapq.heappop(free)
+        n_buffers += 1
+        return n_buffers - 1
+
+    for i in circuit.inputs:
+        buffers[i] = take()
+    # inputs that are never read
+    for i in circuit.inputs:
+        if ranges[i][1] == -1:
+            heapq.heappush(free, buffers[i])
+
+    n_live = len(circuit.inputs) - len(free)
+    live = []
+    for (t, step) in enumerate(steps):
+        for k in step:
+            buffers[circuit.gates[k][1]] = take()
+        n_live += len(step)
+        live.append(n_live)
+        for w in dies_at[t]:
+            heapq.heappush(free, buffers[w])
+        n_live -= len(dies_at[t])
+    return (buffers, n_buffers, live)
+
+def heights(circuit: Circuit) -> [int]:
+    '''
+    Returns, for each gate, max. no. of bootstrapped gates on a path from the gate to an output (including the gate)
+    '''
+    height = [0 for _ in range(circuit.n_wires)]
+    out = [0 for _ in circuit.gates]
+    for k in range(len(circuit.gates)-1, -1, -1):
+        (kind, o, a, b) = circuit.gates[k]
+        h = height[o] + (0 if kind == GateKind.NOT else 1)
+        out[k] = h
+        for w in (a, b):
+            if w is not None:
+                height[w] = max(height[w], h)
+    return out
+
+def asap_schedule(circuit: Circuit, workers: int) -> Schedule:
+    '''
+    Returns schedule that evaluates gates level by level with at-most `workers` gates per step
+    '''
+    levels = {}
+    wire_level = [0 for _ in range(circuit.n_wires)]
+    for (k, (kind, o, a, b)) in enumerate(circuit.gates):
+        d = max(wire_level[a], 0 if b is None else wire_level[b])
+        if kind == GateKind.NOT:
+            wire_level[o] = d
+            continue
+        wire_level[o] = d + 1
+        levels.setdefault(d + 1, []).append(k)
+
+    steps = []
+    for l in sorted(levels):
+        for i in range(0, len(levels[l]), workers):
+            steps.append(levels[l][i:i+workers])
+    return Schedule(circuit, steps)
+
+def memory_aware_schedule(circuit: Circuit, workers: int, max_live=None) -> Schedule:
+    '''
+    Returns schedule with at-most `workers` gates per step that greedily minimises no. of live ciphertexts (see module
+    doc). If `max_live` is set, a step stops taking gates that do not free any buffer once no. of live ciphertexts
+    reaches `max_live` (a step always evaluates at-least one gate, hence the bound may be exceeded when every ready gate
+    increases memory).
+    '''
+    (operands, uses) = readers(circuit)
+    outputs = output_bases(circuit)
+    height = heights(circuit)
+    base = base_wires(circuit)
+
+    remaining = list(uses)
+    # no. of operands of each gate that are not evaluated yet
+    waiting = [len(ops) for ops in operands]
+    consumers = [[] for _ in range(circuit.n_wires)]
+    for (k, ops) in enumerate(operands):
+        for w in ops:
+            consumers[w].append(k)
+    for i in circuit.inputs:
+        for k in consumers[i]:
+            waiting[k] -= 1
+
+    def freed(k: int) -> int:
+        return sum(1 for w in operands[k] if remaining[w] == 1 and w not in outputs)
+
+    heap = []
+    def push(k: int):
+        heapq.heappush(heap, (-freed(k), -height[k], k))
+
+    bootstrapped = [k for (k, g) in enumerate(circuit.gates) if g[0] != GateKind.NOT]
+    for k in bootstrapped:
+        if waiting[k] == 0:
+            push(k)
+
+    done = [False for _ in circuit.gates]
+    n_live = sum(1 for i in circuit.inputs if remaining[i] > 0 or i in outputs)
+    steps = []
+    while heap:
+        step = []
+        deferred = []
+        while heap and len(step) < workers:
+            (f, h, k) = heapq.heappop(heap)
+            if done[k]:
+                continue
+            if -f != freed(k):
+                # stale priority
+                push(k)
+                continue
+            if max_live is not None and -f == 0 and len(step) > 0 and n_live + len(step) >= max_live:
+                deferred.append((f, h, k))
+                break
+            step.append(k)
+            done[k] = True
+        for entry in deferred:
+            heapq.heappush(heap, entry)
+        if len(step) == 0:
+            break
+
+        n_live += len(step)
+        for k in step:
+            for w in operands[k]:
+                remaining[w] -= 1
+                if remaining[w] == 0 and w not in outputs:
+                    n_live -= 1
+                elif remaining[w] == 1:
+                    # last reader of w now frees it
+                    for c in consumers[w]:
+                        if not done[c] and waiting[c] == 0:
+                            push(c)
+        for k in step:
+            o = circuit.gates[k][1]
+            if uses[o] == 0 and o not in outputs:
+                n_live -= 1
+            for c in consumers[o]:
+                waiting[c] -= 1
+                if waiting[c] == 0:
+                    push(c)
+        steps.append(step)
+
+    assert all(done[k] for k in bootstrapped)
+    return Schedule(circuit, steps)
+
+def minimize_peak(circuit: Circuit, workers: int, budgets=8) -> Schedule:
+    '''
+    Returns schedule with min. peak no. of live ciphertexts (and then min. no. of steps) among ASAP, memory aware and
+    memory aware with `budgets` values of `max_live` between no. of inputs and peak of the memory aware schedule
+    '''
+    greedy = memory_aware_schedule(circuit, workers)
+    candidates = [asap_schedule(circuit, workers), greedy]
+    lo = len(circuit.inputs)
+    for i in range(budgets):
+        max_live = lo + (greedy.n_buffers - lo) * i // budgets
+        candidates.append(memory_aware_schedule(circuit, workers, max_live=max_live))
+    return min(candidates, key=lambda s: (s.n_buffers, len(s.steps)))
+
+def execute(schedule: Schedule, inputs: [bool]) -> [bool]:
+    '''
+    Evaluates circuit of `schedule` step by step over `n_buffers` buffers and returns output bits. Used to check that
+    no buffer is overwritten while its bit is live.
+    '''
+    circuit = schedule.circuit
+    base = base_wires(circuit)
+    negated = [False for _ in range(circuit.n_wires)]
+    for (kind, o, a, _) in circuit.gates:
+        if kind == GateKind.NOT:
+            negated[o] = not negated[a]
+
+    memory = [None for _ in range(schedule.n_buffers)]
+    for (i, v) in zip(circuit.inputs, inputs):
+        memory[schedule.buffers[i]] = v
+
+    def read(w: int) -> bool:
+        return memory[schedule.buffers[base[w]]] ^ negated[w]
+
+    for step in schedule.steps:
+        results = []
+        for k in step:
+            (kind, o, a, b) = circuit.gates[k]
+            match kind:
+                case GateKind.AND:
+                    results.append((o, read(a) & read(b)))
+                case GateKind.OR:
+                    results.append((o, read(a) | read(b)))
+                case GateKind.XOR:
+                    results.append((o, read(a) ^ read(b)))
+        for (o, v) in results:
+            memory[schedule.buffers[o]] = v
+    return [o if isinstance(o, bool) else read(o) for o in circuit.outputs]
+
+def memory_report(circuit: Circuit, params, workers=(1, 4, 16, 64), word_bytes=WORD_BYTES):
+    '''
+    Prints steps, peak live ciphertexts and peak memory of all schedulers for `params` (see `ciphertext_bytes`)
+    '''
+    print(f"{'scheduler':<14}{'workers':>8}{'steps':>8}{'peak':>8}{'peak MiB':>10}")
+    for w in workers:
+        for (name, schedule) in [('asap', asap_schedule(circuit, w)), ('memory_aware', memory_aware_schedule(circuit, w)), ('min_peak', minimize_peak(circuit, w))]:
+            mib = schedule.peak_bytes(params, word_bytes) / (1 << 20)
+            print(f"{name:<14}{w:>8}{len(schedule.steps):>8}{schedule.n_buffers:>8}{mib:>10.2f}")
+
+def schedule_tests():
+    import random
+    from sorting import apply_network, bitonic_network
+
+    rng = random.Random(0)
+    circuits = [trace_op(cls, op) for cls in [FheUint8, FheInt8] for op in ['Add', 'Mul', 'DivAndRem', 'MinMax']]
+    circuits.append(trace(lambda *xs: apply_network([FheUint8(bits=x) for x in xs], bitonic_network(16)), [8]*16))
+    circuits.append(trace(lambda *xs: FheUint8.Sum([FheUint8(bits=x) for x in xs], overflow='wide'), [8]*32))
+
+    for circuit in circuits:
+        n_inputs = len(circuit.inputs)
+        for workers in [1, 3, 16]:
+            asap = asap_schedule(circuit, workers)
+            greedy = memory_aware_schedule(circuit, workers)
+            bounded = memory_aware_schedule(circuit, workers, max_live=n_inputs)
+            best = minimize_peak(circuit, workers)
+            for schedule in [asap, greedy, bounded, best]:
+                assert all(len(step) <= workers for step in schedule.steps)
+                assert schedule.n_buffers == max(schedule.live + [n_inputs])
+                for _ in range(8):
+                    x = [rng.random() < 0.5 for _ in range(n_inputs)]
+                    assert execute(schedule, x) == circuit.evaluate(x)
+            assert best.n_buffers <= min(asap.n_buffers, greedy.n_buffers, bounded.n_buffers)
+            # a single worker evaluates one gate per step either way
+            if workers == 1:
+                assert len(greedy.steps) == len(asap.steps) and greedy.n_buffers <= asap.n_buffers
+
+    # sorting network keeps ~half the ciphertexts live
+    circuit = circuits[-2]
+    assert 3*minimize_peak(circuit, 4).n_buffers < 2*asap_schedule(circuit, 4).n_buffers
+    assert asap_schedule(circuit, 1).peak_bytes(TESTER_N['NI_2']) == asap_schedule(circuit, 1).n_buffers * 521 * WORD_BYTES
+    assert TESTER_N['NI_2_FP_2_48'] == 480 and TESTER_N['I_8_HB_FR'] == 520 and TESTER_N['I_8'] == 660
+    # fallback is in sync with noise/tester.py
+    if os.path.exists(TESTER_PATH):
+        assert TESTER_N == TESTER_N_FALLBACK
+    assert tester_n(os.path.join(os.path.dirname(TESTER_PATH), 'missing.py')) == TESTER_N_FALLBACK
+
+if __name__ == '__main__':
+    from sorting import apply_network, bitonic_network
+
+    schedule_tests()
+    for (name, circuit) in [
+        ('FheUint8.DivAndRem', trace_op(FheUint8, 'DivAndRem')),
+        ('bitonic sort of 32 FheUint8', trace(lambda *xs: apply_network([FheUint8(bits=x) for x in xs], bitonic_network(32)), [8]*32)),
+    ]:
+        print(f"{name}, I_8 (n = {TESTER_N['I_8']})")
+        memory_report(circuit, TESTER_N['I_8'])
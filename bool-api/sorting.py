@@ -0,0 +1,226 @@
+'''
+Sorting networks and top-k selection over arrays of encrypted integers.
+
+A sorting network is a fixed sequence of compare-and-swap units and hence does not branch on the values it sorts. Here
+a network is a list of layers, each layer a list of pairs (i, j): after the layer, position i holds min and position j
+holds max of the two values. Pairs within a layer touch disjoint positions, hence the layer is the schedule: all
+compare-and-swaps of a layer are independent and run in parallel.
+
+Compare-and-swap is `MinMax`, i.e. one `GreaterThan` comparator and a shared select of both outputs. Networks:
+
+    - bitonic: n/4 * log(n) * (log(n)+1) compare-and-swaps in log(n) * (log(n)+1) / 2 layers
+    - odd-even merge (Batcher): fewer compare-and-swaps than bitonic in the same no. of layers
+    - top-k: sorts blocks of k and repeatedly keeps the top k of two blocks (see `top_k_network`). Requires
+      O(n * log(k)^2) compare-and-swaps instead of O(n * log(n)^2) for a full sort.
+
+Networks are defined for powers of 2. Other lengths are padded with constants (max value for sorting, min value for
+top-k), whose bits are python bools and hence fold most gates of compare-and-swaps that involve them.
+'''
+
+from __future__ import annotations
+from circuit import *
+
+NETWORKS = ('bitonic', 'odd_even_merge')
+
+def next_power_of_two(n: int) -> int:
+    return 1 if n <= 1 else 1 << (n-1).bit_length()
+
+def bitonic_merge_layers(n: int, offset=0) -> [[(int, int)]]:
+    '''
+    Returns layers that sort bitonic sequence at positions offset..offset+n-1 in ascending order
+    '''
+    layers = []
+    j = n >> 1
+    while j > 0:
+        layers.append([(offset+i, offset+(i ^ j)) for i in range(n) if (i ^ j) > i])
+        j >>= 1
+    return layers
+
+def bitonic_network(n: int, offset=0) -> [[(int, int)]]:
+    '''
+    Returns layers of bitonic sorting network that sorts positions offset..offset+n-1 in ascending order
+    '''
+    assert n & (n-1) == 0
+    layers = []
+    k = 2
+    while k <= n:
+        j = k >> 1
+        while j > 0:
+            layer = []
+            for i in range(n):
+                l = i ^ j
+                if l > i:
+                    # blocks of size k alternate between ascending and descending order
+                    layer.append((offset+i, offset+l) if (i & k) == 0 else (offset+l, offset+i))
+            layers.append(layer)
+            j >>= 1
+        k <<= 1
+    return layers
+
+def odd_even_merge_network(n: int) -> [[(int, int)]]:
+    '''
+    Returns layers of Batcher's odd-even merge sorting network for n positions
+    '''
+    assert n & (n-1) == 0
+    layers = []
+    p = 1
+    while p < n:
+        k = p
+        while k >= 1:
+            layer = []
+            for j in range(k % p, n-k, 2*k):
+                for i in range(min(k, n-j-k)):
+                    if (i+j) // (2*p) == (i+j+k) // (2*p):
+                        layer.append((i+j, i+j+k))
+            layers.append(layer)
+            k >>= 1
+        p <<= 1
+    return layers
+
+def top_k_network(n: int, k: int) -> ([[(int, int)]], [int]):
+    '''
+    Returns (layers, positions) of a network that selects k largest of n values. After the network, `positions` hold
+    the k largest values in descending order.
+
+    n and k must be powers of 2 with k <= n. The network
+        (1) sorts each block of k positions in ascending order with bitonic sort
+        (2) pairs up blocks A and B, and compares A[t] with B[k-1-t]. Maxes are moved into B. B then holds the k
+            largest of A and B as a bitonic sequence, which is sorted with bitonic merge. A is discarded.
+    (2) is repeated on the remaining blocks until one block is left.
+    '''
+    assert n & (n-1) == 0 and k & (k-1) == 0 and 1 <= k <= n
+
+    # (1) all blocks are sorted in parallel, hence layers of each block are merged
+    layers = [[] for _ in bitonic_network(k)]
+    for offset in range(0, n, k):
+        for (l, layer) in enumerate(bitonic_network(k, offset)):
+            layers[l] += layer
+
+    # (2)
+    blocks = list(range(0, n, k))
+    while len(blocks) > 1:
+        exchange = []
+        merges = [[] for _ in bitonic_merge_layers(k)]
+        for (a, b) in zip(blocks[0::2], blocks[1::2]):
+            exchange += [(a+t, b+k-1-t) for t in range(k)]
+            for (l, layer) in enumerate(bitonic_merge_layers(k, b)):
+                merges[l] += layer
+        layers += [exchange] + merges
+        blocks = blocks[1::2]
+
+    return ([layer for layer in layers if len(layer)], [blocks[0]+k-1-t for t in range(k)])
+
+def constant(cls, maximum: bool):
+    '''
+    Returns max. (or min.) value of `cls` with bits as python bools
+    '''
+    (_, width, signed) = FHE_TYPES[cls.__name__]
+    bits = [maximum for _ in range(width)]
+    if signed:
+        bits[-1] = not maximum
+    return cls(bits=bits)
+
+def apply_network(values: list, layers: [[(int, int)]]) -> list:
+    '''
+    Evaluates compare-and-swaps of `layers` over `values` and returns the permuted values
+    '''
+    values = list(values)
+    for layer in layers:
+        for (i, j) in layer:
+            (values[i], values[j]) = values[i].MinMax(values[j])
+    return values
+
+def sort(values: list, network='bitonic', descending=False) -> list:
+    '''
+    Returns `values` (FheUint8 or FheInt8) sorted with `network` (one of NETWORKS)
+    '''
+    assert network in NETWORKS
+    if len(values) == 0:
+        return []
+    cls = type(values[0])
+    n = next_power_of_two(len(values))
+    layers = bitonic_network(n) if network == 'bitonic' else odd_even_merge_network(n)
+    out = apply_network(list(values) + [constant(cls, True) for _ in range(n-len(values))], layers)[:len(values)]
+    return out[::-1] if descending else out
+
+def top_k(values: list, k: int) -> list:
+    '''
+    Returns k largest of `values` (FheUint8 or FheInt8) in descending order
+    '''
+    assert 1 <= k <= len(values)
+    cls = type(values[0])
+    block = next_power_of_two(k)
+    n = max(next_power_of_two(len(values)), block)
+    (layers, positions) = top_k_network(n, block)
+    out = apply_network(list(values) + [constant(cls, False) for _ in range(n-len(values))], layers)
+    return [out[p] for p in positions[:k]]
+
+def network_stats(cls, layers: [[(int, int)]]) -> dict:
+    '''
+    Returns no. of compare-and-swaps, layers, bootstraps and depth of `layers` over `cls` without tracing the whole
+    network. Bootstraps are exact. Depth is an upper bound: depth of a compare-and-swap times no. of layers.
+    '''
+    (_, width, _) = FHE_TYPES[cls.__name__]
+    unit = trace(lambda a, b: cls(bits=a).MinMax(cls(bits=b)), [width, width]).stats()
+    n_units = sum(len(layer) for layer in layers)
+    return {
+        'compare_swaps': n_units,
+        'layers': len(layers),
+        'bootstraps': n_units * unit['bootstraps'],
+        'depth': len(layers) * unit['depth'],
+    }
+
+def sorting_report(ns=(16, 64, 256, 1024, 4096), cls=FheUint8, k=8):
+    '''
+    Prints gate counts and depth of each network for `ns` values
+    '''
+    print(f"{'network':<16}{'n':>6}{'compare_swaps':>15}{'layers':>8}{'bootstraps':>12}{'depth':>8}")
+    for n in ns:
+        networks = [('bitonic', bitonic_network(n)), ('odd_even_merge', odd_even_merge_network(n))]
+        if k <= n:
+            networks.append((f'top_{k}', top_k_network(n, k)[0]))
+        for (name, layers) in networks:
+            s = network_stats(cls, layers)
+            print(f"{name:<16}{n:>6}{s['compare_swaps']:>15}{s['layers']:>8}{s['bootstraps']:>12}{s['depth']:>8}")
+
+def sorting_tests():
+    import random
+
+    rng = random.Random(0)
+    for cls in [FheUint8, FheInt8]:
+        (lo, hi) = (0, 255) if cls == FheUint8 else (-128, 127)
+        encrypt = FheUint8.from_uint8 if cls == FheUint8 else FheInt8.from_int8
+        value = (lambda o: o.to_uint8()) if cls == FheUint8 else (lambda o: o.to_int8())
+        for n in [1, 2, 3, 5, 8, 16, 33]:
+            xs = [rng.randint(lo, hi) for _ in range(n)]
+            # duplicates
+            xs[n//2] = xs[0]
+            enc = [encrypt(x) for x in xs]
+            for network in NETWORKS:
+                assert [value(v) for v in sort(enc, network=network)] == sorted(xs), f'{network}, {xs}'
+            assert [value(v) for v in sort(enc, descending=True)] == sorted(xs, reverse=True)
+            for k in range(1, n+1):
+                assert [value(v) for v in top_k(enc, k)] == sorted(xs, reverse=True)[:k], f'top {k} of {xs}'
+
+    # networks sort all 0/1 inputs, hence all inputs (0-1 principle)
+    for n in [2, 4, 8, 16]:
+        for (layers, positions) in [(bitonic_network(n), range(n)), (odd_even_merge_network(n), range(n))] + [(top_k_network(n, k)[0], top_k_network(n, k)[1][::-1]) for k in [1, 2, 4, n] if k <= n]:
+            for x in range(1 << n):
+                bits = [(x >> i) & 1 for i in range(n)]
+                for layer in layers:
+                    assert len({p for pair in layer for p in pair}) == 2*len(layer)
+                    for (i, j) in layer:
+                        (bits[i], bits[j]) = (min(bits[i], bits[j]), max(bits[i], bits[j]))
+                got = [bits[p] for p in positions]
+                assert got == sorted(bits)[n-len(got):], (n, x)
+
+    # estimated stats against the traced network
+    for (cls, n) in [(FheUint8, 16), (FheInt8, 8)]:
+        for layers in [bitonic_network(n), odd_even_merge_network(n), top_k_network(n, 4)[0]]:
+            traced = trace(lambda *xs: apply_network([cls(bits=x) for x in xs], layers), [8]*n).stats()
+            estimate = network_stats(cls, layers)
+            assert traced['bootstraps'] == estimate['bootstraps'] and traced['depth'] <= estimate['depth']
+
+if __name__ == '__main__':
+    sorting_tests()
+    sorting_report()
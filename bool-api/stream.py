@@ -0,0 +1,152 @@
+'''
+Streaming evaluation of operations over operand files.
+
+`stream_op` evaluates a binary operation of `FheUint8`/`FheInt8` on all pairs of values in two operand files and
+writes results to an output file, without loading the files in memory:
+
+    stream_op(FheUint8, 'Add', 'a.u8', 'b.u8', 'out.npy')
+
+Operand files are flat binary files of uint8/int8 values or `.npy` files, and are memory-mapped. The output is a `.npy`
+file of a structured array with one field per output value of the operation (for ex, `Add` has fields f0 (uint8/int8)
+and f1 (bool, the overflow flag)), created with `np.lib.format.open_memmap`.
+
+Values are processed in chunks of `chunk_size` pairs through the compiled circuit of the operation (numpy backend of
+compiler.py). Each chunk is bit-sliced into uint64 words, i.e. each word holds a bit of 64 values, hence bitwise ops of
+the compiled circuit evaluate 64 pairs per word and a chunk requires chunk_size / 8 bytes per wire of the circuit. Chunks
+are processed by a pool of `workers` threads (numpy releases the GIL in bitwise ops), hence reading of a chunk, compute
+of another chunk and writing of yet another chunk overlap. At-most 2 * `workers` chunks are in flight, hence memory use
+is bounded independent of size of the files.
+'''
+
+from __future__ import annotations
+from circuit import *
+from compiler import compiled
+from concurrent.futures import ThreadPoolExecutor
+import collections
+
+def open_operands(path, dtype) -> np.ndarray:
+    '''
+    Returns read-only memory map of values in `path`: `.npy` file or flat binary file of `dtype` values
+    '''
+    if str(path).endswith('.npy'):
+        values = np.load(path, mmap_mode='r')
+        assert values.dtype == dtype and values.ndim == 1, f'{path}: expected 1-d array of {dtype}'
+        return values
+    return np.memmap(path, dtype=dtype, mode='r')
+
+def pack(values: np.ndarray, width: int) -> [np.ndarray]:
+    '''
+    Returns `width` uint64 arrays where bit j of word k of i^th array is i^th bit of value 64*k+j of `values`
+    '''
+    n = len(values)
+    v = np.zeros(-(-n // 64) * 64, dtype=np.uint8)
+    v[:n] = values.view(np.uint8)
+    return [np.packbits((v >> i) & 1, bitorder='little').view(np.uint64) for i in range(width)]
+
+def unpack(words: np.ndarray, n: int) -> np.ndarray:
+    '''
+    Inverse of `pack` for a single bit. Returns bool array of n bits.
+    '''
+    return np.unpackbits(words.view(np.uint8), bitorder='little')[:n].astype(bool)
+
+def output_fields(layout: tuple) -> [(np.dtype, int)]:
+    '''
+    Returns (dtype, width) of each output value of `layout` in order
+    '''
+    match layout[0]:
+        case 'bit':
+            return [(np.dtype(bool), 1)]
+        case 'tuple' | 'list':
+            return [f for l in layout[1] for f in output_fields(l)]
+    (_, width, signed) = FHE_TYPES[layout[0]]
+    return [(np.dtype(np.int8 if signed else np.uint8), width)]
+
+def stream_op(cls, op: str, a_path, b_path, out_path, chunk_size=1 << 16, workers=3) -> int:
+    '''
+    Evaluates `op` of `cls` on pairs of values of `a_path` and `b_path` and writes results to `out_path` (see module
+    doc). Returns no. of pairs.
+    '''
+    (_, width, signed) = FHE_TYPES[cls.__name__]
+    dtype = np.dtype(np.int8 if signed else np.uint8)
+    (fn, layout) = compiled(f'{cls.__name__}.{op}', width, 'numpy', lambda: trace_op(cls, op))
+    fields = output_fields(layout)
+
+    a = open_operands(a_path, dtype)
+    b = open_operands(b_path, dtype)
+    assert len(a) == len(b), 'operand files must have the same no. of values'
+    n = len(a)
+    out = np.lib.format.open_memmap(out_path, mode='w+', dtype=[(f'f{i}', d) for (i, (d, _)) in enumerate(fields)], shape=(n,))
+    assert chunk_size % 64 == 0
+
+    def process(start: int, stop: int):
+        bits = fn(pack(np.asarray(a[start:stop]), width) + pack(np.asarray(b[start:stop]), width))
+        bits = iter(bits)
+        for (i, (d, w)) in enumerate(fields):
+            acc = np.zeros(stop - start, dtype=np.uint8)
+            for j in range(w):
+                words = next(bits)
+                if words.dtype == bool:
+                    # constant output
+                    words = np.full(-(-(stop - start) // 64), np.uint64(0xFFFFFFFFFFFFFFFF) if words.all() else np.uint64(0))
+                acc |= unpack(words, stop - start).astype(np.uint8) << j
+            out[f'f{i}'][start:stop] = acc.view(d) if d != bool else acc.astype(bool)
+
+    with ThreadPoolExecutor(workers) as pool:
+        pending = collections.deque()
+        for start in range(0, n, chunk_size):
+            if len(pending) >= 2 * workers:
+                pending.popleft().result()
+            pending.append(pool.submit(process, start, min(n, start + chunk_size)))
+        for f in pending:
+            f.result()
+    out.flush()
+    return n
+
+def stream_tests():
+    import os
+    import tempfile
+    from compiler import compile_op
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for (cls, dtype) in [(FheUint8, np.uint8), (FheInt8, np.int8)]:
+            n = 100_003
+            a = rng.integers(0, 256, n).astype(np.uint8).view(dtype)
+            b = rng.integers(0, 256, n).astype(np.uint8).view(dtype)
+            a_path = os.path.join(directory, 'a.bin')
+            b_path = os.path.join(directory, 'b.npy')
+            a.tofile(a_path)
+            np.save(b_path, b)
+
+            for op in ['Add', 'Mul', 'DivAndRem', 'Compare', 'Equals']:
+                out_path = os.path.join(directory, f'{cls.__name__}.{op}.npy')
+                assert stream_op(cls, op, a_path, b_path, out_path, chunk_size=64*97, workers=3) == n
+                out = np.load(out_path, mmap_mode='r')
+                want = compile_op(cls, op, backend='numpy')(a, b)
+                want = want if isinstance(want, tuple) else (want,)
+                assert len(out.dtype.names) == len(want)
+                for (name, w) in zip(out.dtype.names, want):
+                    assert np.array_equal(out[name], w), f'{cls.__name__}.{op}.{name}'
+                del out
+
+            # plain numpy arithmetic
+            out = np.load(os.path.join(directory, f'{cls.__name__}.Add.npy'))
+            assert np.array_equal(out['f0'], (a.astype(np.int64) + b).astype(np.uint8).view(dtype))
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    import time
+
+    stream_tests()
+    n = 1 << 22
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        rng.integers(0, 256, n).astype(np.uint8).tofile(os.path.join(directory, 'a.bin'))
+        rng.integers(0, 256, n).astype(np.uint8).tofile(os.path.join(directory, 'b.bin'))
+        for op in ['Add', 'Mul', 'DivAndRem']:
+            for workers in [1, 4]:
+                start = time.monotonic()
+                stream_op(FheUint8, op, os.path.join(directory, 'a.bin'), os.path.join(directory, 'b.bin'), os.path.join(directory, 'out.npy'), workers=workers)
+                seconds = time.monotonic() - start
+                print(f'FheUint8.{op}, {workers} workers: {n/seconds/1e6:.2f}M pairs/s')
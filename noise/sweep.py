@@ -0,0 +1,355 @@
+'''
+Resumable parameter sweeps backed by a SQLite work queue.
+
+Each candidate `Parameters` is expanded into one task per work unit (see `WORK_UNITS`). Any no. of worker processes, on one or
+several machines sharing a filesystem, claim tasks from the queue, evaluate them and write results back to the queue one task at
+a time. Hence, a crash only loses the tasks that were running.
+
+Claimed tasks hold a lease. Tasks whose lease expired (because the worker died) are claimed again by other workers, so re-running
+workers on the same database resumes the sweep. Tasks that are done are never evaluated again and enqueuing the same candidate
+twice is a no-op.
+
+Note that SQLite relies on POSIX file locks. When the database is on a network filesystem make sure locks are supported (for ex,
+NFSv4 with locking enabled).
+
+Usage:
+    queue = SweepQueue('sweep.db')
+    queue.enqueue([I_2_HB_FR, I_4, ...])
+    run_workers('sweep.db', processes=8)
+    queue.results()
+
+or from the shell, on every machine:
+    sage sweep.py worker sweep.db [processes] [--fast-security [--index security.index]]
+
+Without --fast-security workers run the full security estimation.
+'''
+from __future__ import annotations
+
+from tester import *
+from fractions import Fraction
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+import traceback
+
+WORK_UNITS = ('noise', 'cost', 'security')
+
+# Status of tasks in the queue
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+def encode_secret(secret: Secret):
+    '''
+    Returns JSON encodable description of `secret` from its tag. Fractions are encoded as strings.
+    '''
+    assert secret.tag is not None, "Only tagged secrets can be stored in the queue"
+    def encode(v):
+        if isinstance(v, tuple):
+            return [encode(i) for i in v]
+        if isinstance(v, Fraction):
+            return str(v)
+        return v
+    return encode(secret.tag)
+
+def decode_secret(tag, N: int) -> Secret:
+    match tag[0]:
+        case 'gaussian':
+            return Secret.ErrorDistribution(N=N)
+        case 'sparse_ternary':
+            return Secret.TernarySecret(N=N)
+        case 'binary':
+            return Secret.BinarySecret(N=N)
+        case 'uniform_ternary':
+            return Secret.UniformTernarySecret(N=N)
+        case 'hamming_weight':
+            return Secret.FixedHammingWeightSecret(N=N, h=tag[1]+tag[2])
+        case 'sum':
+            return decode_secret(tag[2], N).parties_sum(tag[1])
+    raise ValueError(f"Unknown secret {tag}")
+
+def encode_decomposer(decomposer: Decomposer):
+    if decomposer is None:
+        return None
+    return [decomposer.d_a, decomposer.d_b, decomposer.logQ, decomposer.logB]
+
+def decode_decomposer(v) -> Decomposer:
+    if v is None:
+        return None
+    return Decomposer(d_a=v[0], d_b=v[1], logQ=v[2], logB=v[3])
+
+def encode_parameters(params: Parameters):
+    '''
+    Returns JSON encodable dictionary of arguments to `Parameters` constructor
+    '''
+    return {
+        'logQ': params.logQ,
+        'logQ_ks': params.logQ_ks,
+        'logq': params.logq,
+        'logN': params.logN,
+        'n': params.n,
+        'w': params.w,
+        'lwe_sk': encode_secret(params.lwe_sk),
+        'rlwe_sk': encode_secret(params.rlwe_sk),
+        'rgsw_by_rgsw_decomposer': encode_decomposer(params.rgsw_by_rgsw_decomposer),
+        'rlwe_by_rgsw_decomposer': encode_decomposer(params.rlwe_by_rgsw_decomposer),
+        'auto_decomposer': encode_decomposer(params.auto_decomposer),
+        'lwe_decomposer': encode_decomposer(params.lwe_decomposer),
+        'non_interactive_uitos_decomposer': encode_decomposer(params.non_interactive_uitos_decomposer),
+        'fresh_noise_std': float(params.fresh_noise_std),
+        'variant': params.variant.name,
+        'parties': params.k,
+    }
+
+def decode_parameters(spec) -> Parameters:
+    return Parameters(
+        logQ=spec['logQ'],
+        logQ_ks=spec['logQ_ks'],
+        logq=spec['logq'],
+        logN=spec['logN'],
+        n=spec['n'],
+        w=spec['w'],
+        lwe_sk=decode_secret(spec['lwe_sk'], spec['n']),
+        rlwe_sk=decode_secret(spec['rlwe_sk'], 1<<spec['logN']),
+        rgsw_by_rgsw_decomposer=decode_decomposer(spec['rgsw_by_rgsw_decomposer']),
+        rlwe_by_rgsw_decomposer=decode_decomposer(spec['rlwe_by_rgsw_decomposer']),
+        auto_decomposer=decode_decomposer(spec['auto_decomposer']),
+        lwe_decomposer=decode_decomposer(spec['lwe_decomposer']),
+        non_interactive_uitos_decomposer=decode_decomposer(spec['non_interactive_uitos_decomposer']),
+        fresh_noise_std=spec['fresh_noise_std'],
+        variant=ParameterVariant[spec['variant']],
+        parties=spec['parties'],
+    )
+
+def evaluate(params: Parameters, unit: str, fast_security=False, index: SecurityIndex = None):
+    '''
+    Evaluates work unit `unit` of `params` and returns JSON encodable result
+
+    Security is estimated with all attacks unless `fast_security` is set. `index` is only used for screening, i.e. with
+    `fast_security`. Security results record the method of each instance in `lwe_method`/`rlwe_method`: 'full', 'fast' or
+    'interpolated' (from `index`).
+    '''
+    match unit:
+        case 'noise':
+            (fail_prob_nand, fail_prob_xor) = params.noise_multi_party(verbose=False)
+            return {
+                'fail_log2_nand': float(fail_prob_nand.log2()),
+                'fail_log2_xor': float(fail_prob_xor.log2()),
+            }
+        case 'cost':
+            cost = params.bootstrap_cost()
+            return {
+                'time_ms': float(cost['time_ms']),
+                'autos': float(cost['autos']),
+                'auto_key_bytes': float(params.auto_key_size()/8),
+            }
+        case 'security':
+            index = index if fast_security else None
+            (lwe_bits, rlwe_bits) = params.security(fast=fast_security, index=index, verbose=False)
+            def method(n, logq, sk):
+                if index is not None and index.lookup(n=n, logq=logq, secret=sk) is not None:
+                    return 'interpolated'
+                return 'fast' if fast_security else 'full'
+            return {
+                'lwe_bits': float(lwe_bits),
+                'rlwe_bits': float(rlwe_bits),
+                'fast': fast_security,
+                'lwe_method': method(params.n, params.logQ_ks, params.lwe_sk),
+                'rlwe_method': method(params.N, params.logQ, params.rlwe_sk),
+            }
+    raise ValueError(f"Unknown work unit {unit}")
+
+class SweepQueue():
+    def __init__(self, path, timeout=60):
+        self.path = path
+        # isolation_level=None: transactions are managed explicitly
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS candidates (
+                id INTEGER PRIMARY KEY,
+                key TEXT UNIQUE NOT NULL
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                candidate_id INTEGER NOT NULL REFERENCES candidates(id),
+                unit TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                PRIMARY KEY (candidate_id, unit)
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status)')
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, candidates: [Parameters], units=WORK_UNITS):
+        '''
+        Adds a task for each work unit of each candidate. Candidates and tasks that are already in the queue are skipped. Returns
+        ids of the candidates.
+        '''
+        ids = []
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            for params in candidates:
+                key = json.dumps(encode_parameters(params), sort_keys=True)
+                self.conn.execute('INSERT OR IGNORE INTO candidates (key) VALUES (?)', (key,))
+                (candidate_id,) = self.conn.execute('SELECT id FROM candidates WHERE key = ?', (key,)).fetchone()
+                for unit in units:
+                    self.conn.execute(
+                        'INSERT OR IGNORE INTO tasks (candidate_id, unit, status) VALUES (?, ?, ?)',
+                        (candidate_id, unit, PENDING)
+                    )
+                ids.append(candidate_id)
+            self.conn.execute('COMMIT')
+        except:
+            self.conn.execute('ROLLBACK')
+            raise
+        return ids
+
+    def claim(self, worker: str, lease_seconds=3600, max_attempts=3):
+        '''
+        Claims a pending task, or a running task whose lease has expired, for `worker` and returns (candidate_id, unit, spec).
+        Returns None if there's no task left to claim.
+
+        Failed tasks are retried until they have been attempted `max_attempts` times. Running tasks whose lease expired on
+        their last attempt are marked failed.
+        '''
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute('''
+                UPDATE tasks SET status = ?, error = ?, lease_until = NULL
+                WHERE status = ? AND lease_until < ? AND attempts >= ?
+            ''', (FAILED, 'lease expired', RUNNING, now, max_attempts))
+            row = self.conn.execute('''
+                SELECT t.candidate_id, t.unit, c.key FROM tasks t JOIN candidates c ON c.id = t.candidate_id
+                WHERE (t.status = ? OR (t.status = ? AND t.lease_until < ?) OR t.status = ?) AND t.attempts < ?
+                ORDER BY t.attempts, t.candidate_id LIMIT 1
+            ''', (PENDING, RUNNING, now, FAILED, max_attempts)).fetchone()
+            if row is None:
+                self.conn.execute('COMMIT')
+                return None
+            (candidate_id, unit, key) = row
+            self.conn.execute('''
+                UPDATE tasks SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1
+                WHERE candidate_id = ? AND unit = ?
+            ''', (RUNNING, worker, now + lease_seconds, candidate_id, unit))
+            self.conn.execute('COMMIT')
+        except:
+            self.conn.execute('ROLLBACK')
+            raise
+        return (candidate_id, unit, json.loads(key))
+
+    def complete(self, worker: str, candidate_id, unit, result) -> bool:
+        '''
+        Stores `result` of a task claimed by `worker`. Returns False, and stores nothing, if the task is no longer running on
+        `worker` (its lease expired and another worker claimed it, or it is already done).
+        '''
+        cursor = self.conn.execute(
+            'UPDATE tasks SET status = ?, result = ?, error = NULL, lease_until = NULL WHERE candidate_id = ? AND unit = ? AND worker = ? AND status = ?',
+            (DONE, json.dumps(result), candidate_id, unit, worker, RUNNING)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, worker: str, candidate_id, unit, error: str) -> bool:
+        '''
+        Same as `complete` but marks the task failed with `error`
+        '''
+        cursor = self.conn.execute(
+            'UPDATE tasks SET status = ?, error = ?, lease_until = NULL WHERE candidate_id = ? AND unit = ? AND worker = ? AND status = ?',
+            (FAILED, error, candidate_id, unit, worker, RUNNING)
+        )
+        return cursor.rowcount == 1
+
+    def progress(self):
+        '''
+        Returns dictionary from task status to no. of tasks
+        '''
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status').fetchall())
+
+    def results(self):
+        '''
+        Returns list of (spec, {unit: result}) for all candidates. Units that are not done are missing from the dictionary.
+        '''
+        out = {}
+        specs = {}
+        for (candidate_id, key) in self.conn.execute('SELECT id, key FROM candidates ORDER BY id'):
+            specs[candidate_id] = json.loads(key)
+            out[candidate_id] = {}
+        for (candidate_id, unit, result) in self.conn.execute('SELECT candidate_id, unit, result FROM tasks WHERE status = ?', (DONE,)):
+            out[candidate_id][unit] = json.loads(result)
+        return [(specs[i], out[i]) for i in specs]
+
+def run_worker(path, fast_security=False, index_path=None, lease_seconds=3600, max_attempts=3):
+    '''
+    Claims and evaluates tasks from the queue at `path` until no task is left. Returns no. of tasks evaluated.
+
+    Security is estimated with all attacks by default, as `Parameters.security`. Set `fast_security` (and optionally
+    `index_path`) to screen candidates.
+
+    `lease_seconds` must be larger than the time of the slowest work unit (full security estimation can take hours), otherwise
+    the task is evaluated again by another worker.
+    '''
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    index = None
+    if index_path is not None:
+        index = SecurityIndex.load(index_path)
+
+    queue = SweepQueue(path)
+    count = 0
+    try:
+        while True:
+            task = queue.claim(worker=worker, lease_seconds=lease_seconds, max_attempts=max_attempts)
+            if task is None:
+                break
+            (candidate_id, unit, spec) = task
+            try:
+                result = evaluate(decode_parameters(spec), unit, fast_security=fast_security, index=index)
+            except Exception:
+                queue.fail(worker, candidate_id, unit, traceback.format_exc())
+                continue
+            if queue.complete(worker, candidate_id, unit, result):
+                count += 1
+    finally:
+        queue.close()
+    return count
+
+def run_workers(path, processes=None, **kwargs):
+    '''
+    Runs `processes` (defaults to no. of cores) workers on the queue at `path` and waits for them to finish.
+    '''
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    workers = [multiprocessing.Process(target=run_worker, args=(path,), kwargs=kwargs) for _ in range(processes)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resumable parameter sweeps')
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help='evaluate tasks of a queue until none is left')
+    worker.add_argument('db')
+    worker.add_argument('processes', type=int, nargs='?', default=None)
+    worker.add_argument('--fast-security', action='store_true', help='screen security with the fast estimator (see Parameters.security)')
+    worker.add_argument('--index', default=None, help='path of a precomputed SecurityIndex used with --fast-security')
+    worker.add_argument('--lease-seconds', type=float, default=3600)
+    args = parser.parse_args()
+    if args.command == 'worker' and args.index is not None and not args.fast_security:
+        parser.error('--index requires --fast-security (interpolated security is only meant for screening)')
+
+    if args.command == 'worker':
+        run_workers(args.db, processes=args.processes, fast_security=args.fast_security, index_path=args.index, lease_seconds=args.lease_seconds)
+        print(SweepQueue(args.db).progress())
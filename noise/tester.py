@@ -3,13 +3,42 @@ from __future__ import annotations
 from estimator import *
 from sage.all import ceil, exp, log, RealField, sqrt, Integer, erf
 from enum import Enum
+from fractions import Fraction
+from functools import lru_cache
+import copy
+import json
+import numpy as np
 
 RR = RealField(256)
 
+# Cost model constants used by `Parameters.bootstrap_cost`. These are rough numbers for single threaded 64 bit NTT 
+# based arithmetic and should be calibrated against the target backend. 
+NS_PER_BUTTERFLY = RR(1.2)
+NS_PER_MUL_ADD = RR(0.8)
+
+# Constant of float64 FFT rounding error model in `fft_product_error_variance`. Measured ratio of observed to modelled 
+# variance with `fft_error_experiment` (numpy's FFT) is 0.81-0.93 for logN in [9, 11] and logB in [7, 17]. Rounded up to 1.
+FFT_ERROR_CONSTANT = RR(1)
+
 
 def format_rr(v: RR):
     return f"{v.numerical_approx().str()} (log2={v.log2().numerical_approx().str()})"
 
+def fft_product_error_variance(logN, logB, key_bits):
+    '''
+    Returns variance of rounding error in a single coefficient of product of decomposed polynomial (coefficients in [-B/2, B/2)) 
+    and key polynomial (uniform coefficients with `key_bits` bits) when the product is calculated using float64 FFT. 
+
+    Magnitude of coefficients of the product is ~ sqrt(N * B^2/12 * 2^{2 key_bits}/12) and FFT loses ~ sqrt(logN) * 2^{-53}
+    of relative precision. Hence,
+        var = c * N * logN * (B^2/12) * (2^{2 key_bits}/12) * 2^{-106}
+    where c = FFT_ERROR_CONSTANT. 
+    '''
+    N = RR(1<<logN)
+    B = RR(1<<logB)
+    K = RR(1<<key_bits)
+    return FFT_ERROR_CONSTANT * N * RR(logN) * ((B*B)/12) * ((K*K)/12) * RR(2)**(-106)
+
 class Decomposer():
     def __init__(self, d_a: Integer, d_b: Integer, logQ: Integer, logB: Integer):
         assert logQ  >= (d_a * logB)
@@ -39,19 +68,272 @@ class Decomposer():
     def single_decomposer(d: Integer, logQ: Integer, logB: Integer):
         return Decomposer(d_a=d, d_b=None, logB=logB, logQ=logQ)
 
+@lru_cache(maxsize=None)
+def pmf_second_moment(pmf) -> Fraction:
+    '''
+    Returns E[s^2] of coefficient distribution `pmf` (tuple of (value, probability)). 
+    '''
+    return sum((Fraction(v*v)*p for (v, p) in pmf), Fraction(0))
+
+@lru_cache(maxsize=None)
+def pmf_mean(pmf) -> Fraction:
+    return sum((Fraction(v)*p for (v, p) in pmf), Fraction(0))
+
+@lru_cache(maxsize=None)
+def pmf_sum_of_parties(pmf, k: int):
+    '''
+    Returns distribution of sum of `k` independent coefficients with distribution `pmf`. 
+    '''
+    out = {0: Fraction(1)}
+    for _ in range(k):
+        nxt = {}
+        for (v0, p0) in out.items():
+            for (v1, p1) in pmf:
+                nxt[v0+v1] = nxt.get(v0+v1, Fraction(0)) + (p0*p1)
+        out = nxt
+    return tuple(sorted(out.items()))
+
+def fraction_to_rr(v: Fraction):
+    return RR(v.numerator)/RR(v.denominator)
+
 class Secret():
-    def __init__(self, distr: ND, dimension: int):
+    '''
+    Secret with coefficients sampled from `distr` (an estimator noise distribution). 
+
+    `pmf` is distribution of a single coefficient as tuple of (value, probability) and is None for Gaussian secrets. `tag` is a 
+    hashable description of the distribution (without the dimension) and is used as key of caches. 
+    '''
+    def __init__(self, distr: ND, dimension: int, pmf=None, tag=None):
         self.distr = distr
         self.dimension = dimension
+        self.pmf = pmf
+        self.tag = tag
 
     def ErrorDistribution(N: int):
-        return Secret(distr=ND.DiscreteGaussian(3.19), dimension=N)
+        return Secret(distr=ND.DiscreteGaussian(3.19), dimension=N, tag=('gaussian', 3.19))
     
     def TernarySecret(N: int):
-        return Secret(distr=ND.SparseTernary(n=N, p=int(N/4)), dimension=N)
+        # p coefficients set to 1 and p coefficients set to -1
+        p = int(N/4)
+        pmf = ((-1, Fraction(p, N)), (0, Fraction(N-(2*p), N)), (1, Fraction(p, N)))
+        return Secret(distr=ND.SparseTernary(n=N, p=p), dimension=N, pmf=pmf, tag=('sparse_ternary', Fraction(1, 4)))
+
+    def BinarySecret(N: int):
+        pmf = ((0, Fraction(1, 2)), (1, Fraction(1, 2)))
+        return Secret(distr=ND.Uniform(0, 1, n=N), dimension=N, pmf=pmf, tag=('binary',))
+
+    def UniformTernarySecret(N: int):
+        pmf = ((-1, Fraction(1, 3)), (0, Fraction(1, 3)), (1, Fraction(1, 3)))
+        return Secret(distr=ND.Uniform(-1, 1, n=N), dimension=N, pmf=pmf, tag=('uniform_ternary',))
+
+    def FixedHammingWeightSecret(N: int, h: int):
+        '''
+        Ternary secret with exactly `h` non-zero coefficients, ceil(h/2) set to 1 and floor(h/2) set to -1. 
+        '''
+        assert 0 < h <= N
+        p = h - (h>>1)
+        m = h>>1
+        pmf = ((-1, Fraction(m, N)), (0, Fraction(N-h, N)), (1, Fraction(p, N)))
+        return Secret(distr=ND.SparseTernary(n=N, p=p, m=m), dimension=N, pmf=pmf, tag=('hamming_weight', p, m))
+
+    def parties_sum(self, k: int) -> Secret:
+        '''
+        Returns the secret that equals sum of `k` independent secrets sampled from this distribution, that is the ideal secret 
+        in k party setting. 
+
+        Distribution of coefficients of the sum is calculated exactly. Since the estimator has no distribution for sums, the 
+        returned `distr` is a discrete gaussian with same mean and variance (for k > 1). 
+        '''
+        if k == 1:
+            return self
+
+        if self.pmf is None:
+            stddev = RR(self.distr.stddev)*sqrt(RR(k))
+            return Secret(distr=ND.DiscreteGaussian(stddev, n=self.dimension), dimension=self.dimension, tag=('sum', k, self.tag))
+
+        pmf = pmf_sum_of_parties(self.pmf, k)
+        mean = fraction_to_rr(pmf_mean(pmf))
+        stddev = sqrt(fraction_to_rr(pmf_second_moment(pmf)) - (mean*mean))
+        return Secret(
+            distr=ND.DiscreteGaussian(stddev, mean=mean, n=self.dimension), 
+            dimension=self.dimension, 
+            pmf=pmf, 
+            tag=('sum', k, self.tag)
+        )
     
     def variance(self):
-        return RR(self.distr.stddev) * RR(self.distr.stddev)
+        '''
+        Returns E[s^2] of a single coefficient. This equals variance for zero mean distributions and is the quantity multiplied with 
+        error variance in noise analysis of inner products with the secret. 
+        '''
+        if self.pmf is None:
+            return RR(self.distr.stddev) * RR(self.distr.stddev)
+        return fraction_to_rr(pmf_second_moment(self.pmf))
+
+# Attacks run by `estimate_lwe` in fast mode. Names match the keys of results returned by `LWE.estimate`
+FAST_ATTACKS = ('usvp', 'dual_hybrid')
+
+def run_attack(lwe, attack):
+    match attack:
+        case 'usvp':
+            return LWE.primal_usvp(lwe, red_cost_model = RC.BDGL16)
+        case 'bdd':
+            return LWE.primal_bdd(lwe, red_cost_model = RC.BDGL16)
+        case 'bdd_hybrid':
+            return LWE.primal_hybrid(lwe, red_cost_model = RC.BDGL16)
+        case 'dual':
+            return LWE.dual(lwe, red_cost_model = RC.BDGL16)
+        case 'dual_hybrid':
+            return LWE.dual_hybrid(lwe, red_cost_model = RC.BDGL16)
+    raise ValueError(f"Unknown attack {attack}")
+
+# Results of `LWE.estimate` keyed by (n, logq, secret tag, attacks)
+ESTIMATE_CACHE = {}
+
+def estimate_lwe(n, logq, secret: Secret, attacks=None):
+    '''
+    Returns (LWE parameters, estimator results) for LWE instance with dimension `n`, modulus 2^logq, secret `secret` and gaussian 
+    error with std 3.19. 
+
+    If `attacks` is None all attacks are run with `LWE.estimate`. Otherwise only the attacks in `attacks` (for ex, FAST_ATTACKS) 
+    are run and results are returned as a dictionary from attack name to cost.
+
+    Results are cached per (n, logq, secret distribution), hence candidates of a sweep that share the LWE instance (and differ 
+    in decomposers, w, logQ, ...) only run the estimator once. A fast estimate is also served from a cached full estimate of the 
+    same instance. Secrets without a `tag` are not cached. 
+
+    Note that the cache can not be coarser than n: cost of every attack depends on n, hence a sweep over n runs the estimator 
+    once per n. Work on the secret distribution that does not depend on n (moments and sums over parties of the coefficient 
+    distribution, see `pmf_second_moment` and `pmf_sum_of_parties`) is cached separately by coefficient distribution. Use a 
+    `SecurityIndex` to screen sweeps over n without running the estimator. 
+    '''
+    lwe = LWE.Parameters(n=n, q=(1<<logq), Xs=secret.distr, Xe=ND.DiscreteGaussian(3.19), m=n)
+    if attacks is not None:
+        attacks = tuple(attacks)
+
+    key = (n, logq, secret.tag, attacks)
+    if secret.tag is not None and key in ESTIMATE_CACHE:
+        return (lwe, ESTIMATE_CACHE[key])
+    full = ESTIMATE_CACHE.get((n, logq, secret.tag, None))
+    if secret.tag is not None and attacks is not None and full is not None and all(a in full for a in attacks):
+        return (lwe, {a: full[a] for a in attacks})
+
+    if attacks is None:
+        res = LWE.estimate(lwe, red_cost_model = RC.BDGL16)
+    else:
+        res = {attack: run_attack(lwe, attack) for attack in attacks}
+    if secret.tag is not None:
+        ESTIMATE_CACHE[key] = res
+    return (lwe, res)
+
+def security_bits(res):
+    '''
+    Returns log2 of cost (rop) of the cheapest attack in estimator results `res`
+    '''
+    return min(RR(cost["rop"]).log2() for cost in res.values())
+
+class SecurityIndex():
+    '''
+    Precomputed security (bits) over a grid of (n, logq, secret distribution) used to screen parameter candidates without 
+    running the estimator. 
+
+    Security at a point inside the grid is bilinearly interpolated in (n, logq) over the 4 surrounding grid points of the same 
+    secret distribution. Secret distributions are identified by `Secret.tag`, which is independent of the dimension, hence the 
+    same index serves all `n`. Interpolated values are only meant for screening. Candidates that pass the screen (for ex, the 
+    pareto front of a sweep) must be checked with the full estimator. 
+    '''
+    def __init__(self, table=None):
+        # repr(tag) -> {(n, logq): bits}
+        self.table = {} if table is None else table
+
+    @staticmethod
+    def build(ns, logqs, secrets, attacks=FAST_ATTACKS, verbose=True):
+        '''
+        Builds the index for all n in `ns`, logq in `logqs` and secret constructors (N -> Secret) in `secrets`, for ex, 
+        [Secret.TernarySecret, Secret.ErrorDistribution]. Prints security of each grid point if `verbose`.
+        '''
+        index = SecurityIndex()
+        for secret in secrets:
+            for n in ns:
+                sk = secret(n)
+                for logq in logqs:
+                    (_, res) = estimate_lwe(n=n, logq=logq, secret=sk, attacks=attacks)
+                    index.table.setdefault(repr(sk.tag), {})[(n, logq)] = float(security_bits(res))
+                    if verbose:
+                        print(f"{sk.tag} n={n} logq={logq}: {index.table[repr(sk.tag)][(n, logq)]:.1f} bits")
+        return index
+
+    def save(self, path):
+        out = {tag: [[n, logq, bits] for ((n, logq), bits) in grid.items()] for (tag, grid) in self.table.items()}
+        with open(path, 'w') as f:
+            json.dump(out, f)
+
+    @staticmethod
+    def load(path) -> SecurityIndex:
+        with open(path) as f:
+            data = json.load(f)
+        return SecurityIndex(table={tag: {(n, logq): bits for (n, logq, bits) in grid} for (tag, grid) in data.items()})
+
+    def lookup(self, n, logq, secret: Secret):
+        '''
+        Returns interpolated security bits or None if (n, logq) is outside the grid or secret distribution is not indexed.
+        '''
+        grid = self.table.get(repr(secret.tag))
+        if grid is None:
+            return None
+
+        ns = sorted(set(k[0] for k in grid))
+        logqs = sorted(set(k[1] for k in grid))
+        if not (ns[0] <= n <= ns[-1] and logqs[0] <= logq <= logqs[-1]):
+            return None
+
+        n0 = max(v for v in ns if v <= n)
+        n1 = min(v for v in ns if v >= n)
+        q0 = max(v for v in logqs if v <= logq)
+        q1 = min(v for v in logqs if v >= logq)
+        corners = [(n0, q0), (n0, q1), (n1, q0), (n1, q1)]
+        if any(c not in grid for c in corners):
+            return None
+
+        tn = 0 if n1 == n0 else (n - n0)/(n1 - n0)
+        tq = 0 if q1 == q0 else (logq - q0)/(q1 - q0)
+        return (
+                grid[(n0, q0)]*(1-tn)*(1-tq)
+            +   grid[(n0, q1)]*(1-tn)*tq
+            +   grid[(n1, q0)]*tn*(1-tq)
+            +   grid[(n1, q1)]*tn*tq
+        )
+
+def pareto_front(points: [tuple]) -> [int]:
+    '''
+    Returns indices of points (tuples of objectives, all minimised) that are not dominated by any other point. A point dominates 
+    another if it is no worse in every objective and better in at-least one. 
+    '''
+    def dominates(a, b):
+        return all(x <= y for (x, y) in zip(a, b)) and any(x < y for (x, y) in zip(a, b))
+    return [i for (i, p) in enumerate(points) if not any(dominates(q, p) for q in points)]
+
+def screen_candidates(candidates, costs=None, index: SecurityIndex = None, verbose=False):
+    '''
+    Screens `candidates` (list of `Parameters`) with fast security (FAST_ATTACKS, interpolated from `index` if given), keeps the 
+    candidates on the pareto front of (-screened security bits, *costs(params)) and re-estimates them with all attacks of the 
+    estimator. 
+
+    `costs` maps a candidate to a tuple of objectives to minimise and defaults to (bootstrap time in ms, auto key size in bits). 
+    Returns list of (params, screened (LWE, RLWE) bits, exact (LWE, RLWE) bits) of the finalists. 
+    '''
+    if costs is None:
+        costs = lambda params: (float(params.bootstrap_cost()['time_ms']), float(params.auto_key_size()))
+
+    screened = [params.security(fast=True, index=index, verbose=False) for params in candidates]
+    points = [(-float(min(bits)),) + tuple(costs(params)) for (params, bits) in zip(candidates, screened)]
+    finalists = []
+    for i in pareto_front(points):
+        exact = candidates[i].security(verbose=verbose)
+        if verbose:
+            print(f"candidate {i}: screened {float(min(screened[i])):.1f} bits, exact {float(min(exact)):.1f} bits")
+        finalists.append((candidates[i], screened[i], exact))
+    return finalists
 
 class ParameterVariant(Enum):
     INTERACTIVE_MULTIPARTY = 1
@@ -137,7 +419,31 @@ class Parameters():
         self.rlwe_sk = rlwe_sk
 
 
-    def noise_multi_party(self):
+    def worst_case_autos(self):
+        '''
+        Returns no. of automorphisms required in blind rotation in the worst case for window size `w`.
+
+        Blind rotation walks over the q/2 powers \pm g^j and stops at each power that some LWE coefficient a_i maps to.
+        With auto keys for g^1, ..., g^w, a single automorphism moves the walk ahead by up to `w` powers. In the worst case
+        the n coefficients map to n distinct powers, spread out such that each of them requires a stop of its own:
+            - each stop costs one automorphism, hence n automorphisms, and
+            - the remaining (q/2 - n) powers are covered by jumps of `w`, hence (q/2 - n)/w automorphisms.
+        In total n + (q/2 - n)/w = ((w-1)/w)*n + (1/w)*(q/2).
+        '''
+        n = RR(self.n)
+        w = RR(self.w)
+        return (((w - 1)/w)*n)+((1/w)*(self.q>>1))
+
+    def noise_multi_party(self, verbose=True, fft=False, fft_key_bits=None):
+        '''
+        Prints noise of each sub-routine of bootstrapping and returns failure probability of (nand, xor) gates. 
+
+        Set `verbose=False` to suppress printing, for ex, when sweeping over parameters. 
+
+        By default polynomial arithmetic is assumed to be exact (NTT mod Q). Set `fft=True` to add rounding error of a float64 
+        FFT backend to RLWE x RGSW products and RLWE auto key switches. `fft_key_bits` is the no. of bits of key coefficients 
+        multiplied in FFT and defaults to logQ (set it lower if the backend splits keys into smaller limbs). 
+        '''
         n = RR(self.n)
         N = RR(self.N)
 
@@ -145,8 +451,8 @@ class Parameters():
         
         var = self.var # 3.19^2
         # rlwe/lwe sk variance for k parties
-        var_sk_rlwe = k*self.rlwe_sk.variance()
-        var_sk_lwe = k*self.lwe_sk.variance()
+        var_sk_rlwe = self.rlwe_sk.parties_sum(self.k).variance()
+        var_sk_lwe = self.lwe_sk.parties_sum(self.k).variance()
 
         # Fresh RGSW encryption
         var_fresh = RR(0)
@@ -170,7 +476,8 @@ class Parameters():
         d_b_rgsw_by_rgsw = self.rgsw_by_rgsw_decomposer.d_b
         var_rgswbyrgsw_a = (d_a_rgsw_by_rgsw * ((B_rgsw_rgsw*B_rgsw_rgsw)/RR(12)) * var_fresh * N)
         tmp = var_rgswbyrgsw_a
-        print(f"RGSW x RGSW part A ks noise std: {format_rr(sqrt(tmp))}")
+        if verbose:
+            print(f"RGSW x RGSW part A ks noise std: {format_rr(sqrt(tmp))}")
         # Approximation error induced by ignoring some least signifcant bits. 
         # The variance of ignored bits is (2^{ignored_bits})^2
         var_rgswbyrgsw_a += (
@@ -178,7 +485,8 @@ class Parameters():
             *   var_sk_rlwe
             *   N
         )
-        print(f"RGSW x RGSW part A inexact noise std: {format_rr(sqrt(var_rgswbyrgsw_a-tmp))}")
+        if verbose:
+            print(f"RGSW x RGSW part A inexact noise std: {format_rr(sqrt(var_rgswbyrgsw_a-tmp))}")
         var_rgswbyrgsw_b = (d_b_rgsw_by_rgsw * ((B_rgsw_rgsw*B_rgsw_rgsw)/RR(12) * var_fresh * N))
         var_rgswbyrgsw_b += (
                 RR(1 << (self.rgsw_by_rgsw_decomposer.ignore_bits_b*2))/12
@@ -192,18 +500,36 @@ class Parameters():
         B_rlwe_rgsw = RR(1<<self.rlwe_by_rgsw_decomposer.logB)
         var_rlwe_by_rgsw_a = (d_a_rlwe_by_rgsw * ((B_rlwe_rgsw*B_rlwe_rgsw)/12) * (var_brk) * N) 
         tmp = var_rlwe_by_rgsw_a
-        print(f"RLWE x RGSW Part A ks noise std: {format_rr(sqrt(tmp))}")
+        if verbose:
+            print(f"RLWE x RGSW Part A ks noise std: {format_rr(sqrt(tmp))}")
         var_rlwe_by_rgsw_a += (
                 RR(1 << (self.rlwe_by_rgsw_decomposer.ignore_bits_a*2))/12
             *   var_sk_rlwe
             *   N
         )
-        print(f"RLWE x RGSW Part A inexact noise std: {format_rr(sqrt(var_rlwe_by_rgsw_a-tmp))}")
+        if verbose:
+            print(f"RLWE x RGSW Part A inexact noise std: {format_rr(sqrt(var_rlwe_by_rgsw_a-tmp))}")
         var_rlwe_by_rgsw_b = (d_b_rlwe_by_rgsw * ((B_rgsw_rgsw*B_rgsw_rgsw)/12) * (var_brk) * N) 
         var_rlwe_by_rgsw_b += (
                 RR(1 << (self.rlwe_by_rgsw_decomposer.ignore_bits_b*2))/12
         )
         var_rlwe_by_rgsw = (var_rlwe_by_rgsw_a+var_rlwe_by_rgsw_b)
+
+        if fft_key_bits is None:
+            fft_key_bits = self.logQ
+
+        # FFT rounding error. Each of the 2 output polynomials is sum of (d_a+d_b) products of decomposed polynomial and key 
+        # polynomial. Error in part `a` is multiplied by the secret during decryption. 
+        var_fft_rlwe_by_rgsw = RR(0)
+        if fft:
+            var_fft_rlwe_by_rgsw = (
+                    (d_a_rlwe_by_rgsw + d_b_rlwe_by_rgsw)
+                *   fft_product_error_variance(logN=self.logN, logB=self.rlwe_by_rgsw_decomposer.logB, key_bits=fft_key_bits)
+                *   ((N*var_sk_rlwe)+1)
+            )
+            if verbose:
+                print(f"RLWE x RGSW FFT noise std: {format_rr(sqrt(var_fft_rlwe_by_rgsw))}")
+        var_rlwe_by_rgsw += var_fft_rlwe_by_rgsw
         # print("var_rlwe_by_rgsw_a: ", sqrt(var_rlwe_by_rgsw_a))
         # print("var_rlwe_by_rgsw_b: ", sqrt(var_rlwe_by_rgsw_b))
 
@@ -217,6 +543,15 @@ class Parameters():
             *   var_sk_rlwe
             *   N
         )
+        if fft:
+            var_fft_auto = (
+                    d_auto
+                *   fft_product_error_variance(logN=self.logN, logB=self.auto_decomposer.logB, key_bits=fft_key_bits)
+                *   ((N*var_sk_rlwe)+1)
+            )
+            if verbose:
+                print(f"Auto FFT noise std: {format_rr(sqrt(var_fft_auto))}")
+            var_auto += var_fft_auto
 
 
         # LWE ksk from rlwe secret to lwe secret
@@ -224,12 +559,14 @@ class Parameters():
         d_lwe  = self.lwe_decomposer.d_a
         var_ks = (((B_lwe*B_lwe)/12)*(k*var)*d_lwe*N) 
         tmp = var_ks
-        print(f"LWE ks noise std: {format_rr(sqrt(tmp))}")
+        if verbose:
+            print(f"LWE ks noise std: {format_rr(sqrt(tmp))}")
         var_ks += (N*(
                 RR(1 << (self.lwe_decomposer.ignore_bits_a*2))/12
             *   var_sk_rlwe
         ))
-        print(f"LWE inexact noise std: {format_rr(sqrt(var_ks-tmp))}")
+        if verbose:
+            print(f"LWE inexact noise std: {format_rr(sqrt(var_ks-tmp))}")
 
 
         # var ms1: Q -> Q_ks 
@@ -241,13 +578,12 @@ class Parameters():
         Q_ks_sq = RR(self.Q_ks*self.Q_ks)
         q_sq = RR(self.q*self.q)
         
-        w = RR(self.w)
-
         # var_acc = (n*var_rlwe_by_rgsw)+(self.q*var_auto)
-        worst_case_autos = (((w - 1)/w)*n)+((1/w)*(self.q>>1))
+        worst_case_autos = self.worst_case_autos()
         var_acc = (n*var_rlwe_by_rgsw)+(var_auto*(worst_case_autos))
     
-        print(format_rr(sqrt((q_sq*(2*var_acc))/Q_sq)), format_rr(sqrt((q_sq*(var_ms1+var_ks))/Q_ks_sq)), format_rr(sqrt(var_ms1)), format_rr(sqrt(var_ms2)))
+        if verbose:
+            print(format_rr(sqrt((q_sq*(2*var_acc))/Q_sq)), format_rr(sqrt((q_sq*(var_ms1+var_ks))/Q_ks_sq)), format_rr(sqrt(var_ms1)), format_rr(sqrt(var_ms2)))
 
         var_zeta_nand = ((q_sq*(2*var_acc))/Q_sq) + ((q_sq*(var_ms1+var_ks))/Q_ks_sq) + var_ms2
         var_zeta_xor = ((q_sq*(4*var_acc))/Q_sq) + ((q_sq*(var_ms1+var_ks))/Q_ks_sq) + var_ms2
@@ -258,46 +594,153 @@ class Parameters():
 
         
 
-        print(f'''
-            Worst case autos: {format_rr(worst_case_autos)} 
-            var_sk_rlwe: {format_rr(var_sk_rlwe)}   
-            var: {format_rr(self.var)}
-            std_ms1: {format_rr(sqrt(var_ms1))}
-            std_ms2: {format_rr(sqrt(var_ms2))}
-            std_ks: {format_rr(sqrt(var_ks))}
-            std_fresh: {format_rr(sqrt(var_fresh))}
-            std_brk: {format_rr(sqrt(var_brk))}
-            std_auto: {format_rr(sqrt(var_auto))}
-            std_rlwe_by_rgsw: {format_rr(sqrt(var_rlwe_by_rgsw))}
-            std_acc: {format_rr(sqrt(var_acc))}
-            std_zeta_nand: {format_rr(sqrt(var_zeta_nand))}
-            std_zeta_xor: {format_rr(sqrt(var_zeta_xor))}
-            failure probability nand: {format_rr(fail_prob_nand)}
-            failure probability xor : {format_rr(fail_prob_xor)}
-        ''')
-
-        # if fail_prob_nand != D(0):
-        print(f'Failure probability nand log 2: {format_rr(fail_prob_nand.log2())}')
-        # if fail_prob_nand != D(0):
-        print(f'Failure probability xor log 2: {format_rr(fail_prob_xor.log2())}')
-
-    def security(self):
-        # LWE
-        lwe = LWE.Parameters(n=self.n, q=(1<<self.logQ_ks), Xs=self.lwe_sk.distr, Xe=ND.DiscreteGaussian(3.19),m=self.n)
-        lwe_res = LWE.estimate(lwe, red_cost_model = RC.BDGL16)
-
-        print("LWE Security")
-        print(lwe)
-        print(lwe_res)
-        
-        print("")
+        if verbose:
+            print(f'''
+                Worst case autos: {format_rr(worst_case_autos)} 
+                var_sk_rlwe: {format_rr(var_sk_rlwe)}   
+                var: {format_rr(self.var)}
+                std_ms1: {format_rr(sqrt(var_ms1))}
+                std_ms2: {format_rr(sqrt(var_ms2))}
+                std_ks: {format_rr(sqrt(var_ks))}
+                std_fresh: {format_rr(sqrt(var_fresh))}
+                std_brk: {format_rr(sqrt(var_brk))}
+                std_auto: {format_rr(sqrt(var_auto))}
+                std_rlwe_by_rgsw: {format_rr(sqrt(var_rlwe_by_rgsw))}
+                std_acc: {format_rr(sqrt(var_acc))}
+                std_zeta_nand: {format_rr(sqrt(var_zeta_nand))}
+                std_zeta_xor: {format_rr(sqrt(var_zeta_xor))}
+                failure probability nand: {format_rr(fail_prob_nand)}
+                failure probability xor : {format_rr(fail_prob_xor)}
+            ''')
+
+        if verbose:
+            # if fail_prob_nand != D(0):
+            print(f'Failure probability nand log 2: {format_rr(fail_prob_nand.log2())}')
+            # if fail_prob_nand != D(0):
+            print(f'Failure probability xor log 2: {format_rr(fail_prob_xor.log2())}')
+
+        return (fail_prob_nand, fail_prob_xor)
+
+    def auto_key_size(self):
+        '''
+        Returns size in bits of the auto keys required by blind rotation with window size `w`.
+
+        Blind rotation requires auto keys for automorphisms g^1, ..., g^w and -g, that is w+1 keys. Each auto key is a RLWE' 
+        ciphertext consisting of d_auto RLWE ciphertexts (2 polynomials each) with logQ bit coefficients. 
+        '''
+        return (self.w + 1) * self.auto_decomposer.d_a * 2 * self.N * self.logQ
+
+    def bootstrap_cost(self):
+        '''
+        Returns estimated no. of operations and time (in ms) of a single bootstrap. 
+
+        The model counts NTTs of size N (each with N/2 * logN butterflies) and coefficient-wise mult-adds:
+            - RLWE x RGSW: d_a + d_b forward NTTs of decomposed RLWE ciphertext, 2 inverse NTTs and 2*(d_a+d_b)*N mult-adds
+            - Auto: d_auto forward NTTs, 2 inverse NTTs and 2*d_auto*N mult-adds (the permutation is free)
+            - LWE key switch: N*d_lwe*(n+1) mult-adds
+
+        Blind rotation requires `n` RLWE x RGSW products and `worst_case_autos` automorphisms. Modulus switching is ignored.
+        '''
+        N = RR(self.N)
+        d_rlwe_rgsw = self.rlwe_by_rgsw_decomposer.d_a + self.rlwe_by_rgsw_decomposer.d_b
+        d_auto = self.auto_decomposer.d_a
 
-        rlwe = LWE.Parameters(n=self.N, q=(1<<self.logQ), Xs=self.rlwe_sk.distr, Xe=ND.DiscreteGaussian(3.19),m=self.N)
-        rlwe_res = LWE.estimate(rlwe, red_cost_model = RC.BDGL16)
+        rlwe_by_rgsw_count = RR(self.n)
+        auto_count = self.worst_case_autos()
 
-        print("RLWE Security")
-        print(rlwe)
-        print(rlwe_res)
+        ntts = rlwe_by_rgsw_count*(d_rlwe_rgsw + 2) + auto_count*(d_auto + 2)
+        mul_adds = (
+                rlwe_by_rgsw_count*2*d_rlwe_rgsw*N 
+            +   auto_count*2*d_auto*N
+            +   N*self.lwe_decomposer.d_a*(self.n+1)
+        )
+        butterflies = ntts * (N/2) * self.logN
+        time_ms = ((butterflies*NS_PER_BUTTERFLY) + (mul_adds*NS_PER_MUL_ADD))/RR(1e6)
+
+        return {
+            'rlwe_by_rgsw': rlwe_by_rgsw_count,
+            'autos': auto_count,
+            'ntts': ntts,
+            'mul_adds': mul_adds,
+            'time_ms': time_ms,
+        }
+
+    def w_tradeoff(self, ws=range(2, 33), max_auto_key_bytes=None, max_fail_log2=None):
+        '''
+        Sweeps window size `w` and prints, for each `w`, worst case no. of automorphisms, size of auto keys, failure probability 
+        of xor gate and estimated bootstrap time. 
+
+        Larger `w` reduces no. of automorphisms in blind rotation (hence runtime and noise) but requires w+1 auto keys. Returns 
+        (best_w, rows) where best_w is the `w` with least bootstrap time s.t. auto keys fit in `max_auto_key_bytes` and xor 
+        failure probability (log2) is <= `max_fail_log2`. best_w is None if no `w` satisfies the constraints. 
+        '''
+        rows = []
+        best = None
+        for w in ws:
+            params = copy.copy(self)
+            params.w = w
+
+            (_, fail_prob_xor) = params.noise_multi_party(verbose=False)
+            row = {
+                'w': w,
+                'autos': params.worst_case_autos(),
+                'auto_key_bytes': RR(params.auto_key_size())/8,
+                'fail_log2_xor': fail_prob_xor.log2(),
+                'time_ms': params.bootstrap_cost()['time_ms'],
+            }
+            rows.append(row)
+
+            if max_auto_key_bytes is not None and row['auto_key_bytes'] > max_auto_key_bytes:
+                continue
+            if max_fail_log2 is not None and row['fail_log2_xor'] > max_fail_log2:
+                continue
+            if best is None or row['time_ms'] < best['time_ms']:
+                best = row
+
+        for row in rows:
+            print(
+                f"w={row['w']:<3} autos={row['autos'].numerical_approx(digits=6)} "
+                f"auto keys={(row['auto_key_bytes']/(1<<20)).numerical_approx(digits=4)}MiB "
+                f"fail xor log2={row['fail_log2_xor'].numerical_approx(digits=4)} "
+                f"time={row['time_ms'].numerical_approx(digits=4)}ms"
+            )
+
+        best_w = None
+        if best is not None:
+            best_w = best['w']
+        print(f"Runtime optimal w: {best_w}")
+
+        return (best_w, rows)
+
+    def security(self, fast=False, index: SecurityIndex = None, verbose=True):
+        '''
+        Returns security bits of (LWE, RLWE) instances. 
+
+        By default all attacks of the estimator are run. With `fast=True` only FAST_ATTACKS are run. If `index` is provided 
+        security is interpolated from the index (no estimator calls) and the estimator is only run for instances outside the 
+        index. Use `fast` and `index` to screen candidates and the default mode for finalists (see `screen_candidates`). 
+        '''
+        attacks = FAST_ATTACKS if fast else None
+        out = []
+        for (name, n, logq, sk) in [("LWE", self.n, self.logQ_ks, self.lwe_sk), ("RLWE", self.N, self.logQ, self.rlwe_sk)]:
+            bits = None
+            if index is not None:
+                bits = index.lookup(n=n, logq=logq, secret=sk)
+                if verbose and bits is not None:
+                    print(f"{name} Security (interpolated): {bits:.1f} bits")
+
+            if bits is None:
+                (lwe, res) = estimate_lwe(n=n, logq=logq, secret=sk, attacks=attacks)
+                bits = security_bits(res)
+                if verbose:
+                    print(f"{name} Security")
+                    print(lwe)
+                    print(res)
+                    print("")
+
+            out.append(bits)
+
+        return tuple(out)
 
 
 
@@ -632,6 +1075,13 @@ NI_8 = Parameters(
 # NI_4_LB_SR.noise_multi_party()
 # NI_8.noise_multi_party()
 
+# I_2_HB_FR.w_tradeoff(max_auto_key_bytes=(4<<20))
+
+# index = SecurityIndex.build(ns=range(440, 721, 40), logqs=range(14, 19), secrets=[Secret.ErrorDistribution, Secret.TernarySecret])
+# index.save('security_index.json')
+# I_2_HB_FR.security(index=SecurityIndex.load('security_index.json'))
+# screen_candidates([I_2_HB_FR, I_2_LB_SR, I_4, I_8], index=SecurityIndex.load('security_index.json'), verbose=True)
+
 # TRIAL.noise_multi_party()
 
 
@@ -809,6 +1259,95 @@ I_8_HB_FR = Parameters(
 )
 
 
+def fft_error_experiment(logN, logB, logQ=54, trials=4, seed=0):
+    '''
+    Measures rounding error of negacyclic polynomial multiplication using numpy's float64 FFT and returns (measured variance, 
+    modelled variance) where the latter is given by `fft_product_error_variance` with key_bits=logQ. 
+
+    Decomposed polynomial has coefficients uniform in [-B/2, B/2) and key polynomial has coefficients uniform in [0, Q). Exact 
+    product (mod Q) is calculated with integer convolutions over 18 bit limbs of the key polynomial such that no intermediate 
+    value exceeds 2^53. 
+    '''
+    N = 1<<logN
+    B = 1<<logB
+    Q = 1<<logQ
+    rng = np.random.default_rng(seed)
+
+    # X^N+1 is turned to cyclic convolution by twisting with 2N^th roots of unity 
+    psi = np.exp(1j*np.pi*np.arange(N)/N)
+    limb_bits = 18
+
+    errors = []
+    for _ in range(trials):
+        a = rng.integers(-(B>>1), B>>1, N, dtype=np.int64)
+        b = rng.integers(0, Q, N, dtype=np.int64)
+
+        # exact
+        exact = np.zeros(N, dtype=np.uint64)
+        for j in range(0, logQ, limb_bits):
+            b_limb = (b >> j) & ((1<<limb_bits)-1)
+            c = np.convolve(a, b_limb)
+            c[:N-1] -= c[N:]
+            exact += c[:N].astype(np.uint64) << np.uint64(j)
+        exact = (exact & np.uint64(Q-1)).astype(np.int64)
+
+        # fft with key coefficients in [-Q/2, Q/2)
+        b_centered = np.where(b >= (Q>>1), b.astype(np.float64)-Q, b.astype(np.float64))
+        c = np.fft.ifft(np.fft.fft(a*psi)*np.fft.fft(b_centered*psi))/psi
+        approx = np.mod(np.round(np.fmod(c.real, Q)), Q).astype(np.int64)
+
+        e = (approx - exact) % Q
+        e = np.where(e >= (Q>>1), e-Q, e)
+        errors.append(e.astype(np.float64))
+
+    measured = RR(np.var(np.concatenate(errors)))
+    modelled = fft_product_error_variance(logN=logN, logB=logB, key_bits=logQ)
+    print(f"logN={logN} logB={logB} logQ={logQ} measured std: {format_rr(sqrt(measured))} modelled std: {format_rr(sqrt(modelled))} ratio: {(measured/modelled).numerical_approx(digits=4)}")
+    return (measured, modelled)
+
+# for logN in [9, 10, 11]:
+#     for logB in [7, 12, 17]:
+#         fft_error_experiment(logN=logN, logB=logB)
+
+# Failure budgets (log2) of named sets for xor gate. Sets without an explicit budget in their name default to 2^{-40}. 
+DEFAULT_FAILURE_BUDGET_LOG2 = -40
+FAILURE_BUDGETS_LOG2 = {
+    'NI_2_FP_2_48': -48,
+    'NI_8_FP_2_40': -40,
+    'I_8_HB_FR': -42,
+}
+
+def fft_backend_report(fft_key_bits=None):
+    '''
+    Prints, for each named parameter set, failure probability (log2) of xor gate with exact NTT backend and with float64 FFT 
+    backend and whether the latter stays within the set's failure budget. 
+    '''
+    named_sets = {
+        'I_2_HB_FR': I_2_HB_FR,
+        'I_2_LB_SR': I_2_LB_SR,
+        'I_4': I_4,
+        'I_8': I_8,
+        'NI_2': NI_2,
+        'NI_4_HB_FR': NI_4_HB_FR,
+        'NI_4_LB_SR': NI_4_LB_SR,
+        'NI_8': NI_8,
+        'NI_2_FP_2_48': NI_2_FP_2_48,
+        'NI_8_FP_2_40': NI_8_FP_2_40,
+        'I_8_HB_FR': I_8_HB_FR,
+    }
+    for (name, params) in named_sets.items():
+        budget = FAILURE_BUDGETS_LOG2.get(name, DEFAULT_FAILURE_BUDGET_LOG2)
+        (_, ntt_xor) = params.noise_multi_party(verbose=False)
+        (_, fft_xor) = params.noise_multi_party(verbose=False, fft=True, fft_key_bits=fft_key_bits)
+        within_budget = fft_xor.log2() <= budget
+        print(
+            f"{name:<14} ntt xor log2={ntt_xor.log2().numerical_approx(digits=4)} "
+            f"fft xor log2={fft_xor.log2().numerical_approx(digits=4)} "
+            f"budget={budget} {'OK' if within_budget else 'EXCEEDS BUDGET'}"
+        )
+
+# fft_backend_report()
+
 
 # TWO_MP_PARAMS = Parameters(
 #     logQ=55, 